@@ -1,34 +1,60 @@
 
-from re import sub
-from database.db import init_db
-init_db()
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 import os
-import uvicorn
 
 
 # Load environment variables
 load_dotenv()
 
 
+from database import db
+from helpers.ResponseLog import ResponseLog
+from helpers.ProcessPool import shutdown_process_pool
+from helpers.Auth import shutdown_password_hasher
 
-from database.db import users_collection , models, new_users_collection, leaderboard_collection
-
+# Importing the routers is cheap: database connections, AI clients and SDKs
+# are created in the lifespan below or on first use (see providers/registry.py)
 from routes.v1 import user_routes, auth_routes, file_routes, api_routes, teach_routes  # v1 routes
 
-from routes.v2 import API_routes,play_with_friend,leaderboard,Doubt_solver,Auth_routes ,subjects # v2 route
+from routes.v2 import API_routes,play_with_friend,leaderboard,Doubt_solver,Auth_routes ,subjects, jobs, challenge_rooms # v2 route
 
 is_llm_enabled = os.getenv("LLM_ENABLED") == "True"
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 MONGO_URI= os.getenv("MONGO_URI")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Opens shared resources when a worker starts and releases them on shutdown."""
+    db.init_db()
+    db.init_async_db()
+    await Doubt_solver.on_startup()
+    await play_with_friend.on_startup()
+    await challenge_rooms.on_startup()
+    await jobs.on_startup()
+    await leaderboard.on_startup()
+    await Auth_routes.on_startup()
+    yield
+    await Auth_routes.on_shutdown()
+    await jobs.on_shutdown()
+    await challenge_rooms.on_shutdown()
+    await play_with_friend.on_shutdown()
+    await leaderboard.on_shutdown()
+    ResponseLog.close_all()
+    shutdown_process_pool()
+    shutdown_password_hasher()
+    db.close_async_db()
+    db.close_db()
+
+
 # Initialize FastAPI app
-app = FastAPI()
- 
+app = FastAPI(lifespan=lifespan)
+
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -39,9 +65,11 @@ app.include_router(user_routes.router)
 app.include_router(file_routes.router)
 app.include_router(API_routes.router)
 app.include_router(play_with_friend.router)
+app.include_router(challenge_rooms.router)
 app.include_router(leaderboard.router)
 app.include_router(teach_routes.router) # Himanshi
 app.include_router(Doubt_solver.router)
+app.include_router(jobs.router)
 
 app.include_router(auth_routes.router)
 app.include_router(Auth_routes.router)
@@ -51,7 +79,7 @@ app.include_router(subjects.router)
 
 origins = [
     "http://127.0.0.1:5173",
-    "http://127.0.0.1:5173/",    
+    "http://127.0.0.1:5173/",
     "http://localhost:5173/",
      "http://localhost:5173",
     "https://tutor.eduai.live",
@@ -75,6 +103,7 @@ async def home():
 
 
 
-# Start FastAPI Server (Run with: `uvicorn filename:app --reload`)
+# Start FastAPI Server (see serve.py for options; `python serve.py --reload` for development)
 if __name__ == "__main__":
-    uvicorn.run("app2:app", port=5000, reload=True)
+    import serve
+    serve.main()
@@ -22,13 +22,14 @@ models= None
 leaderboard_collection = None
 new_users_collection = None 
 progress_collection = None
+question_bank_collection = None
 Doubt_solver=None
 def init_db():
     
     """Initialize MongoDB connection and collections."""
     global client, db, users_collection, role_menu_collection, models, new_users_collection, leaderboard_collection ,Doubt_solver
     global  annya_db, new_annya_db, assessment_collection,create_goal,class_tenth_collection
-    global progress_collection
+    global progress_collection, question_bank_collection
 
     MONGO_URI = os.getenv("MONGO_URI")
     if not MONGO_URI:
@@ -54,6 +55,7 @@ def init_db():
     create_goal = new_annya_db["create_goal"]
     class_tenth_collection = new_annya_db["class_tenth"]
     progress_collection = new_annya_db["progress"]
+    question_bank_collection = new_annya_db["question_bank"]
     
     print("✅ MongoDB initialized successfully!")
 
@@ -63,3 +65,72 @@ def close_db():
     if client:
         client.close()
         print("🛑 MongoDB connection closed.")
+
+
+# Async (motor) client shared by the routes that need non-blocking access
+async_client = None
+doubt_db = None
+doubt_fs_bucket = None
+uploads_collection = None
+solutions_collection = None
+conversation_collection = None
+blobs_collection = None
+pdf_text_collection = None
+jobs_collection = None
+challenges_collection = None
+challenge_events_collection = None
+room_results_collection = None
+email_outbox_collection = None
+matchmaking_collection = None
+rooms_collection = None
+
+def init_async_db():
+    """Initialize the shared motor client. Must be called from the running event loop."""
+    global async_client, doubt_db, doubt_fs_bucket
+    global uploads_collection, solutions_collection, conversation_collection, blobs_collection
+    global pdf_text_collection, jobs_collection, challenges_collection, challenge_events_collection
+    global room_results_collection, email_outbox_collection, matchmaking_collection, rooms_collection
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+
+    MONGO_URI = os.getenv("MONGO_URI")
+    if not MONGO_URI:
+        raise Exception("MongoDB URI not found in environment variables.")
+
+    async_client = AsyncIOMotorClient(MONGO_URI)
+    doubt_db = async_client["doubt_solver"]
+    doubt_fs_bucket = AsyncIOMotorGridFSBucket(doubt_db)
+
+    uploads_collection = doubt_db.uploads
+    solutions_collection = doubt_db.solutions
+    conversation_collection = doubt_db.conversations
+    blobs_collection = doubt_db.blobs
+    pdf_text_collection = doubt_db.pdf_texts
+    # Background jobs for every router share one collection
+    jobs_collection = async_client["new_Annya"].jobs
+    challenges_collection = async_client["new_Annya"].challenges
+    challenge_events_collection = async_client["new_Annya"].challenge_events
+    room_results_collection = async_client["new_Annya"].room_results
+    email_outbox_collection = async_client["new_Annya"].email_outbox
+    matchmaking_collection = async_client["new_Annya"].matchmaking
+    rooms_collection = async_client["new_Annya"].rooms
+
+def close_async_db():
+    """Close the shared motor client."""
+    global async_client
+    if async_client:
+        async_client.close()
+        async_client = None
+        print("MongoDB async connection closed")
+
+def get_doubt_db():
+    """FastAPI dependency returning the shared doubt solver database."""
+    return doubt_db
+
+def get_fs_bucket():
+    """FastAPI dependency returning the shared GridFS bucket."""
+    return doubt_fs_bucket
+
+def get_blob_store():
+    """FastAPI dependency returning the content-addressed GridFS store."""
+    from helpers.BlobStore import GridFSBlobStore
+    return GridFSBlobStore(doubt_fs_bucket, blobs_collection)
@@ -0,0 +1,287 @@
+import asyncio
+import audioop
+import io
+import os
+import shutil
+import struct
+import wave
+from array import array
+from typing import AsyncIterator, List, Optional
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+SILENCE_RMS = int(os.getenv("VOICE_SILENCE_RMS", "500"))
+MIN_SILENCE_MS = int(os.getenv("VOICE_MIN_SILENCE_MS", "600"))
+MIN_SEGMENT_MS = int(os.getenv("VOICE_MIN_SEGMENT_MS", "300"))
+MAX_SEGMENT_SECONDS = float(os.getenv("VOICE_MAX_SEGMENT_SECONDS", "20"))
+TARGET_PEAK = 0.9 * 32767
+MAX_GAIN = 10.0
+
+WAV_TYPES = {"audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave"}
+
+
+class AudioSegment:
+    """A stretch of speech as mono 16-bit PCM."""
+
+    def __init__(self, index: int, pcm: bytes, sample_rate: int, start: float):
+        self.index = index
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.start = start
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / 2 / self.sample_rate
+
+    def to_wav(self) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.sample_rate)
+            out.writeframes(self.pcm)
+        return buffer.getvalue()
+
+
+def normalize_level(pcm: bytes) -> bytes:
+    """Scales 16-bit PCM so its peak sits at ``TARGET_PEAK`` (gain capped at ``MAX_GAIN``)."""
+    peak = audioop.max(pcm, 2) if pcm else 0
+    if not peak:
+        return pcm
+    gain = min(TARGET_PEAK / peak, MAX_GAIN)
+    if 0.95 < gain < 1.05:
+        return pcm
+    return audioop.mul(pcm, 2, gain)
+
+
+class WavDecoder:
+    """Incrementally decodes a WAV stream to mono 16-bit PCM at its own sample rate.
+
+    Handles integer PCM (8/16/24/32-bit) and 32-bit float. Chunks can split the
+    header or a sample frame anywhere.
+    """
+
+    def __init__(self):
+        self.sample_rate = None
+        self._header = b""
+        self._pending = b""
+        self._remaining = None
+        self._format = None
+
+    def _parse_header(self) -> bool:
+        data = self._header
+        if len(data) < 12:
+            return False
+        if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise ValueError("Not a WAV file")
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id, size = struct.unpack("<4sI", data[offset:offset + 8])
+            body = offset + 8
+            if chunk_id == b"data":
+                if self._format is None:
+                    raise ValueError("WAV data before format chunk")
+                # Streamed WAVs write 0 or 0xFFFFFFFF when the length is unknown
+                self._remaining = None if size in (0, 0xFFFFFFFF) else size
+                self._pending = data[body:]
+                self._header = b""
+                return True
+            if body + size > len(data):
+                return False
+            if chunk_id == b"fmt ":
+                audio_format, channels, rate, _, block_align, bits = struct.unpack("<HHIIHH", data[body:body + 16])
+                if audio_format == 0xFFFE and size >= 26:
+                    audio_format = struct.unpack("<H", data[body + 24:body + 26])[0]
+                if audio_format not in (1, 3):
+                    raise ValueError(f"Unsupported WAV encoding {audio_format}")
+                self._format = (audio_format, channels, bits, block_align)
+                self.sample_rate = rate
+            offset = body + size + (size & 1)
+        return False
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self._format is None or self._header:
+            self._header += chunk
+            if not self._parse_header():
+                return b""
+            new, self._pending = self._pending, b""
+        else:
+            new = chunk
+        # Only bytes not seen before count against the data chunk length
+        if self._remaining is not None:
+            new = new[:self._remaining]
+            self._remaining -= len(new)
+        data = self._pending + new
+
+        block_align = self._format[3]
+        usable = len(data) - len(data) % block_align
+        self._pending = data[usable:]
+        return self._to_mono16(data[:usable])
+
+    def _to_mono16(self, data: bytes) -> bytes:
+        audio_format, channels, bits, _ = self._format
+        if audio_format == 3:
+            # audioop has no float support, so only this path converts per sample
+            pcm = array("h", (int(max(-1.0, min(1.0, s)) * 32767) for s in array("f", data))).tobytes()
+        elif bits == 8:
+            pcm = audioop.lin2lin(audioop.bias(data, 1, -128), 1, 2)
+        elif bits in (16, 24, 32):
+            pcm = data if bits == 16 else audioop.lin2lin(data, bits // 8, 2)
+        else:
+            raise ValueError(f"Unsupported WAV sample width {bits}")
+
+        if channels == 2:
+            return audioop.tomono(pcm, 2, 0.5, 0.5)
+        if channels > 2:
+            samples = array("h", pcm)
+            mono = audioop.mul(samples[0::channels].tobytes(), 2, 1 / channels)
+            for channel in range(1, channels):
+                mono = audioop.add(mono, audioop.mul(samples[channel::channels].tobytes(), 2, 1 / channels), 2)
+            return mono
+        return pcm
+
+    async def decode(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        async for chunk in chunks:
+            pcm = await asyncio.to_thread(self.feed, chunk)
+            if pcm:
+                yield pcm
+
+
+class FfmpegDecoder:
+    """Decodes any container ffmpeg understands to mono 16-bit PCM at ``SAMPLE_RATE``.
+
+    Input is piped to ffmpeg as it arrives and PCM is read back concurrently.
+    """
+
+    sample_rate = SAMPLE_RATE
+
+    async def decode(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        )
+
+        async def pump():
+            try:
+                async for chunk in chunks:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            finally:
+                process.stdin.close()
+
+        writer = asyncio.create_task(pump())
+        try:
+            while True:
+                pcm = await process.stdout.read(64 * 1024)
+                if not pcm:
+                    break
+                yield pcm
+            await writer
+        finally:
+            writer.cancel()
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+
+def open_decoder(content_type: str, filename: str = None):
+    """Picks a streaming decoder for the upload, or ``None`` if it cannot be decoded here."""
+    if content_type in WAV_TYPES or (filename or "").lower().endswith(".wav"):
+        return WavDecoder()
+    if shutil.which("ffmpeg"):
+        return FfmpegDecoder()
+    return None
+
+
+class SilenceSegmenter:
+    """Cuts a PCM stream into speech segments at pauses.
+
+    Audio is scanned in ``FRAME_MS`` frames; a segment closes after
+    ``MIN_SILENCE_MS`` of frames below ``SILENCE_RMS`` or once it reaches
+    ``MAX_SEGMENT_SECONDS``. Segments shorter than ``MIN_SEGMENT_MS`` are
+    dropped as noise, and each emitted segment is level-normalized.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * FRAME_MS // 1000 * 2
+        self.max_bytes = int(sample_rate * MAX_SEGMENT_SECONDS) * 2
+        self.silence_frames = max(1, MIN_SILENCE_MS // FRAME_MS)
+        self._buffer = b""
+        self._current = bytearray()
+        self._silent_run = 0
+        self._frames_seen = 0
+        self._start_frame = 0
+        self._count = 0
+
+    def _rms(self, frame: bytes) -> float:
+        return audioop.rms(frame, 2)
+
+    def _close(self) -> Optional[AudioSegment]:
+        voiced = bytes(self._current[:len(self._current) - self._silent_run * self.frame_bytes])
+        self._current = bytearray()
+        self._silent_run = 0
+        if len(voiced) < self.sample_rate * MIN_SEGMENT_MS // 1000 * 2:
+            return None
+        segment = AudioSegment(self._count, normalize_level(voiced), self.sample_rate,
+                               self._start_frame * FRAME_MS / 1000)
+        self._count += 1
+        return segment
+
+    def feed(self, pcm: bytes) -> List[AudioSegment]:
+        segments = []
+        data = self._buffer + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._buffer = data[usable:]
+        for offset in range(0, usable, self.frame_bytes):
+            frame = data[offset:offset + self.frame_bytes]
+            loud = self._rms(frame) >= SILENCE_RMS
+            if not self._current:
+                if loud:
+                    self._start_frame = self._frames_seen
+                    self._current += frame
+            else:
+                self._current += frame
+                self._silent_run = 0 if loud else self._silent_run + 1
+                if self._silent_run >= self.silence_frames or len(self._current) >= self.max_bytes:
+                    segment = self._close()
+                    if segment:
+                        segments.append(segment)
+            self._frames_seen += 1
+        return segments
+
+    def flush(self) -> List[AudioSegment]:
+        self._current += self._buffer
+        self._buffer = b""
+        segment = self._close() if self._current else None
+        return [segment] if segment else []
+
+
+async def transcribe_stream(chunks: AsyncIterator[bytes], content_type: str, filename: str, stt) -> str:
+    """Decodes, segments and transcribes an audio stream while it is still arriving.
+
+    Each segment is handed to the ``stt`` backend as soon as the pause after it
+    is seen, so transcription overlaps the rest of the upload. Audio that cannot
+    be decoded here is sent to the backend whole. Returns the joined transcript.
+    """
+    decoder = open_decoder(content_type, filename)
+    if decoder is None:
+        data = b"".join([chunk async for chunk in chunks])
+        return (await stt.transcribe(data, content_type)).strip()
+
+    tasks = []
+    segmenter = None
+    try:
+        async for pcm in decoder.decode(chunks):
+            if segmenter is None:
+                segmenter = SilenceSegmenter(decoder.sample_rate)
+            for segment in await asyncio.to_thread(segmenter.feed, pcm):
+                tasks.append(asyncio.create_task(stt.transcribe(segment.to_wav(), "audio/wav")))
+        for segment in segmenter.flush() if segmenter else []:
+            tasks.append(asyncio.create_task(stt.transcribe(segment.to_wav(), "audio/wav")))
+        texts = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return " ".join(text.strip() for text in texts if text.strip())
@@ -0,0 +1,147 @@
+"""Session tokens, password hashing and the shared FastAPI auth dependencies.
+
+Every route that needs the caller's identity depends on ``get_current_user``
+(401 when missing or invalid), ``get_token_payload`` (``None`` instead of 401)
+or ``get_current_user_profile``. Verified tokens are kept in a bounded LRU
+keyed by the token's hash, so a repeat request costs a dict lookup instead of
+an HMAC check and a JSON parse.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import jwt as pyjwt
+from dotenv import load_dotenv
+from fastapi import Depends, HTTPException, Request
+
+from database import db
+from helpers.PasswordHasher import PasswordHasher
+
+load_dotenv()
+
+ALGORITHM = "HS256"
+SECRET_KEY = os.getenv("SECRET_KEY")
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class TokenCache:
+    """LRU of verified token payloads keyed by the SHA-256 of the token.
+
+    Entries are dropped once the token's ``exp`` has passed, so a cached token
+    never outlives what ``jwt.decode`` would accept.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.entries: "OrderedDict[bytes, Tuple[Dict, Optional[float]]]" = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, key: bytes, now: float) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        payload, expires = entry
+        if expires is not None and expires <= now:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return payload
+
+    def put(self, key: bytes, payload: Dict):
+        exp = payload.get("exp")
+        self.entries[key] = (payload, float(exp) if exp is not None else None)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+
+@lru_cache(maxsize=None)
+def get_password_hasher() -> PasswordHasher:
+    """bcrypt with cost BCRYPT_ROUNDS on PASSWORD_HASH_WORKERS threads; tune both
+    with scripts/bench_login.py."""
+    return PasswordHasher(rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS)
+
+
+def shutdown_password_hasher():
+    if get_password_hasher.cache_info().currsize:
+        get_password_hasher().shutdown()
+        get_password_hasher.cache_clear()
+
+
+def issue_token(claims: Dict, lifetime: timedelta = timedelta(days=1)) -> str:
+    """Signs a session token carrying ``claims`` that expires after ``lifetime``."""
+    if not SECRET_KEY:
+        raise RuntimeError("SECRET_KEY environment variable not set")
+    return pyjwt.encode({**claims, "exp": datetime.utcnow() + lifetime}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def verify_token(token: str) -> Dict:
+    """Returns the token's payload. Raises ``HTTPException(401)`` if it is expired or invalid."""
+    key = token_cache.key(token)
+    now = time.time()
+    payload = token_cache.get(key, now)
+    if payload is not None:
+        return payload
+    try:
+        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except pyjwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except pyjwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    token_cache.put(key, payload)
+    return payload
+
+
+def read_token(request: Request) -> Optional[str]:
+    """Bearer token from ``Authorization``, or the v1 ``Session-Token`` header."""
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        return auth_header[len("Bearer "):]
+    return request.headers.get("Session-Token")
+
+
+async def get_current_user(request: Request) -> Dict:
+    """Token payload of the caller; 401 without a valid token."""
+    token = read_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return verify_token(token)
+
+
+async def get_token_payload(request: Request) -> Optional[Dict]:
+    """Token payload of the caller, or ``None`` for anonymous or invalid tokens."""
+    token = read_token(request)
+    if not token:
+        return None
+    try:
+        return verify_token(token)
+    except HTTPException:
+        return None
+
+
+async def get_current_user_profile(request: Request, user: Dict = Depends(get_current_user)) -> Dict:
+    """The caller's user document (without secrets), loaded at most once per request."""
+    profile = getattr(request.state, "user_profile", None)
+    if profile is None:
+        profile = await asyncio.to_thread(
+            db.new_users_collection.find_one,
+            {"userId": user.get("userId")},
+            {"_id": 0, "password": 0, "otp": 0, "otp_expiry": 0},
+        )
+        if not profile:
+            raise HTTPException(status_code=401, detail="User not found")
+        request.state.user_profile = profile
+    return profile
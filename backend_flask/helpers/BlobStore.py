@@ -0,0 +1,77 @@
+import os
+import tempfile
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+
+class GridFSBlobStore:
+    """Content-addressed GridFS storage.
+
+    Each distinct file is written to GridFS once. ``index`` maps the SHA-256 of
+    the content (``_id``) to its GridFS id and a reference count, so uploading a
+    file that already exists only bumps the count.
+    """
+
+    def __init__(self, bucket, index):
+        self.bucket = bucket
+        self.index = index
+
+    async def put(self, upload) -> dict:
+        """Stores a ``SpooledUpload`` unless identical content exists.
+
+        GridFS reads the spool in its own chunk size, so the file is never held
+        in memory. Returns ``{"grid_fs_id", "sha256", "deduplicated"}``.
+        """
+        sha256 = upload.sha256
+        existing = await self.index.find_one_and_update(
+            {"_id": sha256}, {"$inc": {"refs": 1}, "$set": {"lastUsedAt": datetime.now()}}
+        )
+        if existing:
+            return {"grid_fs_id": existing["grid_fs_id"], "sha256": sha256, "deduplicated": True}
+
+        file_id = await self.bucket.upload_from_stream(
+            upload.filename, upload.open(),
+            metadata={"content_type": upload.content_type, "sha256": sha256}
+        )
+        try:
+            await self.index.insert_one({
+                "_id": sha256,
+                "grid_fs_id": str(file_id),
+                "size": upload.size,
+                "content_type": upload.content_type,
+                "refs": 1,
+                "createdAt": datetime.now(),
+                "lastUsedAt": datetime.now(),
+            })
+        except DuplicateKeyError:
+            # Another request stored the same content concurrently; keep theirs
+            await self.bucket.delete(file_id)
+            return await self.put(upload)
+        return {"grid_fs_id": str(file_id), "sha256": sha256, "deduplicated": False}
+
+
+async def store_local(upload_dir: str, upload) -> tuple:
+    """Streams a ``SpooledUpload`` to ``upload_dir`` under its content hash.
+
+    Returns ``(filename, deduplicated)``; an existing file with the same hash is
+    reused instead of being written again.
+    """
+    extension = os.path.splitext(upload.filename or "")[1]
+    filename = f"{upload.sha256}{extension.lower()}"
+    file_path = os.path.join(upload_dir, filename)
+    if os.path.exists(file_path):
+        return filename, True
+
+    os.makedirs(upload_dir, exist_ok=True)
+    # Write to a temp file and rename so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+    os.close(fd)
+    try:
+        await upload.copy_to(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename, False
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import traceback
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Set
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+
+def offer(queue: asyncio.Queue, message: str):
+    """Puts ``message`` on a subscriber queue, dropping the oldest one if it is full."""
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class ChallengeBroker:
+    """Per-challenge pub/sub for Play-with-Friend events.
+
+    ``publish`` serializes an event once; every subscriber of the channel gets
+    the same JSON string, ready to send on its WebSocket. Subscribers read from
+    a bounded queue that drops the oldest message when a client falls behind.
+    This implementation only reaches subscribers in the current process.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.channels: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, event: Dict):
+        self.deliver(channel, json.dumps(event, default=str))
+
+    def deliver(self, channel: str, message: str):
+        for queue in self.channels.get(channel, ()):
+            offer(queue, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[asyncio.Queue]:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.channels.setdefault(channel, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self.channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self.channels[channel]
+
+
+class MongoChallengeBroker(ChallengeBroker):
+    """Cross-worker broker on a capped Mongo collection.
+
+    ``publish`` inserts the serialized event; every worker tails the collection
+    and hands new messages to its local subscribers, so both players receive
+    events no matter which worker their socket or request landed on.
+
+    The tail follows the collection's natural (insertion) order and remembers
+    the ``_id`` of the last event it delivered. Events carry no timestamp to
+    resume from: publishers' clocks differ, so comparing them could skip or
+    repeat events.
+    """
+
+    def __init__(self, collection, queue_size: int = 100, capped_bytes: int = 16 * 1024 * 1024):
+        super().__init__(queue_size)
+        self.collection = collection
+        self.capped_bytes = capped_bytes
+        self.tailer = None
+
+    async def start(self):
+        try:
+            await self.collection.database.create_collection(
+                self.collection.name, capped=True, size=self.capped_bytes
+            )
+        except CollectionInvalid:
+            pass  # already exists
+        # Start after the newest event; older ones were for sockets that are gone
+        newest = await self.collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+        self.tailer = asyncio.create_task(self._tail(newest["_id"] if newest else None))
+
+    async def stop(self):
+        if self.tailer:
+            self.tailer.cancel()
+            await asyncio.gather(self.tailer, return_exceptions=True)
+            self.tailer = None
+
+    async def publish(self, channel, event):
+        await self.collection.insert_one({
+            "channel": channel,
+            "message": json.dumps(event, default=str),
+        })
+
+    async def _tail(self, last_id):
+        while True:
+            try:
+                # A reopened cursor starts at the oldest event, so skip up to the last
+                # one delivered; if that was already overwritten, everything left is newer
+                skipping = last_id is not None and await self.collection.find_one({"_id": last_id}, {"_id": 1}) is not None
+                cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc["_id"] != last_id
+                            continue
+                        last_id = doc["_id"]
+                        self.deliver(doc["channel"], doc["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            # Tailable cursors die on an empty collection or a network error; reopen
+            await asyncio.sleep(1)
@@ -0,0 +1,353 @@
+import bisect
+import copy
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+from pymongo import ReturnDocument
+
+# Statuses in which players can still join or answer
+OPEN_STATUSES = ("lobby", "in_progress")
+
+
+class RankedScores:
+    """Scores kept in rank order.
+
+    ``order`` is a sorted list of ``(-score, total_time, user_id)``, so the
+    leaderboard is a slice and a score update is one removal plus one insort.
+    Ties on score go to whoever answered faster overall.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[int, float, str]] = {}
+        self.order: List[Tuple[int, float, str]] = []
+
+    def add(self, user_id: str):
+        if user_id not in self.entries:
+            entry = (0, 0.0, user_id)
+            self.entries[user_id] = entry
+            bisect.insort(self.order, entry)
+
+    def record(self, user_id: str, points: int, elapsed: float):
+        old = self.entries[user_id]
+        del self.order[bisect.bisect_left(self.order, old)]
+        entry = (old[0] - points, old[1] + elapsed, user_id)
+        self.entries[user_id] = entry
+        bisect.insort(self.order, entry)
+
+    def players(self) -> List[Dict]:
+        return [{"userId": user_id, "score": -neg_score, "time": total_time}
+                for neg_score, total_time, user_id in self.order]
+
+
+def leaderboard(room: Dict, limit: Optional[int] = None) -> List[Dict]:
+    """Players by score, ties going to the faster total answer time."""
+    ordered = sorted(room["players"], key=lambda p: (-p["score"], p["time"], p["userId"]))
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [{"rank": i + 1, "userId": p["userId"], "score": p["score"], "time": round(p["time"], 2)}
+            for i, p in enumerate(ordered)]
+
+
+def standing(room: Dict, user_id: str) -> Tuple[int, int]:
+    """``(score, rank)`` of a player, counting who is ahead rather than sorting."""
+    me = next(p for p in room["players"] if p["userId"] == user_id)
+    key = (-me["score"], me["time"], user_id)
+    ahead = sum(1 for p in room["players"] if (-p["score"], p["time"], p["userId"]) < key)
+    return me["score"], ahead + 1
+
+
+def is_member(room: Dict, user_id: str) -> bool:
+    return user_id == room["host"] or any(p["userId"] == user_id for p in room["players"])
+
+
+def public_question(room: Dict) -> Dict:
+    question = room["questions"][room["current"]]
+    return {"index": room["current"], "total": len(room["questions"]), "question": question.get("question"),
+            "options": question.get("options", []), "seconds": room["questionSeconds"]}
+
+
+def everyone_answered(room: Dict) -> bool:
+    return len(room["answered"]) >= len(room["players"])
+
+
+class RoomStore:
+    """Storage for live quiz rooms.
+
+    A room is a dict keyed by ``_id`` with a join ``code``, the ``host`` (who
+    runs the room but does not play), ``players`` as ``{userId, score, time}``
+    entries, the drawn ``questions``, the ``current`` question index, when it
+    opened (``openedAt``, wall clock seconds, since workers compare it) and
+    who ``answered`` it. Each change is one atomic operation with its
+    precondition checked in the same step, so requests for a room can land on
+    any worker. Rooms disappear at ``expiresAt``: a lobby that never starts
+    after ``lobby_seconds``, a finished room after ``retention_seconds``.
+
+    A running room carries a ``deadline`` by which its timeline must open the
+    next question (or finish); ``fail_stalled`` fails rooms whose timeline
+    stopped, e.g. because the worker running it died.
+    """
+
+    def __init__(self, lobby_seconds: float = 3600, retention_seconds: float = 600, stall_seconds: float = 30):
+        self.lobby_seconds = lobby_seconds
+        self.retention_seconds = retention_seconds
+        self.stall_seconds = stall_seconds
+
+    async def create(self, room: Dict) -> None:
+        raise NotImplementedError
+
+    async def get(self, room_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def find_by_code(self, code: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def join(self, code: str, user_id: str, max_players: int) -> Optional[Dict]:
+        """Adds a player unless the room is full or finished. Returns the room, or
+        ``None`` if the player could not be added."""
+        raise NotImplementedError
+
+    async def start(self, room_id: str, host: str, questions: List[Dict], expires: datetime) -> Optional[Dict]:
+        """Stores the questions and starts the room if ``host`` runs it and it is
+        still in the lobby. Returns the started room, ``None`` otherwise."""
+        raise NotImplementedError
+
+    async def open_question(self, room_id: str, index: int, hold_seconds: float) -> Optional[Dict]:
+        """Opens question ``index``; the timeline promises to move on within
+        ``hold_seconds`` (plus ``stall_seconds`` of slack)."""
+        raise NotImplementedError
+
+    async def answer(self, room_id: str, user_id: str, index: int, answer) -> Optional[Tuple[bool, Dict]]:
+        """Scores a player's first answer to the open question. Returns whether it
+        was correct and the room afterwards, or ``None`` if the answer does not
+        count (late, repeated, not playing)."""
+        raise NotImplementedError
+
+    async def finish(self, room_id: str, status: str = "finished") -> Optional[Dict]:
+        """Ends a running room as ``finished`` or ``failed``. Returns the room only
+        to the caller that ended it."""
+        raise NotImplementedError
+
+    async def fail_stalled(self) -> List[Dict]:
+        """Fails running rooms past their ``deadline`` and returns them."""
+        raise NotImplementedError
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+
+class InMemoryRoomStore(RoomStore):
+    """Single-process store. Operations never await midway, so each one is
+    atomic on the event loop. Players are ranked as they score, and expired
+    rooms are dropped whenever a room is created."""
+
+    def __init__(self, lobby_seconds: float = 3600, retention_seconds: float = 600, stall_seconds: float = 30):
+        super().__init__(lobby_seconds, retention_seconds, stall_seconds)
+        self.rooms: Dict[str, Dict] = {}
+        self.scores: Dict[str, RankedScores] = {}
+        self.by_code: Dict[str, str] = {}
+
+    def evict_expired(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        for room_id in [rid for rid, room in self.rooms.items() if room["expiresAt"] <= now]:
+            room = self.rooms.pop(room_id)
+            self.scores.pop(room_id, None)
+            self.by_code.pop(room["code"], None)
+
+    def _live(self, room_id: Optional[str]) -> Optional[Dict]:
+        room = self.rooms.get(room_id) if room_id is not None else None
+        if room is None or room["expiresAt"] <= datetime.utcnow():
+            return None
+        return room
+
+    def _snapshot(self, room: Dict) -> Dict:
+        snapshot = copy.deepcopy(room)
+        snapshot["players"] = self.scores[room["_id"]].players()
+        return snapshot
+
+    async def create(self, room):
+        self.evict_expired()
+        room = {**copy.deepcopy(room), "expiresAt": datetime.utcnow() + timedelta(seconds=self.lobby_seconds)}
+        self.rooms[room["_id"]] = room
+        self.scores[room["_id"]] = RankedScores()
+        self.by_code[room["code"]] = room["_id"]
+
+    async def get(self, room_id):
+        room = self._live(room_id)
+        return self._snapshot(room) if room else None
+
+    async def find_by_code(self, code):
+        return await self.get(self.by_code.get(code))
+
+    async def join(self, code, user_id, max_players):
+        room = self._live(self.by_code.get(code))
+        if not room or room["status"] not in OPEN_STATUSES or user_id == room["host"]:
+            return None
+        scores = self.scores[room["_id"]]
+        if user_id not in scores.entries:
+            if len(scores.entries) >= max_players:
+                return None
+            scores.add(user_id)
+        return self._snapshot(room)
+
+    async def start(self, room_id, host, questions, expires):
+        room = self._live(room_id)
+        if not room or room["host"] != host or room["status"] != "lobby":
+            return None
+        room.update(questions=questions, status="in_progress", expiresAt=expires,
+                    deadline=time.time() + self.stall_seconds)
+        return self._snapshot(room)
+
+    async def open_question(self, room_id, index, hold_seconds):
+        room = self._live(room_id)
+        if not room or room["status"] != "in_progress":
+            return None
+        now = time.time()
+        room.update(current=index, openedAt=now, answered=[], deadline=now + hold_seconds + self.stall_seconds)
+        return self._snapshot(room)
+
+    async def answer(self, room_id, user_id, index, answer):
+        room = self._live(room_id)
+        if (not room or room["status"] != "in_progress" or index != room["current"]
+                or user_id in room["answered"] or user_id not in self.scores[room_id].entries):
+            return None
+        room["answered"].append(user_id)
+        correct = str(answer) == str(room["questions"][index].get("answer"))
+        self.scores[room_id].record(user_id, 1 if correct else 0, time.time() - room["openedAt"])
+        return correct, self._snapshot(room)
+
+    async def finish(self, room_id, status="finished"):
+        room = self._live(room_id)
+        if not room or room["status"] != "in_progress":
+            return None
+        room.update(status=status, expiresAt=datetime.utcnow() + timedelta(seconds=self.retention_seconds))
+        return self._snapshot(room)
+
+    async def fail_stalled(self):
+        now = time.time()
+        stalled = [room_id for room_id, room in self.rooms.items()
+                   if room["status"] == "in_progress" and room["deadline"] < now]
+        return [room for room in [await self.finish(room_id, "failed") for room_id in stalled] if room]
+
+
+class MongoRoomStore(RoomStore):
+    """Store shared by all workers. Joins, starts and answers are
+    ``find_one_and_update`` calls with the precondition in the filter, a
+    unique index serves code lookups and a TTL index on ``expiresAt`` lets
+    Mongo delete expired rooms.
+
+    Scores live in the room document rather than in the memory of the worker
+    running the timeline, so an answer counts whichever worker receives it
+    and survives a restart. The price is one write per answer; to keep it to
+    one round trip, each worker caches the open question's answer key and
+    ``openedAt`` per room and reads the room again only when the question
+    changes. The write still checks both, so a stale cache only rejects.
+    """
+
+    def __init__(self, collection, lobby_seconds: float = 3600, retention_seconds: float = 600,
+                 stall_seconds: float = 30):
+        super().__init__(lobby_seconds, retention_seconds, stall_seconds)
+        self.collection = collection
+        # room_id -> (index, openedAt, correct answer)
+        self.open_questions: LRUCache = LRUCache(maxsize=1024)
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("code", unique=True)
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+        await self.collection.create_index([("status", 1), ("deadline", 1)])
+
+    async def create(self, room):
+        await self.collection.insert_one(
+            {**room, "expiresAt": datetime.utcnow() + timedelta(seconds=self.lobby_seconds)}
+        )
+
+    async def get(self, room_id):
+        return await self.collection.find_one({"_id": room_id})
+
+    async def find_by_code(self, code):
+        return await self.collection.find_one({"code": code})
+
+    async def join(self, code, user_id, max_players):
+        joined = await self.collection.find_one_and_update(
+            {"code": code, "status": {"$in": OPEN_STATUSES}, "host": {"$ne": user_id},
+             "players.userId": {"$ne": user_id},
+             # Fewer than max_players entries
+             f"players.{max_players - 1}": {"$exists": False}},
+            {"$push": {"players": {"userId": user_id, "score": 0, "time": 0.0}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if joined:
+            return joined
+        # Already a player (e.g. a retried request) still counts as joined
+        return await self.collection.find_one({"code": code, "status": {"$in": OPEN_STATUSES}, "players.userId": user_id})
+
+    async def start(self, room_id, host, questions, expires):
+        return await self.collection.find_one_and_update(
+            {"_id": room_id, "host": host, "status": "lobby"},
+            {"$set": {"questions": questions, "status": "in_progress", "expiresAt": expires,
+                      "deadline": time.time() + self.stall_seconds}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def open_question(self, room_id, index, hold_seconds):
+        now = time.time()
+        return await self.collection.find_one_and_update(
+            {"_id": room_id, "status": "in_progress"},
+            {"$set": {"current": index, "openedAt": now, "answered": [],
+                      "deadline": now + hold_seconds + self.stall_seconds}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _open_question(self, room_id: str, index: int) -> Optional[Tuple[int, float, str]]:
+        cached = self.open_questions.get(room_id)
+        if cached and cached[0] == index:
+            return cached
+        room = await self.collection.find_one({"_id": room_id, "status": "in_progress", "current": index},
+                                              {"questions": {"$slice": [index, 1]}, "openedAt": 1})
+        if not room or not room["questions"]:
+            return None
+        cached = (index, room["openedAt"], str(room["questions"][0].get("answer")))
+        self.open_questions[room_id] = cached
+        return cached
+
+    async def answer(self, room_id, user_id, index, answer):
+        if not isinstance(index, int):
+            return None
+        opened = await self._open_question(room_id, index)
+        if not opened:
+            return None
+        _, opened_at, key = opened
+        correct = str(answer) == key
+        updated = await self.collection.find_one_and_update(
+            # Still the same question, and this player's first answer to it
+            {"_id": room_id, "status": "in_progress", "current": index, "openedAt": opened_at,
+             "answered": {"$ne": user_id}, "players.userId": user_id},
+            {"$push": {"answered": user_id},
+             "$inc": {"players.$[player].score": 1 if correct else 0,
+                      "players.$[player].time": time.time() - opened_at}},
+            # The query matches two arrays, so the positional $ would be ambiguous
+            array_filters=[{"player.userId": user_id}],
+            projection={"players": 1, "answered": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return (correct, updated) if updated else None
+
+    async def finish(self, room_id, status="finished"):
+        self.open_questions.pop(room_id, None)
+        return await self.collection.find_one_and_update(
+            {"_id": room_id, "status": "in_progress"},
+            {"$set": {"status": status,
+                      "expiresAt": datetime.utcnow() + timedelta(seconds=self.retention_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def fail_stalled(self):
+        failed = []
+        async for room in self.collection.find({"status": "in_progress", "deadline": {"$lt": time.time()}},
+                                               {"_id": 1}):
+            # finish() only matches a room still in progress, so one worker wins each
+            room = await self.finish(room["_id"], "failed")
+            if room:
+                failed.append(room)
+        return failed
@@ -0,0 +1,319 @@
+import copy
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from pymongo import ReturnDocument
+
+# How long a challenge is kept after its last change, by status
+STATUS_TTLS = {
+    "waiting": timedelta(seconds=int(os.getenv("CHALLENGE_TTL_WAITING", str(24 * 3600)))),
+    "ready": timedelta(seconds=int(os.getenv("CHALLENGE_TTL_READY", str(24 * 3600)))),
+    "in_progress": timedelta(seconds=int(os.getenv("CHALLENGE_TTL_IN_PROGRESS", str(6 * 3600)))),
+}
+DEFAULT_TTL = timedelta(seconds=int(os.getenv("CHALLENGE_TTL_DEFAULT", str(24 * 3600))))
+
+
+def expires_at(status: str, now: datetime = None) -> datetime:
+    return (now or datetime.utcnow()) + STATUS_TTLS.get(status, DEFAULT_TTL)
+
+
+def field_key(user_id: str) -> str:
+    """Escapes a user id for use as a Mongo field name. ``.`` and ``$`` would
+    otherwise split the path or be rejected, so they are percent-encoded."""
+    return user_id.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def unescape_key(key: str) -> str:
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def is_correct(questions: List[Dict], question_index: str, answer) -> bool:
+    index = int(question_index)
+    return 0 <= index < len(questions) and str(answer) == str(questions[index].get("answer"))
+
+
+def valid_answers(questions: List[Dict], answers: Dict) -> Dict[str, str]:
+    """Keeps answers to questions that exist, keyed by the string index."""
+    return {str(index): answer for index, answer in answers.items() if 0 <= int(index) < len(questions)}
+
+
+def score_changes(questions: List[Dict], previous: Dict[str, str], answers: Dict[str, str]) -> Tuple[int, int]:
+    """Returns ``(score delta, newly answered count)`` for applying ``answers`` on top
+    of a player's ``previous`` answers. Only the submitted questions are looked at."""
+    delta = 0
+    added = 0
+    for index, answer in answers.items():
+        if index in previous:
+            delta -= is_correct(questions, index, previous[index])
+        else:
+            added += 1
+        delta += is_correct(questions, index, answer)
+    return delta, added
+
+
+class ChallengeStore:
+    """Storage for Play-with-Friend challenges.
+
+    Challenges are dicts keyed by ``_id``. Answers are stored as
+    ``answers[userId][str(questionIndex)]``, alongside running totals
+    ``scores[userId]`` and ``answered[userId]`` that are updated with each
+    submission, so results never rescan the answers. Every state transition (join,
+    start, answer, finish) is a single atomic operation, so concurrent requests on
+    different workers cannot overwrite each other. Each change pushes
+    ``expiresAt`` out by the TTL of the new status; expired challenges are
+    evicted.
+    """
+
+    async def create(self, challenge: Dict) -> None:
+        raise NotImplementedError
+
+    async def get(self, challenge_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def find_by_invite(self, invite_code: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def join(self, invite_code: str, user_id: str) -> Optional[Dict]:
+        """Sets the opponent if the challenge has none yet. Returns the updated
+        challenge, or ``None`` if the code is unknown or the seat is taken."""
+        raise NotImplementedError
+
+    async def start(self, challenge_id: str, questions: List[Dict]) -> Optional[Dict]:
+        """Stores the questions and marks the challenge in progress, unless it
+        already has questions. Returns the challenge as it is afterwards."""
+        raise NotImplementedError
+
+    async def record_answers(self, challenge_id: str, user_id: str, answers: Dict[int, str]) -> Optional[Dict]:
+        """Records ``{questionIndex: answer}`` for a participant and updates their
+        running score. Answers to questions that do not exist (yet) are ignored. Returns the updated challenge, or ``None`` if it does not
+        exist or the user is not playing."""
+        raise NotImplementedError
+
+    async def finish(self, challenge_id: str) -> Optional[Dict]:
+        """Marks an in-progress challenge finished. Returns the challenge only to the
+        one caller that made the transition, ``None`` to everyone else."""
+        raise NotImplementedError
+
+    async def list_for_user(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+
+class InMemoryChallengeStore(ChallengeStore):
+    """Single-process store for development and tests. Operations never await
+    midway, so each one is atomic on the event loop.
+
+    Keeps secondary indexes (invite code -> id, user -> ids) so joins and user
+    listings never scan every challenge, and evicts expired challenges from an
+    expiry heap so memory stays bounded by the live ones.
+    """
+
+    def __init__(self):
+        self.challenges: Dict[str, Dict] = {}
+        self.by_invite: Dict[str, str] = {}
+        self.by_user: Dict[str, Set[str]] = {}
+        # (expiresAt, id); entries superseded by a later expiry are skipped when popped
+        self.expiry: List[Tuple[datetime, str]] = []
+
+    def _touch(self, challenge: Dict):
+        challenge["expiresAt"] = expires_at(challenge["status"])
+        heapq.heappush(self.expiry, (challenge["expiresAt"], challenge["_id"]))
+        if len(self.expiry) > 2 * len(self.challenges) + 64:
+            # Busy challenges leave superseded entries behind; rebuild from the live ones
+            self.expiry = [(ch["expiresAt"], cid) for cid, ch in self.challenges.items()]
+            heapq.heapify(self.expiry)
+
+    def _index_user(self, user_id: Optional[str], challenge_id: str):
+        if user_id is not None:
+            self.by_user.setdefault(user_id, set()).add(challenge_id)
+
+    def _remove(self, challenge_id: str):
+        challenge = self.challenges.pop(challenge_id)
+        if challenge["inviteCode"] is not None:
+            self.by_invite.pop(challenge["inviteCode"], None)
+        for user_id in (challenge["creator"], challenge["opponent"]):
+            ids = self.by_user.get(user_id)
+            if ids is not None:
+                ids.discard(challenge_id)
+                if not ids:
+                    del self.by_user[user_id]
+
+    def evict_expired(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        while self.expiry and self.expiry[0][0] <= now:
+            expiry, challenge_id = heapq.heappop(self.expiry)
+            challenge = self.challenges.get(challenge_id)
+            if challenge is not None and challenge["expiresAt"] == expiry:
+                self._remove(challenge_id)
+
+    def _live(self, challenge_id: Optional[str]) -> Optional[Dict]:
+        self.evict_expired()
+        return self.challenges.get(challenge_id) if challenge_id is not None else None
+
+    async def create(self, challenge):
+        self.evict_expired()
+        challenge = copy.deepcopy(challenge)
+        self.challenges[challenge["_id"]] = challenge
+        if challenge["inviteCode"] is not None:
+            self.by_invite[challenge["inviteCode"]] = challenge["_id"]
+        self._index_user(challenge["creator"], challenge["_id"])
+        self._index_user(challenge["opponent"], challenge["_id"])
+        self._touch(challenge)
+
+    async def get(self, challenge_id):
+        challenge = self._live(challenge_id)
+        return copy.deepcopy(challenge) if challenge else None
+
+    async def find_by_invite(self, invite_code):
+        challenge = self._live(self.by_invite.get(invite_code))
+        return copy.deepcopy(challenge) if challenge else None
+
+    async def join(self, invite_code, user_id):
+        challenge = self._live(self.by_invite.get(invite_code))
+        if not challenge or challenge["opponent"] is not None:
+            return None
+        challenge["opponent"] = user_id
+        challenge["status"] = "ready"
+        self._index_user(user_id, challenge["_id"])
+        self._touch(challenge)
+        return copy.deepcopy(challenge)
+
+    async def start(self, challenge_id, questions):
+        challenge = self._live(challenge_id)
+        if not challenge:
+            return None
+        if not challenge["questions"] and challenge["opponent"]:
+            challenge["questions"] = questions
+            challenge["status"] = "in_progress"
+            self._touch(challenge)
+        return copy.deepcopy(challenge)
+
+    async def record_answers(self, challenge_id, user_id, answers):
+        challenge = self._live(challenge_id)
+        if not challenge or user_id not in (challenge["creator"], challenge["opponent"]):
+            return None
+        if challenge["status"] == "finished":
+            return copy.deepcopy(challenge)
+        answers = valid_answers(challenge["questions"], answers)
+        previous = challenge["answers"].setdefault(user_id, {})
+        delta, added = score_changes(challenge["questions"], previous, answers)
+        previous.update(answers)
+        scores = challenge.setdefault("scores", {})
+        scores[user_id] = scores.get(user_id, 0) + delta
+        answered = challenge.setdefault("answered", {})
+        answered[user_id] = answered.get(user_id, 0) + added
+        self._touch(challenge)
+        return copy.deepcopy(challenge)
+
+    async def finish(self, challenge_id):
+        challenge = self._live(challenge_id)
+        if not challenge or challenge["status"] != "in_progress":
+            return None
+        challenge["status"] = "finished"
+        self._touch(challenge)
+        return copy.deepcopy(challenge)
+
+    async def list_for_user(self, user_id):
+        self.evict_expired()
+        return [copy.deepcopy(self.challenges[cid]) for cid in self.by_user.get(user_id, ())]
+
+
+class MongoChallengeStore(ChallengeStore):
+    """Store shared by all workers. Transitions use ``find_one_and_update`` with
+    the precondition in the filter, so only one concurrent request can win.
+    Invite code and player lookups are served by indexes, and a TTL index on
+    ``expiresAt`` lets Mongo delete expired challenges. User ids are stored as
+    field names through ``field_key`` and come back unescaped."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("inviteCode", unique=True, sparse=True)
+        await self.collection.create_index("creator")
+        await self.collection.create_index("opponent")
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    async def create(self, challenge):
+        challenge = {**challenge, "expiresAt": expires_at(challenge["status"])}
+        if challenge.get("inviteCode") is None:
+            # Keep the sparse unique index usable for direct challenges
+            challenge.pop("inviteCode", None)
+        await self.collection.insert_one(challenge)
+
+    @staticmethod
+    def _normalize(challenge):
+        if challenge is not None:
+            challenge.setdefault("inviteCode", None)
+            for field in ("answers", "scores", "answered"):
+                if field in challenge:
+                    challenge[field] = {unescape_key(key): value for key, value in challenge[field].items()}
+        return challenge
+
+    async def get(self, challenge_id):
+        return self._normalize(await self.collection.find_one({"_id": challenge_id}))
+
+    async def find_by_invite(self, invite_code):
+        return self._normalize(await self.collection.find_one({"inviteCode": invite_code}))
+
+    async def join(self, invite_code, user_id):
+        return self._normalize(await self.collection.find_one_and_update(
+            {"inviteCode": invite_code, "opponent": None},
+            {"$set": {"opponent": user_id, "status": "ready", "expiresAt": expires_at("ready")}},
+            return_document=ReturnDocument.AFTER,
+        ))
+
+    async def start(self, challenge_id, questions):
+        started = await self.collection.find_one_and_update(
+            {"_id": challenge_id, "questions": {"$size": 0}, "opponent": {"$ne": None}},
+            {"$set": {"questions": questions, "status": "in_progress", "expiresAt": expires_at("in_progress")}},
+            return_document=ReturnDocument.AFTER,
+        )
+        # Another request may have started it first; return what is stored
+        return self._normalize(started) if started else await self.get(challenge_id)
+
+    async def record_answers(self, challenge_id, user_id, answers, max_attempts: int = 5):
+        """Optimistic update: the write only applies if the player's previous
+        answers and the challenge status are still what the score delta was
+        computed from; otherwise it re-reads and retries."""
+        for _ in range(max_attempts):
+            challenge = await self.get(challenge_id)
+            if not challenge or user_id not in (challenge["creator"], challenge["opponent"]):
+                return None
+            answers = valid_answers(challenge["questions"], answers)
+            if not answers or challenge["status"] == "finished":
+                return challenge
+            previous = challenge["answers"].get(user_id, {})
+            delta, added = score_changes(challenge["questions"], previous, answers)
+
+            key = field_key(user_id)
+            unchanged = {
+                f"answers.{key}.{index}": previous[index] if index in previous else {"$exists": False}
+                for index in answers
+            }
+            updated = await self.collection.find_one_and_update(
+                {"_id": challenge_id, "status": challenge["status"], **unchanged},
+                {"$set": {**{f"answers.{key}.{index}": answer for index, answer in answers.items()},
+                          # Answers only arrive while a game is being played
+                          "expiresAt": expires_at("in_progress")},
+                 "$inc": {f"scores.{key}": delta, f"answered.{key}": added}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if updated:
+                return self._normalize(updated)
+        raise RuntimeError(f"Could not record answers for challenge {challenge_id}: concurrent updates")
+
+    async def finish(self, challenge_id):
+        return self._normalize(await self.collection.find_one_and_update(
+            {"_id": challenge_id, "status": "in_progress"},
+            {"$set": {"status": "finished", "expiresAt": expires_at("finished")}},
+            return_document=ReturnDocument.AFTER,
+        ))
+
+    async def list_for_user(self, user_id):
+        cursor = self.collection.find({"$or": [{"creator": user_id}, {"opponent": user_id}]})
+        return [self._normalize(ch) async for ch in cursor]
@@ -0,0 +1,98 @@
+import asyncio
+import re
+from typing import AsyncIterator, Awaitable, Callable, Dict, List
+
+# A new question starts at a line like "1.", "2)", "Q3.", "Q 4:", "Question 5 -"
+QUESTION_START = re.compile(
+    r"^\s*(?:Q(?:uestion)?\.?\s*)?(\d{1,3})\s*[.):\]-](?:\s+|(?=[A-Za-z(]))", re.IGNORECASE | re.MULTILINE
+)
+MAX_CHUNK_CHARS = 6000
+SCANNED_PAGES_PER_CHUNK = 2
+
+
+def split_into_questions(pages: List[str], max_chars: int = MAX_CHUNK_CHARS) -> List[Dict]:
+    """Splits extracted PDF pages into question-sized chunks.
+
+    Pages are cut at question numbering. Unnumbered text at the top of a page
+    continues the previous question, and a preamble before the first question
+    (headers, instructions) is kept with it. Documents without any numbering
+    are split per page. Chunks longer than ``max_chars`` are cut further.
+    Returns ``[{"label", "page", "text"}]`` in document order.
+    """
+    if not any(QUESTION_START.search(page) for page in pages):
+        chunks = [{"label": f"Page {n}", "page": n, "text": page.strip()}
+                  for n, page in enumerate(pages, start=1) if page.strip()]
+    else:
+        chunks = []
+        preamble = ""
+        for page_num, page_text in enumerate(pages, start=1):
+            bounds = [m.start() for m in QUESTION_START.finditer(page_text)]
+            bounds = sorted({0, *bounds, len(page_text)})
+            for begin, end in zip(bounds, bounds[1:]):
+                text = page_text[begin:end].strip()
+                if not text:
+                    continue
+                match = QUESTION_START.match(text)
+                if match:
+                    chunks.append({"label": f"Question {match.group(1)}", "page": page_num,
+                                   "text": (preamble + text).strip()})
+                    preamble = ""
+                elif chunks:
+                    chunks[-1]["text"] += "\n" + text
+                else:
+                    preamble += text + "\n"
+
+    split = []
+    for chunk in chunks:
+        for offset in range(0, len(chunk["text"]), max_chars):
+            split.append({**chunk, "text": chunk["text"][offset:offset + max_chars]})
+    return split
+
+
+def scanned_page_chunks(images: Dict[int, bytes], pages_per_chunk: int = SCANNED_PAGES_PER_CHUNK) -> List[Dict]:
+    """Groups rendered scanned pages (``{page_index: png}``) into multimodal chunks.
+
+    Only consecutive pages are batched together so a question spanning a page
+    break stays in one call. Returns ``[{"label", "page", "images"}]``.
+    """
+    chunks: List[Dict] = []
+    for index in sorted(images):
+        page_num = index + 1
+        last = chunks[-1] if chunks else None
+        if last and len(last["images"]) < pages_per_chunk and last["last_page"] == page_num - 1:
+            last["images"].append(images[index])
+            last["last_page"] = page_num
+            last["label"] = f"Pages {last['page']}-{page_num}"
+        else:
+            chunks.append({"label": f"Page {page_num}", "page": page_num,
+                           "last_page": page_num, "images": [images[index]]})
+    return chunks
+
+
+async def solve_chunks(chunks: List[Dict], solve: Callable[[Dict], Awaitable[str]]) -> AsyncIterator[Dict]:
+    """Solves all chunks concurrently and yields each result as soon as it finishes.
+
+    ``solve`` is responsible for respecting the provider's concurrency limit.
+    Yields ``{"index", "label", "solution"}``; ``index`` is the chunk's position so
+    callers can merge the results back into document order.
+    """
+    async def run(index: int, chunk: Dict) -> Dict:
+        try:
+            solution = await solve(chunk)
+        except Exception as e:
+            solution = f"Sorry, I couldn't solve {chunk['label']}. Error: {str(e)}"
+        return {"index": index, "label": chunk["label"], "solution": solution}
+
+    tasks = [asyncio.create_task(run(i, chunk)) for i, chunk in enumerate(chunks)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def merge_solutions(results: List[Dict]) -> str:
+    """Joins partial solutions back into document order."""
+    ordered = sorted(results, key=lambda r: r["index"])
+    return "\n\n".join(f"{r['label']}\n{r['solution']}" for r in ordered)
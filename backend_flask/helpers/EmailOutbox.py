@@ -0,0 +1,222 @@
+import asyncio
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Callable, Dict, Optional
+
+import aiosmtplib
+from pymongo import ReturnDocument
+
+from helpers.Logger import Logger
+
+
+class SmtpSession:
+    """One persistent, authenticated SMTP connection.
+
+    Connects and logs in on the first send and then reuses the connection for
+    every following message. A connection the server dropped while idle is
+    reopened once before the send is reported as failed.
+    """
+
+    def __init__(self, hostname: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, start_tls: bool = False, timeout: float = 30):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.timeout = timeout
+        self.smtp: Optional[aiosmtplib.SMTP] = None
+
+    async def connect(self):
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                               start_tls=self.start_tls, timeout=self.timeout)
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        self.smtp = smtp
+
+    async def send(self, message: EmailMessage):
+        if self.smtp is None or not self.smtp.is_connected:
+            await self.connect()
+        try:
+            await self.smtp.send_message(message)
+        except aiosmtplib.SMTPServerDisconnected:
+            await self.connect()
+            await self.smtp.send_message(message)
+
+    async def close(self):
+        if self.smtp is not None and self.smtp.is_connected:
+            try:
+                await self.smtp.quit()
+            except Exception:
+                self.smtp.close()
+        self.smtp = None
+
+
+def is_permanent(error: Exception) -> bool:
+    """5xx replies and refused recipients will not succeed on retry."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, aiosmtplib.SMTPResponseException) and error.code >= 500
+
+
+class EmailOutbox:
+    """Mongo-backed outbox with background SMTP delivery.
+
+    ``enqueue`` only inserts the message, so callers return without touching
+    the mail server. ``concurrency`` sender tasks per worker each keep their own
+    ``SmtpSession`` open, so a burst of mail reuses a few warm connections
+    instead of a TLS handshake and login per message. Senders claim messages
+    with a lease like ``JobQueue``; a failed delivery is retried after an
+    exponential backoff with jitter until ``max_attempts``, and permanent SMTP
+    errors fail at once. Finished messages expire after ``retention_seconds``.
+
+    A send is abandoned after half of ``lease_seconds``, so the lease always
+    outlives it and no other sender can claim a message that is still being
+    sent. Keep the lease above twice the SMTP timeout, since ``send`` may
+    reconnect and resend once.
+    """
+
+    def __init__(self, collection, session_factory: Callable[[], SmtpSession], sender: str,
+                 concurrency: int = 2, lease_seconds: float = 150, poll_interval: float = 5,
+                 max_attempts: int = 6, base_backoff: float = 5, max_backoff: float = 600,
+                 retention_seconds: int = 7 * 24 * 3600):
+        self.collection = collection
+        self.session_factory = session_factory
+        self.sender = sender
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retention_seconds = retention_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.senders = []
+        self.wakeup = asyncio.Event()
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("nextAttemptAt", 1)])
+        await self.collection.create_index("finishedAt", expireAfterSeconds=self.retention_seconds)
+
+    async def enqueue(self, to: str, subject: str, text: str, html: Optional[str] = None) -> str:
+        """Stores a message for delivery and returns its id."""
+        now = datetime.now()
+        message_id = str(uuid.uuid4())
+        await self.collection.insert_one({
+            "_id": message_id,
+            "to": to,
+            "subject": subject,
+            "text": text,
+            "html": html,
+            "status": "queued",
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "createdAt": now,
+        })
+        self.wakeup.set()
+        return message_id
+
+    def build_message(self, doc: Dict) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = doc["to"]
+        message["Subject"] = doc["subject"]
+        message.set_content(doc["text"])
+        if doc.get("html"):
+            message.add_alternative(doc["html"], subtype="html")
+        return message
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1)
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self.senders.append(asyncio.create_task(self._send_loop(self.session_factory())))
+        Logger.print("Email outbox started", self.worker_id, "senders", self.concurrency)
+
+    async def stop(self):
+        """Stops the senders and hands their claimed messages back to the queue."""
+        for sender in self.senders:
+            sender.cancel()
+        await asyncio.gather(*self.senders, return_exceptions=True)
+        self.senders = []
+        await self.collection.update_many(
+            {"worker": self.worker_id, "status": "sending"},
+            {"$set": {"status": "queued"}, "$unset": {"worker": "", "leaseUntil": ""}},
+        )
+
+    async def _claim(self) -> Optional[Dict]:
+        now = datetime.now()
+        # A message whose lease ran out on its last attempt (e.g. the send keeps
+        # crashing the worker) fails instead of being claimed again
+        await self.collection.update_many(
+            {"status": "sending", "leaseUntil": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired on the last attempt", "finishedAt": datetime.utcnow()},
+             "$unset": {"leaseUntil": ""}},
+        )
+        return await self.collection.find_one_and_update(
+            {"$or": [{"status": "queued", "nextAttemptAt": {"$lte": now}},
+                     {"status": "sending", "leaseUntil": {"$lt": now}, "attempts": {"$lt": self.max_attempts}}]},
+            {"$set": {"status": "sending", "worker": self.worker_id,
+                      "leaseUntil": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _send_loop(self, session: SmtpSession):
+        try:
+            while True:
+                try:
+                    doc = await self._claim()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Email outbox claim failed: {e}")
+                    doc = None
+                if doc is None:
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._deliver(session, doc)
+        finally:
+            await session.close()
+
+    async def _deliver(self, session: SmtpSession, doc: Dict):
+        owned = {"_id": doc["_id"], "worker": self.worker_id}
+        try:
+            await asyncio.wait_for(session.send(self.build_message(doc)), timeout=self.lease_seconds / 2)
+            update = {"$set": {"status": "sent", "finishedAt": datetime.utcnow()},
+                      "$unset": {"leaseUntil": "", "error": ""}}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            traceback.print_exc()
+            if not isinstance(e, (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused)):
+                # The connection itself failed; start the next attempt on a fresh one
+                await session.close()
+            if is_permanent(e) or doc["attempts"] >= self.max_attempts:
+                update = {"$set": {"status": "failed", "error": str(e), "finishedAt": datetime.utcnow()},
+                          "$unset": {"leaseUntil": ""}}
+            else:
+                retry_at = datetime.now() + timedelta(seconds=self.backoff(doc["attempts"]))
+                update = {"$set": {"status": "queued", "error": str(e), "nextAttemptAt": retry_at},
+                          "$unset": {"worker": "", "leaseUntil": ""}}
+        try:
+            await self.collection.update_one(owned, update)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # The lease runs out and the message is claimed again, so keep this sender alive
+            print(f"Email outbox status update failed for {doc['_id']}: {e}")
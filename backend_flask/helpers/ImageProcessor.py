@@ -0,0 +1,95 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+
+from cachetools import LRUCache
+
+from .ProcessPool import run_in_process
+
+
+# Longest side, in pixels, each provider actually uses; anything larger is
+# downscaled by the provider anyway and only costs upload time and tokens.
+PROVIDER_MAX_DIMENSION = {
+    "claude": 1568,
+    "gemini": 3072,
+}
+DEFAULT_MAX_DIMENSION = 2048
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+
+# Processed images keyed by (content hash, max dimension), bounded by total bytes
+_cache = LRUCache(maxsize=int(os.getenv("IMAGE_CACHE_BYTES", str(64 * 1024 * 1024))),
+                  getsizeof=lambda value: len(value[0]))
+_in_flight = {}
+
+
+def process_image(data: bytes, max_dimension: int, quality: int = JPEG_QUALITY):
+    """Decodes, EXIF-rotates, downscales and recompresses an image.
+
+    Runs in the process pool. Returns ``(bytes, mime_type)``; the original bytes
+    are returned untouched for animations, or for upright images that
+    recompressing would not shrink.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        if getattr(img, "is_animated", False):
+            return data, Image.MIME.get(img.format, "application/octet-stream")
+
+        original_mime = Image.MIME.get(img.format, "application/octet-stream")
+        # EXIF orientation 1 is upright; anything else gets rotated into the pixels
+        transposed = img.getexif().get(0x0112, 1) != 1
+        img = ImageOps.exif_transpose(img)
+        resized = max(img.size) > max_dimension
+        if resized:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        out = io.BytesIO()
+        if has_alpha:
+            img.save(out, format="PNG", optimize=True)
+            mime_type = "image/png"
+        else:
+            img.convert("RGB").save(out, format="JPEG", quality=quality, optimize=True)
+            mime_type = "image/jpeg"
+
+    processed = out.getvalue()
+    if not resized and not transposed and len(processed) >= len(data):
+        return data, original_mime
+    return processed, mime_type
+
+
+async def prepare_image(data: bytes, mime_type: str, provider: str):
+    """Returns ``(bytes, mime_type)`` ready to send to ``provider``.
+
+    Results are cached by content hash, so re-sending the same photo reuses the
+    processed bytes, and concurrent requests for the same image share one job.
+    """
+    max_dimension = PROVIDER_MAX_DIMENSION.get(provider, DEFAULT_MAX_DIMENSION)
+    key = (hashlib.sha256(data).hexdigest(), max_dimension)
+
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(run_in_process(process_image, data, max_dimension))
+        _in_flight[key] = future
+    try:
+        result = await asyncio.shield(future)
+    except Exception as e:
+        print(f"Image preprocessing failed, sending original: {e}")
+        return data, mime_type
+    finally:
+        _in_flight.pop(key, None)
+
+    _cache[key] = result
+    return result
+
+
+async def encode_image_base64(data: bytes, mime_type: str, provider: str):
+    """Preprocesses an image and returns ``(base64_string, mime_type)``."""
+    processed, processed_mime = await prepare_image(data, mime_type, provider)
+    return base64.b64encode(processed).decode("utf-8"), processed_mime
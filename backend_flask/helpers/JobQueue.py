@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from helpers.Logger import Logger
+
+ProgressCallback = Callable[[Dict], Awaitable[None]]
+JobHandler = Callable[[Dict, ProgressCallback], Awaitable[Any]]
+
+# Handlers by job kind, registered by the route modules that own them
+HANDLERS: Dict[str, JobHandler] = {}
+
+TERMINAL_STATUSES = ("done", "failed")
+MAX_PROGRESS_EVENTS = 200
+
+
+def job_handler(kind: str):
+    """Registers ``handler(payload, progress)`` as the runner for jobs of ``kind``."""
+    def register(handler: JobHandler) -> JobHandler:
+        HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+class JobQueue:
+    """Mongo-backed job queue with an in-process worker pool.
+
+    Jobs are documents in ``collection``. A worker claims a job by atomically
+    setting a lease on it and keeps renewing the lease while the handler runs.
+    A job whose lease expires (its worker died or restarted) is claimed again
+    by any worker, so execution is at-least-once. A job's ``_id`` is its
+    idempotency key: resubmitting the same work returns the existing job.
+    """
+
+    def __init__(self, collection, handlers: Dict[str, JobHandler] = None, concurrency: int = 4,
+                 lease_seconds: float = 60, poll_interval: float = 2, max_attempts: int = 3,
+                 retention_seconds: int = 24 * 3600):
+        self.collection = collection
+        self.handlers = HANDLERS if handlers is None else handlers
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.workers = []
+        self.wakeup = asyncio.Event()
+        # One event per open watch() call, so each watcher can leave on its own
+        self.watchers: Dict[str, Set[asyncio.Event]] = {}
+
+    @staticmethod
+    def make_key(kind: str, payload: Dict) -> str:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(f"{kind}:{canonical}".encode()).hexdigest()
+
+    @staticmethod
+    def to_public(job: Dict) -> Dict:
+        public = {"job_id": job["_id"]}
+        for field in ("kind", "status", "attempts", "progress", "error",
+                      "createdAt", "startedAt", "finishedAt"):
+            value = job.get(field)
+            public[field] = value.isoformat() if isinstance(value, datetime) else value
+        return public
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("createdAt", 1)])
+        await self.collection.create_index("leaseUntil")
+        # Finished jobs expire; pending ones have no finishedAt and are kept
+        await self.collection.create_index("finishedAt", expireAfterSeconds=self.retention_seconds)
+
+    async def submit(self, kind: str, payload: Dict, key: str = None) -> Dict:
+        """Queues a job, or returns the existing job with the same key.
+
+        A job with the same key that has failed for good is queued again.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        job_id = key or self.make_key(kind, payload)
+        now = datetime.now()
+        job = {
+            "_id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "progress": [],
+            "version": 0,
+            "createdAt": now,
+        }
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            job = await self.collection.find_one_and_update(
+                {"_id": job_id, "status": "failed"},
+                {"$set": {"status": "queued", "attempts": 0, "progress": [], "createdAt": now},
+                 "$unset": {"error": "", "finishedAt": "", "worker": "", "leaseUntil": ""},
+                 "$inc": {"version": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return await self.collection.find_one({"_id": job_id}, {"payload": 0, "result": 0})
+        self.wakeup.set()
+        return job
+
+    async def get(self, job_id: str, with_result: bool = False) -> Optional[Dict]:
+        projection = {"payload": 0} if with_result else {"payload": 0, "result": 0}
+        return await self.collection.find_one({"_id": job_id}, projection)
+
+    async def watch(self, job_id: str) -> AsyncIterator[Dict]:
+        """Yields the job each time it changes, until it finishes.
+
+        Changes made on this worker wake the watcher immediately; changes made
+        elsewhere are picked up within ``poll_interval``.
+        """
+        event = asyncio.Event()
+        self.watchers.setdefault(job_id, set()).add(event)
+        version = None
+        try:
+            while True:
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if job["version"] != version:
+                    version = job["version"]
+                    yield job
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            events = self.watchers.get(job_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self.watchers[job_id]
+
+    def _notify(self, job_id: str):
+        for event in self.watchers.get(job_id, ()):
+            event.set()
+
+    def start(self):
+        for _ in range(self.concurrency):
+            self.workers.append(asyncio.create_task(self._work()))
+        Logger.print("Job queue started", self.worker_id, "workers", self.concurrency)
+
+    async def stop(self):
+        """Stops the workers and hands their unfinished jobs back to the queue."""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        await self.collection.update_many(
+            {"worker": self.worker_id, "status": "running"},
+            {"$set": {"status": "queued"}, "$unset": {"worker": "", "leaseUntil": ""},
+             "$inc": {"version": 1}},
+        )
+
+    async def _claim(self) -> Optional[Dict]:
+        now = datetime.now()
+        # A job whose lease ran out on its last attempt (e.g. it keeps crashing
+        # the worker) fails instead of being claimed again
+        await self.collection.update_many(
+            {"status": "running", "leaseUntil": {"$lt": now}, "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired on the last attempt", "finishedAt": datetime.utcnow()},
+             "$unset": {"leaseUntil": ""}, "$inc": {"version": 1}},
+        )
+        return await self.collection.find_one_and_update(
+            {"$or": [{"status": "queued"},
+                     {"status": "running", "leaseUntil": {"$lt": now}, "attempts": {"$lt": self.max_attempts}}]},
+            {"$set": {"status": "running", "worker": self.worker_id, "startedAt": now,
+                      "leaseUntil": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1, "version": 1}},
+            sort=[("createdAt", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _renew_lease(self, job_id: str, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            renewed = await self.collection.update_one(
+                {"_id": job_id, "worker": self.worker_id, "status": "running"},
+                {"$set": {"leaseUntil": datetime.now() + timedelta(seconds=self.lease_seconds)}},
+            )
+            if renewed.matched_count == 0:
+                # Another worker has taken the job over; stop working on it
+                task.cancel()
+                return
+
+    async def _run(self, job: Dict):
+        job_id = job["_id"]
+        owned = {"_id": job_id, "worker": self.worker_id}
+
+        async def progress(event: Dict):
+            await self.collection.update_one(
+                owned,
+                {"$push": {"progress": {"$each": [{**event, "at": datetime.now()}],
+                                        "$slice": -MAX_PROGRESS_EVENTS}},
+                 "$inc": {"version": 1}},
+            )
+            self._notify(job_id)
+
+        self._notify(job_id)
+        handler = self.handlers.get(job["kind"])
+        task = asyncio.create_task(handler(job["payload"], progress)) if handler else None
+        renewer = asyncio.create_task(self._renew_lease(job_id, task)) if task else None
+        try:
+            if task is None:
+                raise ValueError(f"No handler for job kind '{job['kind']}'")
+            result = await task
+            update = {"$set": {"status": "done", "result": result, "finishedAt": datetime.utcnow()},
+                      "$unset": {"leaseUntil": ""}, "$inc": {"version": 1}}
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                # Worker is stopping; stop() hands the job back to the queue
+                task.cancel()
+                raise
+            # Lease lost: the new owner records the outcome
+            return
+        except Exception as e:
+            traceback.print_exc()
+            if job["attempts"] >= self.max_attempts:
+                update = {"$set": {"status": "failed", "error": str(e), "finishedAt": datetime.utcnow()},
+                          "$unset": {"leaseUntil": ""}, "$inc": {"version": 1}}
+            else:
+                update = {"$set": {"status": "queued", "error": str(e)},
+                          "$unset": {"worker": "", "leaseUntil": ""}, "$inc": {"version": 1}}
+        finally:
+            if renewer:
+                renewer.cancel()
+        await self.collection.update_one(owned, update)
+        self._notify(job_id)
+        self.wakeup.set()
@@ -0,0 +1,132 @@
+import asyncio
+import traceback
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from helpers.Logger import Logger
+
+
+ScoreKey = Tuple[str, str]
+
+# Write errors worth another attempt: an upsert that lost a race on the unique
+# (user_id, subject) index succeeds as an update next time
+RETRYABLE_WRITE_ERRORS = {11000}
+
+
+class LeaderboardIngest:
+    """Buffers challenge results and writes them to the leaderboard in batches.
+
+    ``add`` folds a score event into an in-memory total per (user, subject);
+    nothing touches Mongo on the request path. Every ``flush_interval`` seconds
+    (or as soon as ``max_pending`` keys are buffered) the totals are swapped out
+    and written with one unordered ``bulk_write`` of ``$inc`` upserts, so a
+    class-wide quiz costs a handful of round trips instead of one per player.
+    Entries whose write failed with a retryable error, or a whole batch that
+    failed to reach the server, are merged back into the buffer for the next
+    attempt; entries that can never succeed are logged and dropped.
+
+    ``collection`` is the synchronous ``leaderboard`` collection; writes run in a
+    worker thread.
+    """
+
+    def __init__(self, collection, flush_interval: float = 5, max_pending: int = 5000):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending: Dict[ScoreKey, Dict[str, int]] = {}
+        self.flusher: Optional[asyncio.Task] = None
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+
+    @staticmethod
+    def user_key(user_id: str):
+        # Leaderboard entries reference users by their ObjectId
+        return ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
+
+    def add(self, user_id: str, subject: str, score: int, won: bool = False):
+        totals = self.pending.setdefault((user_id, subject), {"score": 0, "played": 0, "wins": 0})
+        totals["score"] += score
+        totals["played"] += 1
+        totals["wins"] += int(won)
+        if len(self.pending) >= self.max_pending:
+            self.wakeup.set()
+
+    def requests(self, batch: List[Tuple[ScoreKey, Dict[str, int]]], now: datetime) -> List[UpdateOne]:
+        return [
+            UpdateOne(
+                {"user_id": self.user_key(user_id), "subject": subject},
+                {"$inc": totals, "$set": {"LastUpdated": now}},
+                upsert=True,
+            )
+            for (user_id, subject), totals in batch
+        ]
+
+    def requeue(self, batch: List[Tuple[ScoreKey, Dict[str, int]]]):
+        for key, totals in batch:
+            merged = self.pending.setdefault(key, {"score": 0, "played": 0, "wins": 0})
+            for field, value in totals.items():
+                merged[field] += value
+
+    async def flush(self) -> int:
+        """Writes everything buffered so far. Returns the number of entries written."""
+        if not self.pending:
+            return 0
+        batch, self.pending = list(self.pending.items()), {}
+        try:
+            await asyncio.to_thread(self.collection.bulk_write, self.requests(batch, datetime.now()), ordered=False)
+        except BulkWriteError as e:
+            # Unordered: every entry without a write error was applied
+            retry = []
+            for error in e.details["writeErrors"]:
+                entry = batch[error["index"]]
+                if error["code"] in RETRYABLE_WRITE_ERRORS:
+                    retry.append(entry)
+                else:
+                    print(f"Dropping leaderboard entry {entry}: {error.get('errmsg')}")
+            self.requeue(retry)
+            Logger.print("Leaderboard flush", len(batch) - len(e.details["writeErrors"]), "entries,",
+                         len(retry), "requeued")
+            return len(batch) - len(e.details["writeErrors"])
+        except Exception:
+            self.requeue(batch)
+            raise
+        Logger.print("Leaderboard flush", len(batch), "entries")
+        return len(batch)
+
+    def ensure_indexes(self) -> None:
+        # Unique, so concurrent upserts from several workers cannot create twin entries
+        self.collection.create_index([("user_id", 1), ("subject", 1)], unique=True)
+
+    async def start(self):
+        if self.flusher is None:
+            self.stopping = False
+            self.flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Lets the flusher finish its last batch rather than cancelling it mid-write,
+        since a cancelled batch may still land and would be counted twice on retry."""
+        if self.flusher:
+            self.stopping = True
+            self.wakeup.set()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+            self.flusher = None
+        try:
+            await self.flush()  # anything added while the last batch was in flight
+        except Exception:
+            traceback.print_exc()
+
+    async def _run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,382 @@
+import time
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+LEVELS = ("easy", "medium", "hard")
+
+BucketKey = Tuple[str, str, str]
+# ``first`` is the player who waited longer; ``waited`` is their wait in seconds
+Match = namedtuple("Match", "first second level waited")
+
+
+def normalize(value: str) -> str:
+    return value.strip().lower()
+
+
+def neighbour_levels(levels: List[str], level: str) -> List[str]:
+    if level not in levels:
+        return []
+    i = levels.index(level)
+    return [levels[j] for j in (i - 1, i + 1) if 0 <= j < len(levels)]
+
+
+class Ticket:
+    """A waiting player. Keeps the values as entered; ``key`` is the normalized bucket."""
+
+    __slots__ = ("user_id", "subject", "topic", "level", "key", "created", "widened", "active")
+
+    def __init__(self, user_id: str, subject: str, topic: str, level: str, created: float):
+        self.user_id = user_id
+        self.subject = subject
+        self.topic = topic
+        self.level = level
+        self.key: BucketKey = (normalize(subject), normalize(topic), normalize(level))
+        self.created = created
+        self.widened = False
+        self.active = True
+
+    def neighbour_key(self, level: str) -> BucketKey:
+        return (self.key[0], self.key[1], level)
+
+    @classmethod
+    def from_doc(cls, doc: Dict) -> "Ticket":
+        ticket = cls(doc["_id"], doc["subject"], doc["topic"], doc["level"], doc["created"])
+        ticket.widened = doc.get("widened", False)
+        return ticket
+
+
+class Matchmaker:
+    """Pairs players waiting for a random opponent.
+
+    Waiting players sit in FIFO buckets per (subject, topic, level). A new
+    player is paired with the longest-waiting player of their own bucket, or
+    with a player from a neighbouring level who has already waited
+    ``widen_after`` seconds, so every pairing is O(1). ``sweep`` runs
+    periodically: it widens tickets that have waited long enough, pairs them
+    across neighbouring levels, and drops tickets older than ``ticket_ttl``.
+    It walks tickets in arrival order and stops at the first young one, so it
+    only touches tickets whose state changes.
+
+    The core is synchronous and takes ``now`` so it can be simulated; the
+    caller handles notification. At most ``max_waiting`` tickets are held.
+    """
+
+    def __init__(self, levels=LEVELS, widen_after: float = 10, ticket_ttl: float = 120, max_waiting: int = 10000):
+        self.levels = list(levels)
+        self.widen_after = widen_after
+        self.ticket_ttl = ticket_ttl
+        self.max_waiting = max_waiting
+        self.waiting: Dict[BucketKey, OrderedDict] = {}
+        self.widened: Dict[BucketKey, OrderedDict] = {}
+        self.tickets: Dict[str, Ticket] = {}
+        # Arrival order, for the widen and expiry passes; stale entries are skipped
+        self.to_widen: deque = deque()
+        self.to_expire: deque = deque()
+
+    def neighbours(self, level: str) -> List[str]:
+        return neighbour_levels(self.levels, level)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def get(self, user_id: str) -> Optional[Ticket]:
+        return self.tickets.get(user_id)
+
+    def enqueue(self, user_id: str, subject: str, topic: str, level: str, now: float = None) -> Optional[Match]:
+        """Pairs the player right away or leaves them waiting (returns ``None``).
+
+        Re-enqueueing a waiting player keeps their original ticket. Raises
+        ``OverflowError`` when ``max_waiting`` players are already waiting.
+        """
+        now = time.monotonic() if now is None else now
+        if user_id in self.tickets:
+            return None
+        ticket = Ticket(user_id, subject, topic, level, now)
+
+        partner = self._pop_oldest(self.waiting, ticket.key)
+        if partner is None:
+            for level in self.neighbours(ticket.key[2]):
+                partner = self._pop_oldest(self.widened, ticket.neighbour_key(level))
+                if partner:
+                    break
+        if partner is not None:
+            return Match(partner, ticket, ticket.level, now - partner.created)
+
+        if len(self.tickets) >= self.max_waiting:
+            raise OverflowError("Matchmaking queue is full")
+        self.tickets[user_id] = ticket
+        self.waiting.setdefault(ticket.key, OrderedDict())[user_id] = ticket
+        self.to_widen.append(ticket)
+        self.to_expire.append(ticket)
+        if len(self.to_expire) > 2 * len(self.tickets) + 64:
+            # Cancelled and matched tickets linger until they reach the front; drop them
+            self.to_widen = deque(t for t in self.tickets.values() if not t.widened)
+            self.to_expire = deque(self.tickets.values())
+        return None
+
+    def cancel(self, user_id: str) -> bool:
+        ticket = self.tickets.get(user_id)
+        if ticket is None:
+            return False
+        self._remove(ticket)
+        return True
+
+    def sweep(self, now: float = None) -> Tuple[List[Match], List[Ticket]]:
+        """Widens and pairs tickets that have waited ``widen_after`` and expires
+        those older than ``ticket_ttl``. Returns ``(matches, expired)``."""
+        now = time.monotonic() if now is None else now
+        matches = []
+        while self.to_widen and (not self.to_widen[0].active or now - self.to_widen[0].created >= self.widen_after):
+            ticket = self.to_widen.popleft()
+            if not ticket.active:
+                continue
+            partner = None
+            for level in self.neighbours(ticket.key[2]):
+                partner = self._pop_oldest(self.waiting, ticket.neighbour_key(level))
+                if partner:
+                    break
+            if partner is not None:
+                self._remove(ticket)
+                first, second = (ticket, partner) if ticket.created <= partner.created else (partner, ticket)
+                matches.append(Match(first, second, first.level, now - first.created))
+            else:
+                ticket.widened = True
+                self.widened.setdefault(ticket.key, OrderedDict())[ticket.user_id] = ticket
+
+        expired = []
+        while self.to_expire and (not self.to_expire[0].active or now - self.to_expire[0].created >= self.ticket_ttl):
+            ticket = self.to_expire.popleft()
+            if ticket.active:
+                self._remove(ticket)
+                expired.append(ticket)
+        return matches, expired
+
+    def _pop_oldest(self, buckets: Dict[BucketKey, OrderedDict], key: BucketKey) -> Optional[Ticket]:
+        bucket = buckets.get(key)
+        if not bucket:
+            return None
+        _, ticket = bucket.popitem(last=False)
+        self._remove(ticket)
+        return ticket
+
+    def _remove(self, ticket: Ticket):
+        ticket.active = False
+        self.tickets.pop(ticket.user_id, None)
+        for buckets in (self.waiting, self.widened):
+            bucket = buckets.get(ticket.key)
+            if bucket is not None:
+                bucket.pop(ticket.user_id, None)
+                if not bucket:
+                    del buckets[ticket.key]
+
+
+class MatchmakingQueue:
+    """Async matchmaking queue used by the routes.
+
+    ``enqueue`` and ``sweep`` behave like ``Matchmaker``'s. The queue also
+    remembers each player's latest match (``record_match``) so a waiting
+    player can poll for it.
+    """
+
+    async def enqueue(self, user_id: str, subject: str, topic: str, level: str) -> Optional[Match]:
+        raise NotImplementedError
+
+    async def cancel(self, user_id: str) -> bool:
+        """Removes a waiting player. Returns ``False`` if they were not waiting."""
+        raise NotImplementedError
+
+    async def status(self, user_id: str) -> Dict:
+        """``{"status": "waiting", "level", "widened"}``, ``{"status": "matched", **event}``
+        or ``{"status": "none"}``."""
+        raise NotImplementedError
+
+    async def sweep(self) -> Tuple[List[Match], List[Ticket]]:
+        raise NotImplementedError
+
+    async def record_match(self, user_id: str, event: Dict) -> None:
+        raise NotImplementedError
+
+    async def clear_match(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    async def ensure_indexes(self) -> None:
+        pass
+
+
+class LocalMatchmakingQueue(MatchmakingQueue):
+    """``Matchmaker`` of this process; only pairs players whose requests reach
+    the same worker, so it needs a single worker."""
+
+    def __init__(self, matchmaker: Matchmaker):
+        self.matchmaker = matchmaker
+        self.recent_matches: "OrderedDict[str, Dict]" = OrderedDict()
+
+    async def enqueue(self, user_id, subject, topic, level):
+        return self.matchmaker.enqueue(user_id, subject, topic, level)
+
+    async def cancel(self, user_id):
+        return self.matchmaker.cancel(user_id)
+
+    async def status(self, user_id):
+        ticket = self.matchmaker.get(user_id)
+        if ticket:
+            return {"status": "waiting", "level": ticket.level, "widened": ticket.widened}
+        if user_id in self.recent_matches:
+            return {"status": "matched", **self.recent_matches[user_id]}
+        return {"status": "none"}
+
+    async def sweep(self):
+        return self.matchmaker.sweep()
+
+    async def record_match(self, user_id, event):
+        self.recent_matches[user_id] = event
+        self.recent_matches.move_to_end(user_id)
+        while len(self.recent_matches) > self.matchmaker.max_waiting:
+            self.recent_matches.popitem(last=False)
+
+    async def clear_match(self, user_id):
+        self.recent_matches.pop(user_id, None)
+
+
+class MongoMatchmakingQueue(MatchmakingQueue):
+    """Queue shared by all workers, one document per player.
+
+    A ticket is ``waiting`` until a pairing claims it. To pair, a player
+    first claims their own ticket and then the partner's, each with a
+    ``find_one_and_update`` guarded by ``status: "waiting"``, so a ticket is
+    never handed to two matches; a pairing that finds no partner puts its own
+    ticket back. A new player who finds nobody waiting is inserted and then
+    tries once more against older tickets only, which pairs two players that
+    arrived at the same moment on different workers without both retrying.
+    Any worker can run ``sweep``. Tickets hold ``created`` as wall clock time,
+    since it is compared across machines, and a TTL index on ``expiresAt``
+    removes leftovers (e.g. a claim whose worker died).
+    """
+
+    def __init__(self, collection, levels=LEVELS, widen_after: float = 10, ticket_ttl: float = 120,
+                 max_waiting: int = 10000, match_retention: float = 600, sweep_batch: int = 500):
+        self.collection = collection
+        self.levels = list(levels)
+        self.widen_after = widen_after
+        self.ticket_ttl = ticket_ttl
+        self.max_waiting = max_waiting
+        self.match_retention = match_retention
+        self.sweep_batch = sweep_batch
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("ks", 1), ("kt", 1), ("kl", 1), ("created", 1)])
+        await self.collection.create_index([("status", 1), ("created", 1)])
+        await self.collection.create_index("expiresAt", expireAfterSeconds=0)
+
+    @staticmethod
+    def bucket(ticket: Ticket, level: str = None, widened: bool = None) -> Dict:
+        query = {"status": "waiting", "ks": ticket.key[0], "kt": ticket.key[1], "kl": level or ticket.key[2],
+                 "_id": {"$ne": ticket.user_id}}
+        if widened is not None:
+            query["widened"] = widened
+        return query
+
+    async def _claim(self, query: Dict) -> Optional[Ticket]:
+        doc = await self.collection.find_one_and_update(
+            query, {"$set": {"status": "claimed"}}, sort=[("created", 1)], return_document=ReturnDocument.AFTER,
+        )
+        return Ticket.from_doc(doc) if doc else None
+
+    async def _pair(self, ticket: Ticket, partner_queries: List[Dict]) -> Optional[Ticket]:
+        """Claims ``ticket`` and then the oldest ticket matching one of the queries.
+        Returns the partner; ``None`` if there was none, or if ``ticket`` itself
+        was claimed by someone else first."""
+        if await self._claim({"_id": ticket.user_id, "status": "waiting"}) is None:
+            return None
+        for query in partner_queries:
+            partner = await self._claim(query)
+            if partner is not None:
+                return partner
+        await self.collection.update_one({"_id": ticket.user_id, "status": "claimed"},
+                                         {"$set": {"status": "waiting"}})
+        return None
+
+    async def enqueue(self, user_id, subject, topic, level):
+        if await self.collection.find_one({"_id": user_id, "status": {"$in": ["waiting", "claimed"]}}, {"_id": 1}):
+            return None
+        now = time.time()
+        ticket = Ticket(user_id, subject, topic, level, now)
+
+        partner = await self._claim(self.bucket(ticket))
+        for neighbour in self.neighbours(ticket.key[2]) if partner is None else ():
+            partner = await self._claim(self.bucket(ticket, neighbour, widened=True))
+            if partner:
+                break
+        if partner is not None:
+            return Match(partner, ticket, ticket.level, now - partner.created)
+
+        if await self.collection.count_documents({"status": "waiting"}, limit=self.max_waiting) >= self.max_waiting:
+            raise OverflowError("Matchmaking queue is full")
+        await self.collection.replace_one({"_id": user_id}, {
+            "subject": subject, "topic": topic, "level": level,
+            "ks": ticket.key[0], "kt": ticket.key[1], "kl": ticket.key[2],
+            "status": "waiting", "widened": False, "created": now,
+            "expiresAt": datetime.utcnow() + timedelta(seconds=self.ticket_ttl + 60),
+        }, upsert=True)
+
+        # Someone may have joined the same bucket on another worker meanwhile
+        partner = await self._pair(ticket, [{**self.bucket(ticket), "created": {"$lt": now}}])
+        if partner is not None:
+            return Match(partner, ticket, ticket.level, now - partner.created)
+        return None
+
+    def neighbours(self, level: str) -> List[str]:
+        return neighbour_levels(self.levels, level)
+
+    async def cancel(self, user_id):
+        return (await self.collection.delete_one({"_id": user_id, "status": "waiting"})).deleted_count > 0
+
+    async def status(self, user_id):
+        doc = await self.collection.find_one({"_id": user_id})
+        if doc is None:
+            return {"status": "none"}
+        if doc["status"] == "matched":
+            return {"status": "matched", **doc["match"]}
+        return {"status": "waiting", "level": doc["level"], "widened": doc.get("widened", False)}
+
+    async def sweep(self):
+        now = time.time()
+        matches = []
+        cursor = self.collection.find(
+            {"status": "waiting", "widened": False, "created": {"$lte": now - self.widen_after}},
+        ).sort("created", 1).limit(self.sweep_batch)
+        for ticket in [Ticket.from_doc(doc) async for doc in cursor]:
+            # Own bucket first, for players who joined at the same moment and missed each other
+            partner = await self._pair(ticket, [self.bucket(ticket)] + [self.bucket(ticket, level)
+                                                                        for level in self.neighbours(ticket.key[2])])
+            if partner is not None:
+                first, second = (ticket, partner) if ticket.created <= partner.created else (partner, ticket)
+                matches.append(Match(first, second, first.level, now - first.created))
+            else:
+                await self.collection.update_one({"_id": ticket.user_id, "status": "waiting"},
+                                                 {"$set": {"widened": True}})
+
+        expired = []
+        cursor = self.collection.find(
+            {"status": "waiting", "created": {"$lte": now - self.ticket_ttl}}, {"_id": 1},
+        ).limit(self.sweep_batch)
+        for user_id in [doc["_id"] async for doc in cursor]:
+            # Only the worker that deletes the ticket reports it
+            doc = await self.collection.find_one_and_delete({"_id": user_id, "status": "waiting"})
+            if doc:
+                expired.append(Ticket.from_doc(doc))
+        return matches, expired
+
+    async def record_match(self, user_id, event):
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$set": {"status": "matched", "match": event,
+                      "expiresAt": datetime.utcnow() + timedelta(seconds=self.match_retention)}},
+            upsert=True,
+        )
+
+    async def clear_match(self, user_id):
+        await self.collection.delete_one({"_id": user_id, "status": "matched"})
@@ -0,0 +1,70 @@
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+
+class PasswordHasher:
+    """bcrypt hashing off the event loop.
+
+    A bcrypt hash takes tens to hundreds of milliseconds by design, so every
+    hash and check runs on a bounded thread pool; bcrypt releases the GIL while
+    it works, so ``workers`` threads hash in parallel. ``rounds`` is the bcrypt
+    cost factor (each step doubles the work).
+
+    ``verify`` also accepts legacy plaintext passwords and hashes made with a
+    lower cost, and hands back a fresh hash for the caller to store, so rows
+    are upgraded as users log in.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 4):
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Checked against when the user does not exist, so unknown emails take as long
+        # as wrong passwords; made on the pool the first time it is needed
+        self.dummy_hash: Optional[bytes] = None
+
+    @staticmethod
+    def is_hashed(stored: str) -> bool:
+        return stored.startswith(("$2a$", "$2b$", "$2y$"))
+
+    @staticmethod
+    def cost(stored: str) -> int:
+        return int(stored.split("$")[2])
+
+    def hash_sync(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("ascii")
+
+    def verify_sync(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        if not stored:
+            if self.dummy_hash is None:
+                self.dummy_hash = bcrypt.hashpw(b"dummy", bcrypt.gensalt(self.rounds))
+            bcrypt.checkpw(password.encode("utf-8"), self.dummy_hash)
+            return False, None
+        if self.is_hashed(stored):
+            try:
+                if not bcrypt.checkpw(password.encode("utf-8"), stored.encode("ascii")):
+                    return False, None
+                return True, self.hash_sync(password) if self.cost(stored) < self.rounds else None
+            except (ValueError, UnicodeEncodeError):
+                # Looks like a hash but is not one, i.e. a plaintext password that
+                # happens to start with a bcrypt prefix
+                pass
+        # Legacy row with the password in plaintext
+        if not hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8")):
+            return False, None
+        return True, self.hash_sync(password)
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.hash_sync, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Returns ``(matches, new_hash)``. ``new_hash`` is set when the stored value
+        is plaintext or uses a lower cost and should be replaced. Pass ``None`` for
+        an unknown user to spend the same time as a real check."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.verify_sync, password, stored)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from cachetools import LRUCache
+
+from .ProcessPool import run_in_process_timed
+
+PDF_PAGE_CAP = int(os.getenv("PDF_PAGE_CAP", "50"))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "5"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "10"))
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "30"))
+PDF_TEXT_TTL_SECONDS = int(os.getenv("PDF_TEXT_TTL_DAYS", "30")) * 24 * 3600
+RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "150"))
+RASTER_MAX_PAGES = int(os.getenv("PDF_RASTER_MAX_PAGES", "20"))
+RASTER_PAGES_PER_TASK = int(os.getenv("PDF_RASTER_PAGES_PER_TASK", "2"))
+RASTER_PAGE_TIMEOUT = float(os.getenv("PDF_RASTER_PAGE_TIMEOUT", "10"))
+# Largest rendered page (width x height); bigger pages are rendered at a lower DPI
+RASTER_MAX_PIXELS = int(os.getenv("PDF_RASTER_MAX_PIXELS", str(4_000_000)))
+MIN_PAGE_TEXT_CHARS = 20
+
+# Extracted pages keyed by content hash; Mongo holds the same data across workers
+_cache = LRUCache(maxsize=int(os.getenv("PDF_CACHE_ENTRIES", "256")))
+# Rendered pages keyed by (content hash, page index, dpi), bounded by total bytes
+_raster_cache = LRUCache(maxsize=int(os.getenv("PDF_RASTER_CACHE_BYTES", str(128 * 1024 * 1024))),
+                         getsizeof=len)
+
+
+@asynccontextmanager
+async def spooled_pdf(data: bytes):
+    """Writes the PDF to a temporary file once and yields its path, so pool
+    processes open it from disk instead of each batch pickling the document."""
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+
+    def write():
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+    try:
+        await asyncio.to_thread(write)
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def extract_pages(path: str, start: int, stop: int) -> dict:
+    """Extracts the text of pages ``start`` to ``stop``. Runs in the process pool."""
+    import fitz
+
+    with fitz.open(path, filetype="pdf") as doc:
+        page_count = doc.page_count
+        pages = [doc[index].get_text() for index in range(start, min(stop, page_count))]
+    return {"pages": pages, "page_count": page_count}
+
+
+async def ensure_pdf_indexes(cache_collection):
+    await cache_collection.create_index("createdAt", expireAfterSeconds=PDF_TEXT_TTL_SECONDS)
+
+
+async def extract_pdf(data: bytes, sha256: str = None, cache_collection=None) -> dict:
+    """Returns ``{"pages", "page_count", "truncated", "timed_out"}`` for a PDF.
+
+    The document is written to a temporary file once and pages are extracted
+    in batches of ``PDF_PAGES_PER_TASK`` from it: the first batch reports the
+    page count, then the remaining batches run concurrently across the pool.
+    Each batch gets ``PDF_PAGE_TIMEOUT`` per page from when a pool process
+    starts it, and the whole document ``PDF_EXTRACT_TIMEOUT``. A batch that
+    misses its deadline ends the result at the pages before it; a pool process
+    stuck inside MuPDF cannot be interrupted, so it finishes in the background.
+
+    Complete results (and ones cut at ``PDF_PAGE_CAP``) are cached by content
+    hash in memory and, when ``cache_collection`` is given, in Mongo until the
+    ``createdAt`` TTL expires, so re-uploads skip extraction. Timed out results
+    are returned but never cached, so the next upload tries again.
+    """
+    sha256 = sha256 or hashlib.sha256(data).hexdigest()
+    cached = _cache.get(sha256)
+    if cached is not None:
+        return cached
+
+    if cache_collection is not None:
+        stored = await cache_collection.find_one({"_id": sha256}, {"_id": 0, "createdAt": 0})
+        if stored:
+            _cache[sha256] = stored
+            return stored
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PDF_EXTRACT_TIMEOUT
+    pages = []
+    page_count = 0
+    timed_out = False
+    async with spooled_pdf(data) as path:
+        def extract(start):
+            stop = min(start + PDF_PAGES_PER_TASK, PDF_PAGE_CAP)
+            return run_in_process_timed(PDF_PAGE_TIMEOUT * (stop - start), extract_pages, path, start, stop)
+
+        try:
+            first = await asyncio.wait_for(extract(0), timeout=PDF_EXTRACT_TIMEOUT)
+            page_count = first["page_count"]
+            pages.extend(first["pages"])
+        except asyncio.TimeoutError:
+            timed_out = True
+
+        starts = range(PDF_PAGES_PER_TASK, min(page_count, PDF_PAGE_CAP), PDF_PAGES_PER_TASK)
+        tasks = [asyncio.ensure_future(extract(start)) for start in starts]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()))
+            for task in pending:
+                task.cancel()
+            for task in done:
+                # Retrieve every outcome so none is reported as never retrieved
+                task.exception()
+            for task in tasks:
+                if task not in done or isinstance(task.exception(), asyncio.TimeoutError):
+                    timed_out = True
+                    break
+                pages.extend(task.result()["pages"])
+
+    result = {"pages": pages, "page_count": page_count,
+              "truncated": timed_out or len(pages) < page_count, "timed_out": timed_out}
+    if timed_out:
+        return result
+
+    _cache[sha256] = result
+    if cache_collection is not None:
+        await cache_collection.update_one({"_id": sha256}, {"$set": {**result, "createdAt": datetime.utcnow()}},
+                                          upsert=True)
+    return result
+
+
+def textless_pages(pages):
+    """Indexes of pages whose extracted text is (nearly) empty, i.e. scanned pages."""
+    return [i for i, text in enumerate(pages) if len(text.strip()) < MIN_PAGE_TEXT_CHARS]
+
+
+def clamp_dpi(width_points: float, height_points: float, dpi: int) -> int:
+    """Lowers ``dpi`` so the rendered page stays within ``RASTER_MAX_PIXELS``."""
+    pixels = (width_points * dpi / 72) * (height_points * dpi / 72)
+    if pixels <= RASTER_MAX_PIXELS:
+        return dpi
+    return max(1, int(dpi * (RASTER_MAX_PIXELS / pixels) ** 0.5))
+
+
+def render_pages(path: str, page_indexes, dpi: int = RASTER_DPI):
+    """Renders the given pages to PNG bytes. Runs in the process pool."""
+    import fitz
+
+    images = []
+    with fitz.open(path, filetype="pdf") as doc:
+        for index in page_indexes:
+            page = doc[index]
+            pixmap = page.get_pixmap(dpi=clamp_dpi(page.rect.width, page.rect.height, dpi))
+            images.append(pixmap.tobytes("png"))
+    return images
+
+
+async def rasterize_pages(data: bytes, page_indexes, sha256: str = None, dpi: int = RASTER_DPI) -> dict:
+    """Returns ``{page_index: png_bytes}`` for up to ``RASTER_MAX_PAGES`` pages.
+
+    Pages are rendered at a bounded DPI (lowered further for pages that would
+    exceed ``RASTER_MAX_PIXELS``) in small batches spread over the process
+    pool, and cached per page so a re-upload reuses the rendered images. Each
+    batch gets ``RASTER_PAGE_TIMEOUT`` per page from when it starts; pages of a
+    batch that runs out are left out of the result and not cached.
+    """
+    sha256 = sha256 or hashlib.sha256(data).hexdigest()
+    dpi = min(dpi, RASTER_DPI)
+    rendered = {}
+    missing = []
+    for index in list(page_indexes)[:RASTER_MAX_PAGES]:
+        cached = _raster_cache.get((sha256, index, dpi))
+        if cached is not None:
+            rendered[index] = cached
+        else:
+            missing.append(index)
+
+    batches = [missing[i:i + RASTER_PAGES_PER_TASK] for i in range(0, len(missing), RASTER_PAGES_PER_TASK)]
+    if not batches:
+        return rendered
+    async with spooled_pdf(data) as path:
+        results = await asyncio.gather(
+            *(run_in_process_timed(RASTER_PAGE_TIMEOUT * len(batch), render_pages, path, batch, dpi)
+              for batch in batches),
+            return_exceptions=True,
+        )
+    for batch, images in zip(batches, results):
+        if isinstance(images, asyncio.TimeoutError):
+            print(f"Rendering PDF pages {batch} timed out")
+            continue
+        if isinstance(images, BaseException):
+            raise images
+        for index, image in zip(batch, images):
+            _raster_cache[(sha256, index, dpi)] = image
+            rendered[index] = image
+    return rendered
@@ -0,0 +1,63 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Shared pool for CPU-bound work (image resizing, PDF parsing) that would
+# otherwise block the event loop. Created on first use, one per worker process.
+_pool = None
+_timed_slots = None
+
+
+def get_process_pool():
+    global _pool, _timed_slots
+    if _pool is None:
+        workers = int(os.getenv("PROCESS_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _timed_slots = asyncio.Semaphore(workers)
+    return _pool
+
+
+# How often a timed call checks whether a pool process has picked it up
+START_POLL_SECONDS = 0.05
+
+
+async def run_in_process(fn, *args, **kwargs):
+    """Runs a picklable top-level function in the shared process pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_in_process_timed(timeout: float, fn, *args, **kwargs):
+    """Like ``run_in_process``, but raises ``asyncio.TimeoutError`` if the call
+    runs longer than ``timeout``. The clock starts when a pool process picks the
+    call up, so time spent queued behind other work does not count.
+
+    The executor marks a call running as soon as it is handed to a process,
+    which can be one call ahead of a free process, so timed calls are also
+    limited to one per pool process.
+    """
+    pool = get_process_pool()
+    loop = asyncio.get_running_loop()
+    await _timed_slots.acquire()
+    try:
+        future = pool.submit(fn, *args, **kwargs)
+    except BaseException:
+        _timed_slots.release()
+        raise
+    # The slot stays taken until the process is done, even after a timeout
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_timed_slots.release))
+    try:
+        while not future.running() and not future.done():
+            await asyncio.sleep(START_POLL_SECONDS)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+
+def shutdown_process_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+from helpers.Logger import Logger
+
+
+BankKey = Tuple[str, str, str]
+QuestionGenerator = Callable[[str, str, str, int], Awaitable[List[Dict]]]
+
+
+class QuestionBank:
+    """Warm in-memory pools of quiz questions per (subject, topic, level), backed by Mongo.
+
+    Challenges draw from the pool without ever waiting on the model. When a pool
+    drops below ``low_water`` a background task tops it up, first from the Mongo
+    bank and then, if the bank is exhausted, by asking ``generator`` for new ones.
+    """
+
+    def __init__(self, collection, generator: QuestionGenerator,
+                 low_water: int = 10, target_size: int = 40, generate_batch: int = 10):
+        self.collection = collection
+        self.generator = generator
+        self.low_water = low_water
+        self.target_size = target_size
+        self.generate_batch = generate_batch
+        self.pools: Dict[BankKey, deque] = {}
+        self.pool_hashes: Dict[BankKey, set] = {}
+        self.refilling: Dict[BankKey, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(subject: str, topic: str, level: str) -> BankKey:
+        return (subject.strip().lower(), topic.strip().lower(), level.strip().lower())
+
+    @staticmethod
+    def question_hash(question: Dict) -> str:
+        """Stable hash of a question's text, used to dedupe bank entries."""
+        normalized = " ".join(question["question"].lower().split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def draw(self, subject: str, topic: str, level: str, count: int,
+             exclude: Iterable[str] = ()) -> List[Dict]:
+        """Pops up to ``count`` questions from the warm pool.
+
+        Questions whose hash is in ``exclude`` (already seen by the players) are
+        skipped. Never blocks: a refill is scheduled in the background instead.
+        """
+        key = self.make_key(subject, topic, level)
+        pool = self.pools.setdefault(key, deque())
+        hashes = self.pool_hashes.setdefault(key, set())
+        excluded = set(exclude)
+
+        drawn, skipped = [], []
+        while pool and len(drawn) < count:
+            question = pool.popleft()
+            if question["hash"] in excluded:
+                skipped.append(question)
+                continue
+            hashes.discard(question["hash"])
+            drawn.append(question)
+        pool.extend(skipped)
+
+        if len(pool) < self.low_water:
+            self.schedule_refill(subject, topic, level)
+        return [self.to_public(q) for q in drawn]
+
+    def give_back(self, subject: str, topic: str, level: str, questions: List[Dict]) -> None:
+        """Returns drawn questions that ended up unused (e.g. a lost start race) to the pool."""
+        self.add_to_pool(self.make_key(subject, topic, level), [q for q in questions if q.get("hash")])
+
+    def warm(self, subject: str, topic: str, level: str) -> None:
+        """Schedules a refill if the pool is below the low-water mark."""
+        pool = self.pools.get(self.make_key(subject, topic, level))
+        if pool is None or len(pool) < self.low_water:
+            self.schedule_refill(subject, topic, level)
+
+    def schedule_refill(self, subject: str, topic: str, level: str) -> None:
+        """Starts a background top-up for the pool unless one is already running."""
+        key = self.make_key(subject, topic, level)
+        task = self.refilling.get(key)
+        if task and not task.done():
+            return
+        self.refilling[key] = asyncio.create_task(self.refill(subject, topic, level))
+
+    async def refill(self, subject: str, topic: str, level: str) -> int:
+        """Tops the pool up to ``target_size``. Returns how many questions were added."""
+        key = self.make_key(subject, topic, level)
+        pool = self.pools.setdefault(key, deque())
+        hashes = self.pool_hashes.setdefault(key, set())
+        added = 0
+        try:
+            missing = self.target_size - len(pool)
+            if missing <= 0:
+                return 0
+
+            stored = await asyncio.to_thread(self.load_from_bank, key, missing, list(hashes))
+            added += self.add_to_pool(key, stored)
+
+            missing = self.target_size - len(pool)
+            if missing > 0:
+                generated = await self.generator(subject, topic, level, min(missing, self.generate_batch))
+                new_questions = await asyncio.to_thread(self.save_to_bank, key, generated)
+                added += self.add_to_pool(key, new_questions)
+            Logger.print("Question bank refill", key, "added", added, "pool size", len(pool))
+        except Exception as e:
+            print(f"Question bank refill failed for {key}: {e}")
+            traceback.print_exc()
+        return added
+
+    def add_to_pool(self, key: BankKey, questions: List[Dict]) -> int:
+        pool = self.pools.setdefault(key, deque())
+        hashes = self.pool_hashes.setdefault(key, set())
+        added = 0
+        for question in questions:
+            if question["hash"] in hashes:
+                continue
+            hashes.add(question["hash"])
+            pool.append(question)
+            added += 1
+        return added
+
+    def load_from_bank(self, key: BankKey, count: int, exclude_hashes: List[str]) -> List[Dict]:
+        """Samples stored questions that are not already in the warm pool."""
+        subject, topic, level = key
+        pipeline = [
+            {"$match": {"subject": subject, "topic": topic, "level": level,
+                        "hash": {"$nin": exclude_hashes}}},
+            {"$sample": {"size": count}},
+            {"$project": {"_id": 0, "question": 1, "options": 1, "answer": 1, "hash": 1}},
+        ]
+        return list(self.collection.aggregate(pipeline))
+
+    def save_to_bank(self, key: BankKey, questions: List[Dict]) -> List[Dict]:
+        """Stores newly generated questions, deduped against each other and the bank.
+
+        One ``find`` fetches the hashes already stored and one ``insert_many``
+        writes the rest; duplicates inserted concurrently by another worker are
+        rejected by the unique index and skipped.
+        """
+        subject, topic, level = key
+        entries: Dict[str, Dict] = {}
+        for question in questions:
+            if not self.is_valid(question):
+                continue
+            question_hash = self.question_hash(question)
+            if question_hash in entries:
+                continue
+            entries[question_hash] = {
+                "subject": subject,
+                "topic": topic,
+                "level": level,
+                "question": question["question"],
+                "options": question["options"],
+                "answer": question["answer"],
+                "hash": question_hash,
+                "createdAt": datetime.utcnow(),
+            }
+        if not entries:
+            return []
+
+        existing = self.collection.find(
+            {"subject": subject, "topic": topic, "level": level,
+             "hash": {"$in": list(entries)}},
+            {"_id": 0, "hash": 1},
+        )
+        for doc in existing:
+            entries.pop(doc["hash"], None)
+        if not entries:
+            return []
+
+        new_entries = list(entries.values())
+        try:
+            self.collection.insert_many(new_entries, ordered=False)
+            inserted = new_entries
+        except BulkWriteError as e:
+            failed = {err["index"] for err in e.details.get("writeErrors", [])}
+            inserted = [entry for i, entry in enumerate(new_entries) if i not in failed]
+        return [self.to_public(entry) for entry in inserted]
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index(
+            [("subject", 1), ("topic", 1), ("level", 1), ("hash", 1)], unique=True
+        )
+
+    @staticmethod
+    def is_valid(question: Optional[Dict]) -> bool:
+        return bool(
+            question
+            and question.get("question")
+            and isinstance(question.get("options"), list)
+            and len(question["options"]) >= 2
+            and question.get("answer")
+        )
+
+    @staticmethod
+    def to_public(question: Dict) -> Dict:
+        return {
+            "question": question["question"],
+            "options": question["options"],
+            "answer": question["answer"],
+            "hash": question["hash"],
+        }
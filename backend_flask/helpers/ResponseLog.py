@@ -0,0 +1,178 @@
+import os
+import gzip
+import json
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+from .DecimalEncoder import DecimalEncoder
+
+
+class ResponseLog:
+    """Append-only JSONL log of provider responses.
+
+    Records are queued by the request path and written by a background thread,
+    so a request never pays for serialization or disk I/O and nothing is kept in
+    process memory once written. The active file is rotated when it grows past
+    ``max_bytes`` or gets older than ``rotate_seconds``; rotated files are gzipped
+    when ``compress`` is set.
+
+    Each process writes its own ``<name>.<pid><ext>`` file, so web workers
+    sharing a log name never write to a file another worker has rotated away.
+    Whenever a file is opened, active files left by processes that have exited
+    are rotated like any other, and rotated files older than
+    ``retention_seconds`` are deleted.
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, file_name, **options):
+        """Returns the shared log for ``file_name`` so one thread owns each file."""
+        with cls._instances_lock:
+            if file_name not in cls._instances:
+                cls._instances[file_name] = cls(file_name, **options)
+            return cls._instances[file_name]
+
+    @classmethod
+    def close_all(cls):
+        """Flushes and stops every shared log (called on shutdown)."""
+        with cls._instances_lock:
+            for log in cls._instances.values():
+                log.close()
+
+    def __init__(self, file_name, max_bytes=50 * 1024 * 1024, rotate_seconds=24 * 60 * 60,
+                 compress=True, max_queue=10000, retention_seconds=30 * 24 * 60 * 60):
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.retention_seconds = retention_seconds
+        self.compress = compress
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._opened_at = 0.0
+
+    def write(self, record):
+        """Queues a record for the writer thread. Never blocks the caller."""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Flushes pending records and stops the writer thread."""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="response-log", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                self._write_line(json.dumps(record, cls=DecimalEncoder))
+            except Exception as e:
+                print(f"Error writing response log {self.path}: {e}")
+            # Flush once the burst is drained instead of after every line
+            if self.queue.empty() and self._file:
+                self._file.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write_line(self, line):
+        if self._file is None:
+            self._open()
+        elif self._should_rotate():
+            self._rotate()
+        self._file.write(line + "\n")
+
+    @property
+    def path(self):
+        """The file this process appends to."""
+        base, ext = os.path.splitext(self.file_name)
+        return f"{base}.{os.getpid()}{ext}"
+
+    def _open(self):
+        folder = os.path.dirname(self.file_name)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self._file = open(self.path, "a", encoding="utf8")
+        self._opened_at = time.time()
+        try:
+            self._clean_up()
+        except OSError as e:
+            print(f"Error cleaning up response logs for {self.file_name}: {e}")
+
+    @staticmethod
+    def _process_exists(pid):
+        if os.name == "nt":
+            # os.kill would terminate the process on Windows; leave its file alone
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _clean_up(self):
+        folder = os.path.dirname(self.file_name) or "."
+        base, ext = os.path.splitext(os.path.basename(self.file_name))
+        # <base>.<pid><ext> is active; anything after it marks a rotated file
+        pattern = re.compile(rf"{re.escape(base)}\.(\d+){re.escape(ext)}(\..+)?$")
+        now = time.time()
+        for name in os.listdir(folder):
+            match = pattern.match(name)
+            if not match:
+                continue
+            path = os.path.join(folder, name)
+            pid = int(match.group(1))
+            try:
+                if match.group(2) is None:
+                    if pid != os.getpid() and not self._process_exists(pid):
+                        self._archive(path)
+                elif self.retention_seconds and now - os.path.getmtime(path) > self.retention_seconds:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker got to it first
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_seconds) and time.time() - self._opened_at >= self.rotate_seconds
+
+    def _rotate(self):
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        self._archive(path)
+        self._open()
+
+    def _archive(self, path):
+        rotated = f"{path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as f_in, gzip.open(rotated + ".gz", "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.remove(rotated)
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator
+
+from fastapi import HTTPException, UploadFile
+
+CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Per-kind upload size limits in bytes, overridable from the environment
+UPLOAD_LIMITS = {
+    "image": int(os.getenv("MAX_IMAGE_UPLOAD_BYTES", str(15 * 1024 * 1024))),
+    "document": int(os.getenv("MAX_DOCUMENT_UPLOAD_BYTES", str(30 * 1024 * 1024))),
+    "audio": int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(25 * 1024 * 1024))),
+    "default": int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024))),
+}
+
+
+class SpooledUpload:
+    """An upload that has been streamed to a spool file and hashed.
+
+    The spool keeps at most ``CHUNK_SIZE`` bytes in memory and rolls over to a
+    temporary file on disk beyond that. Call ``close`` (or use ``async with``)
+    to discard it.
+    """
+
+    def __init__(self, filename, content_type, max_memory=CHUNK_SIZE):
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+        self.max_memory = max_memory
+        self.file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self.size = 0
+        self.sha256 = None
+
+    def open(self):
+        """Returns the spool rewound to the start, for streaming it onwards."""
+        self.file.seek(0)
+        return self.file
+
+    async def read_bytes(self) -> bytes:
+        """Loads the whole upload. Only for consumers that need it in memory (LLM calls)."""
+        self.file.seek(0)
+        return await asyncio.to_thread(self.file.read)
+
+    async def copy_to(self, path: str):
+        """Streams the upload to ``path`` chunk by chunk."""
+        def _copy():
+            self.file.seek(0)
+            with open(path, "wb") as out:
+                while True:
+                    chunk = self.file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+        await asyncio.to_thread(_copy)
+
+    def close(self):
+        self.file.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def upload_limit(kind: str) -> int:
+    return UPLOAD_LIMITS.get(kind, UPLOAD_LIMITS["default"])
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large (limit {limit // (1024 * 1024)} MB)")
+
+
+async def iter_upload(upload: UploadFile, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yields the content of ``upload`` in fixed-size chunks."""
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def spool_chunks(chunks: AsyncIterator[bytes], spooled: SpooledUpload, kind: str = "default") -> AsyncIterator[bytes]:
+    """Writes ``chunks`` to ``spooled`` and passes each one on to the caller.
+
+    Lets a consumer process an upload while it is still arriving. The content is
+    hashed on the way through and rejected with 413 as soon as it exceeds the
+    limit for ``kind``; ``spooled.sha256`` is set once the stream is exhausted.
+    """
+    limit = upload_limit(kind)
+    hasher = hashlib.sha256()
+    async for chunk in chunks:
+        spooled.size += len(chunk)
+        if spooled.size > limit:
+            raise _too_large(limit)
+        hasher.update(chunk)
+        if spooled.size > spooled.max_memory:
+            # Spool has rolled over to disk; keep file I/O off the event loop
+            await asyncio.to_thread(spooled.file.write, chunk)
+        else:
+            spooled.file.write(chunk)
+        yield chunk
+    spooled.sha256 = hasher.hexdigest()
+
+
+async def stream_upload(upload: UploadFile, kind: str = "default", chunk_size: int = CHUNK_SIZE) -> SpooledUpload:
+    """Streams ``upload`` into a ``SpooledUpload`` in fixed-size chunks.
+
+    The content is hashed while it is read. The upload is rejected with 413 as
+    soon as it exceeds the limit for ``kind``, before the rest is read.
+    """
+    limit = upload_limit(kind)
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(limit)
+
+    spooled = SpooledUpload(upload.filename, upload.content_type, max_memory=chunk_size)
+    try:
+        async for _ in spool_chunks(iter_upload(upload, chunk_size), spooled, kind):
+            pass
+    except BaseException:
+        spooled.close()
+        raise
+    return spooled
@@ -4,7 +4,7 @@ import traceback
 import anthropic
 from certifi import contents
 from flask import jsonify
-from helpers.Utils import Utils
+from helpers.ImageProcessor import encode_image_base64
 from anthropic.types.text_block import TextBlock
 from anthropic.types.tool_use_block import ToolUseBlock
 from dotenv import load_dotenv
@@ -21,9 +21,6 @@ CLAUDE_API_KEY = os.getenv("CLAUDE_AI_KEY")
 class ClaudeAI:
     """Handles interactions with Claude AI API."""
 
-    file_name = "claude_response.json"
-    fullResponseHistory = Utils.load_json(file_name, True)
-
     models = {
         "claude-3-haiku": "claude-3-haiku-20240307",
         "claude-3-5-sonnet": "claude-3-5-sonnet-20240620",
@@ -48,8 +45,7 @@ class ClaudeAI:
             image_content = []
 
             if image_file:
-                base64_image = await self.encode_image(image_file)
-                media_type = self.get_mime_type(image_file.filename)  
+                base64_image, media_type = await self.encode_image(image_file)
                 image_content.append({
                     "type": "image",
                     "source": {
@@ -111,8 +107,7 @@ class ClaudeAI:
             image_content=[]
             if image_file:
                 # Convert uploaded file to Base64
-                base64_image = await self.encode_image(image_file)
-                media_type = self.get_mime_type(image_file.filename)  
+                base64_image, media_type = await self.encode_image(image_file)
                 image_content.append({
                     "type": "image",
                     "source": {
@@ -155,9 +150,9 @@ class ClaudeAI:
 
     
     async def encode_image(self,image_file):
-        """Convert an image file to Base64 format."""
+        """Downscale an uploaded image for Claude and return (base64, media_type)."""
         image_bytes = await image_file.read()
-        return base64.b64encode(image_bytes).decode("utf-8")
+        return await encode_image_base64(image_bytes, self.get_mime_type(image_file.filename), "claude")
 
     def load_prompt_template(self,system):
         with open(system, "r") as file:
@@ -11,17 +11,17 @@ sys.path.append(r"../")
 import anthropic
 from flask import jsonify
 import traceback
-from helpers.Utils import Utils
+from helpers.ResponseLog import ResponseLog
 from anthropic.types.text_block import TextBlock
 from anthropic.types.tool_use_block import ToolUseBlock
 
 
 class ClaudeAI2:
 
-    file_name = "claud_response-2024-07-23.json"
-    fullResponseHistory = Utils.load_json(file_name, True)  # list()
-    #file_name = "claud_response-2024-07-23.json"
-    #fullResponseHistory = Utils.load_json(file_name, True)  # list()
+    file_name = os.getenv("CLAUDE_RESPONSE_LOG", "logs/claude_responses.jsonl")
+    response_log = ResponseLog.get(
+        file_name, compress=os.getenv("CLAUDE_RESPONSE_LOG_COMPRESS", "True") == "True"
+    )
 
     dummy_assistant = {
         "role": "assistant",
@@ -69,8 +69,7 @@ class ClaudeAI2:
             )
             # print(message.content)
             print(message)
-            ClaudeAI2.fullResponseHistory.append(message.to_dict())
-            Utils.save_json(_self.file_name, ClaudeAI2.fullResponseHistory)
+            ClaudeAI2.response_log.write(message.to_dict())
             #print(message)
             #ClaudeAI2.fullResponseHistory.append(message.to_dict())
             #Utils.save_json(_self.file_name, ClaudeAI2.fullResponseHistory)
@@ -7,6 +7,8 @@ import google.generativeai as genai
 from pathlib import Path
 from dotenv import load_dotenv
 from helpers.Utils import Utils
+from providers.ModelCatalog import ModelCatalog
+from helpers.ImageProcessor import encode_image_base64
 import json 
 from google.api_core.exceptions import ResourceExhausted
 import markdown
@@ -14,9 +16,23 @@ import markdown
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-genai.configure(api_key=GEMINI_API_KEY)
+# genai.configure is done once by providers.registry.get_genai()
 #client= genai.Client(api_key=GEMINI_API_KEY)
-m23 = genai.list_models()
+
+
+def fetch_gemini_models():
+    """Lists the Gemini models that support content generation (network call)."""
+    return [
+        {"model": m.name.split("/")[-1], "displayName": m.display_name, "provider": "gemini"}
+        for m in genai.list_models()
+        if "generateContent" in m.supported_generation_methods
+    ]
+
+
+def load_stored_gemini_models():
+    """Falls back to the models configured in the Mongo ``models`` collection."""
+    from database.db import models
+    return list(models.find({"provider": "gemini"}, {"_id": 0}))
 
 
 class GeminiAI:
@@ -26,6 +42,14 @@ class GeminiAI:
         "gemini-1.5-pro": "gemini-1.5-pro"
     }
 
+    default_model = "gemini-1.5-pro"
+
+    catalog = ModelCatalog(
+        fetch_gemini_models,
+        load_stored_gemini_models,
+        ttl=int(os.getenv("MODEL_CATALOG_TTL", "3600")),
+    )
+
     generation_config = {
         "temperature": 0.7,
         "top_p": 0.95,
@@ -64,15 +88,16 @@ class GeminiAI:
         return markdown.markdown(text)
 
     async def get_data_stream(self, system, data):
-        # for model in m23:
-        #     print(model.name, model.supported_generation_methods)
-
         try:
             user_message = data.get("message", "").strip()
             history = data.get("history", [])
             temperature = data.get("temperature", 0.7)
             image_file = data.get("image")
-            model = data.get("model", "gemini-1.5-pro")
+            model = data.get("model") or self.default_model
+            # Only consult the cached catalog here; it refreshes in the background
+            if self.catalog.has_model(model) is False:
+                print(f"Unknown Gemini model {model}, using {self.default_model}")
+                model = self.default_model
             
             messages = self.normalize_messages(history.copy())
             # messages = history.copy()
@@ -87,8 +112,7 @@ class GeminiAI:
                     "parts": [{"text": system}]
                 })
             if image_file:
-                base64_image = await self.encode_image(image_file)
-                media_type = self.get_mime_type(image_file.filename)
+                base64_image, media_type = await self.encode_image(image_file)
                 image_content.append({
                     "inline_data": {
                         "mime_type": media_type,
@@ -154,9 +178,9 @@ class GeminiAI:
             return {"error": str(e)}
 
     async def encode_image(self, image_file):
-        """Convert an image file to Base64 format."""
+        """Downscale an uploaded image for Gemini and return (base64, media_type)."""
         image_bytes = await image_file.read()
-        return base64.b64encode(image_bytes).decode("utf-8")
+        return await encode_image_base64(image_bytes, self.get_mime_type(image_file.filename), "gemini")
 
     def get_mime_type(self, filename):
         """Detect the correct MIME type based on file extension."""
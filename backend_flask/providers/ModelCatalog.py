@@ -0,0 +1,69 @@
+import asyncio
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+
+class ModelCatalog:
+    """Lazily loaded, TTL-cached list of models a provider offers.
+
+    Nothing is fetched at import time. The first caller of ``get`` loads the
+    catalog; afterwards ``snapshot`` serves the cached copy and refreshes it in
+    the background once it is older than ``ttl`` seconds. If the provider cannot
+    be reached, ``fallback`` (e.g. the Mongo ``models`` collection) is used.
+    """
+
+    def __init__(self, fetch: Callable[[], List[Dict]], fallback: Callable[[], List[Dict]],
+                 ttl: int = 60 * 60):
+        self.fetch = fetch
+        self.fallback = fallback
+        self.ttl = ttl
+        self.models: Optional[List[Dict]] = None
+        self.loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def is_stale(self) -> bool:
+        return self.models is None or time.time() - self.loaded_at >= self.ttl
+
+    def snapshot(self) -> Optional[List[Dict]]:
+        """Returns the cached catalog without waiting, scheduling a refresh if stale."""
+        if self.is_stale():
+            self.schedule_refresh()
+        return self.models
+
+    async def get(self) -> List[Dict]:
+        """Returns the catalog, loading it on first use."""
+        if self.models is None:
+            await self.refresh()
+        elif self.is_stale():
+            self.schedule_refresh()
+        return self.models or []
+
+    def schedule_refresh(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        try:
+            self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            # No running loop (e.g. called from a script); the next get() will load it
+            pass
+
+    async def refresh(self) -> None:
+        try:
+            models = await asyncio.to_thread(self.fetch)
+        except Exception as e:
+            print(f"Error fetching model catalog, using fallback: {e}")
+            try:
+                models = await asyncio.to_thread(self.fallback)
+            except Exception:
+                traceback.print_exc()
+                return
+        self.models = models
+        self.loaded_at = time.time()
+
+    def has_model(self, name: str) -> Optional[bool]:
+        """True/False if the model is (not) in the cached catalog, None if not loaded yet."""
+        models = self.snapshot()
+        if not models:
+            return None
+        return any(m.get("model") == name for m in models)
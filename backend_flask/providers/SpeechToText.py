@@ -0,0 +1,60 @@
+import asyncio
+import hashlib
+import json
+import os
+
+from providers.registry import get_genai, get_gemini_semaphore
+
+
+class SpeechToText:
+    """Speech-to-text backend interface: transcribes one clip or segment."""
+
+    name = "base"
+
+    async def transcribe(self, audio: bytes, mime_type: str) -> str:
+        raise NotImplementedError
+
+
+class LocalSpeechToText(SpeechToText):
+    """Deterministic offline stand-in for tests and local development.
+
+    Returns the transcript registered for the audio's SHA-256 (``transcripts``
+    or the JSON file in LOCAL_STT_TRANSCRIPTS), otherwise a fixed description of
+    the audio, so the same input always yields the same text.
+    """
+
+    name = "local"
+
+    def __init__(self, transcripts: dict = None):
+        if transcripts is None:
+            path = os.getenv("LOCAL_STT_TRANSCRIPTS")
+            transcripts = {}
+            if path and os.path.exists(path):
+                with open(path) as f:
+                    transcripts = json.load(f)
+        self.transcripts = transcripts
+
+    async def transcribe(self, audio: bytes, mime_type: str) -> str:
+        digest = hashlib.sha256(audio).hexdigest()
+        return self.transcripts.get(digest, f"[{mime_type} audio, {len(audio)} bytes, {digest[:12]}]")
+
+
+class GeminiSpeechToText(SpeechToText):
+    """Transcribes audio with a Gemini model, under the shared Gemini concurrency limit."""
+
+    name = "gemini"
+    PROMPT = ("Transcribe this audio verbatim. It is a student asking a study question. "
+              "Return only the transcript, with math written in plain notation.")
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or os.getenv("GEMINI_STT_MODEL", "gemini-1.5-flash")
+
+    async def transcribe(self, audio: bytes, mime_type: str) -> str:
+        model = get_genai().GenerativeModel(self.model_name)
+        async with get_gemini_semaphore():
+            response = await asyncio.to_thread(
+                model.generate_content,
+                [self.PROMPT, {"mime_type": mime_type, "data": audio}],
+                generation_config={"temperature": 0},
+            )
+        return response.text
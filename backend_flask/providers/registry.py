@@ -0,0 +1,66 @@
+"""Lazily built, shared AI provider instances.
+
+Provider modules pull in heavy SDKs and create API clients, so nothing here is
+imported until a route first needs it. The getters double as FastAPI
+dependencies: ``gemini_ai: GeminiAI = Depends(get_gemini_ai)``.
+"""
+import asyncio
+import os
+import threading
+from functools import lru_cache
+
+_genai_lock = threading.Lock()
+_genai_configured = False
+
+
+def get_genai():
+    """Returns the ``google.generativeai`` module, configured exactly once."""
+    global _genai_configured
+    import google.generativeai as genai
+
+    if not _genai_configured:
+        with _genai_lock:
+            if not _genai_configured:
+                api_key = os.getenv("GEMINI_API_KEY")
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY environment variable not set")
+                genai.configure(api_key=api_key)
+                _genai_configured = True
+    return genai
+
+
+@lru_cache(maxsize=None)
+def get_gemini_semaphore() -> asyncio.Semaphore:
+    """Caps concurrent Gemini calls per worker (GEMINI_MAX_CONCURRENCY)."""
+    return asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+
+
+@lru_cache(maxsize=None)
+def get_claude_ai():
+    from providers.ClaudeAI import ClaudeAI
+    return ClaudeAI()
+
+
+@lru_cache(maxsize=None)
+def get_claude_ai2():
+    from providers.ClaudeAI2 import ClaudeAI2
+    return ClaudeAI2()
+
+
+@lru_cache(maxsize=None)
+def get_gemini_ai():
+    get_genai()
+    from providers.Gemini import GeminiAI
+    return GeminiAI()
+
+
+@lru_cache(maxsize=None)
+def get_speech_to_text():
+    """Speech-to-text backend selected by STT_BACKEND (``gemini`` or ``local``)."""
+    from providers.SpeechToText import GeminiSpeechToText, LocalSpeechToText
+
+    backends = {"gemini": GeminiSpeechToText, "local": LocalSpeechToText}
+    backend = os.getenv("STT_BACKEND", "gemini").lower()
+    if backend not in backends:
+        raise ValueError(f"Unknown STT_BACKEND '{backend}'")
+    return backends[backend]()
@@ -1,6 +1,6 @@
 from tempfile import template
-from fastapi import APIRouter, HTTPException, Form, UploadFile,Request
-from database.db import models
+from fastapi import APIRouter, HTTPException, Form, UploadFile,Request, Depends
+from database import db
 from fastapi.responses import StreamingResponse ,JSONResponse
 from helpers.Logger2 import Logger
 import json
@@ -10,16 +10,9 @@ from pathlib import Path
 import json
 import os
 import traceback
-from providers.ClaudeAI import ClaudeAI
-from providers.ClaudeAI2 import ClaudeAI2
-
-from providers.Gemini import GeminiAI
+from providers.registry import get_claude_ai, get_gemini_ai
 # models_file_path = Path("models.json")
 
-claude_ai = ClaudeAI()
-claude_ai_old = ClaudeAI2()
-gemini_ai = GeminiAI()
-
 
 is_llm_enabled = os.getenv("LLM_ENABLED") == "True"
 
@@ -54,7 +47,8 @@ async def generate_claude(
     message: str = Form(...),
     history: str = Form("[]"),
     image: UploadFile = None,
-    model: str = Form("claude-3")
+    model: str = Form("claude-3"),
+    claude_ai=Depends(get_claude_ai)
 ):
     return await generate_ai_response(claude_ai, message, history, image, model)
 
@@ -67,7 +61,9 @@ async def generate_claude(
 #api route for gemini 
 @router.post("/gemini/{role}")
 async def generate_gemini(
-    role: str, request: Request
+    role: str, request: Request,
+    claude_ai=Depends(get_claude_ai),
+    gemini_ai=Depends(get_gemini_ai)
 ):
     """Handles Gemini API calls with correct formatting."""
     request_data = await request.form()
@@ -104,14 +100,15 @@ async def generate_gemini(
     message: str = Form(...),
     history: str = Form("[]"),
     image: UploadFile = None,
-    model: str = Form("chatgpt-4")
+    model: str = Form("chatgpt-4"),
+    gemini_ai=Depends(get_gemini_ai)
 ):
     """Handles Gemini API calls with correct formatting."""
     return await generate_ai_response(gemini_ai, message, history, image, model)
 
 
 @router.post("/claude/{role}")
-async def stream_chat(role:str,request: Request):
+async def stream_chat(role:str,request: Request, claude_ai=Depends(get_claude_ai)):
     request_data = await request.form()
 
     history = request_data.get("history")
@@ -140,7 +137,7 @@ async def stream_chat(role:str,request: Request):
 
 
 @router.post("/generate_claude/{role}")
-async def generate_claude(role: str, request: Request):
+async def generate_claude(role: str, request: Request, claude_ai=Depends(get_claude_ai)):
     """Generates Claude responses based on user role and form data."""
 
     form_data: Dict[str, Any] = await request.form()
@@ -159,7 +156,7 @@ async def generate_claude(role: str, request: Request):
         
         
         if is_llm_enabled :
-            ai_response = await ClaudeAI().get_data(
+            ai_response = await claude_ai.get_data(
                 system=system_prompt,
                 data={
                     "message": message,
@@ -203,7 +200,7 @@ async def get_available_model():
     try:
 
         # print(models)
-        model_list = models.find({}, {"_id": 0}).to_list(length=None) # Exclude _id from response
+        model_list = db.models.find({}, {"_id": 0}).to_list(length=None) # Exclude _id from response
         # print(model_list)
         return model_list
         # Read and load the JSON file
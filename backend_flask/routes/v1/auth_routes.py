@@ -1,10 +1,8 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from database.db import users_collection
+from database import db
 from datetime import datetime, timedelta
-import jwt
-
-SECRET_KEY = "your_secret_key_here"
+from helpers.Auth import issue_token
 
 class LoginRequest(BaseModel):
     loginId: str
@@ -37,17 +35,11 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/login")
 async def login(request: LoginRequest):
     try:
-        user = users_collection.find_one({"loginId": request.loginId})
+        user = db.users_collection.find_one({"loginId": request.loginId})
         if not user or request.password != user["password"]:
             raise HTTPException(status_code=401, detail="Invalid credentials")
-        print(jwt.__file__)
-        print(dir(jwt))
         try:
-            session_token = jwt.encode(
-                {"loginId": request.loginId, "exp": datetime.utcnow() + timedelta(days=1)},
-                SECRET_KEY,
-                algorithm="HS256",
-            )
+            session_token = issue_token({"loginId": request.loginId})
         except Exception as jwt_error:
             print(jwt_error)
             raise HTTPException(status_code=300, detail=f"JWT encoding failed: {str(jwt_error)}")
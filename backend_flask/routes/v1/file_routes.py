@@ -4,6 +4,8 @@ from fastapi.responses import FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 import os
+from helpers.BlobStore import store_local
+from helpers.UploadStream import stream_upload
 
 UPLOAD_DIR = "uploads"
 
@@ -13,11 +15,13 @@ router = APIRouter(prefix="/files", tags=["Files"])
 @router.post("/upload")
 async def upload_file(request:Request, file: UploadFile = File(...)):
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        async with await stream_upload(file) as upload:
+            # Stored under its content hash, so identical uploads share one file
+            stored_name, deduplicated = await store_local(UPLOAD_DIR, upload)
         print(request.base_url)
-        return {"filename": file.filename, "url": f"{request.base_url}/uploads/{file.filename}"}
+        return {"filename": file.filename, "url": f"{request.base_url}/uploads/{stored_name}", "sha256": upload.sha256}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -34,20 +38,17 @@ async def upload_image(request:Request, file: UploadFile = File(...)):
     
     try:
         print(file)
-        # Save the file in the "uploads" directory
-        if not os.path.exists(UPLOAD_DIR):
-            os.makedirs(UPLOAD_DIR) 
-        new_filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}{os.path.splitext(file.filename)[1]}"
-
-        file_path = os.path.join(UPLOAD_DIR, new_filename)
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
+        # Save the file in the "uploads" directory under its content hash
+        async with await stream_upload(file, "image") as upload:
+            new_filename, deduplicated = await store_local(UPLOAD_DIR, upload)
         print(request.base_url)
         # Generate a URL to access the file
         file_url = f"{request.base_url}uploads/{new_filename}"
 
-        return JSONResponse(content={"filename": file.filename, "url": file_url})
+        return JSONResponse(content={"filename": file.filename, "url": file_url, "sha256": upload.sha256})
     
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(content={"error": str(e) + "here"}, status_code=500)
 
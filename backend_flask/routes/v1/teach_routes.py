@@ -1,6 +1,6 @@
 
 # done by himanshi
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Depends
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from typing import List, Optional
@@ -8,6 +8,8 @@ import aiohttp
 import asyncio
 import os
 #from utils.gemini_helper import generate_gemini_response
+from helpers.JobQueue import job_handler
+from routes.v2.jobs import get_job_queue, submitted
 
 load_dotenv()
 
@@ -104,14 +106,7 @@ async def topics(subject: str):
         raise HTTPException(status_code=400, detail="Invalid subject")
     return [{"id": idx + 1, "name": topic} for idx, topic in enumerate(topics_by_subject[subject])]
 
-@router.post("/teachtopic")
-async def teach_topic_route(request: TeachTopicRequest):
-    subject = request.subject
-    topic = request.topic
-
-    if not subject or not topic:
-        raise HTTPException(status_code=400, detail="Subject and topic are required")
-
+async def teach_topic(subject: str, topic: str):
     prompt1 = f"""
 You are Aanya, an expert AI tutor specialized in teaching {subject}.
 Please provide a comprehensive lesson on {topic} within {subject}. Your response should be tailored for a student in middle or high school.
@@ -132,6 +127,25 @@ The content should be similar in alignments and spacing as in any real life text
     content = await generate_gemini_response(prompt1)
     return {"subject": subject, "topic": topic, "content": content}
 
+@job_handler("teach_topic")
+async def teach_topic_job(payload, progress):
+    return await teach_topic(payload["subject"], payload["topic"])
+
+@router.post("/teachtopic")
+async def teach_topic_route(request: TeachTopicRequest):
+    if not request.subject or not request.topic:
+        raise HTTPException(status_code=400, detail="Subject and topic are required")
+    return await teach_topic(request.subject, request.topic)
+
+@router.post("/teachtopic/jobs")
+async def teach_topic_job_route(request: TeachTopicRequest, job_queue=Depends(get_job_queue)):
+    """Queues a lesson as a background job and returns 202 with its job id;
+    the same subject and topic map to the same job."""
+    if not request.subject or not request.topic:
+        raise HTTPException(status_code=400, detail="Subject and topic are required")
+    job = await job_queue.submit("teach_topic", {"subject": request.subject, "topic": request.topic})
+    return submitted(job)
+
 @router.post("/question")
 async def answer_question_route(request: AnswerQuestionRequest):
     subject = request.subject
@@ -2,24 +2,28 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
-from database.db import new_users_collection
-import jwt as pyjwt
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import db
+from helpers.Auth import issue_token, get_password_hasher
+from helpers.EmailOutbox import EmailOutbox, SmtpSession
+import asyncio
 import random
 import string
 import os
-import aiosmtplib
-from email.message import EmailMessage
 
 router = APIRouter(prefix="/v2/auth", tags=["Auth"])
 
-ALGORITHM = "HS256"
-
-SECRET_KEY = os.getenv("SECRET_KEY")
 MAIL_SERVER = os.getenv("MAIL_SERVER")
 MAIL_PORT = os.getenv("MAIL_PORT")
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
 MAIL_FROM = os.getenv("MAIL_FROM")
+MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "True") == "True"
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "False") == "True"
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "30"))
+
+email_outbox = None
 
 
 # === Pydantic Schemas ===
@@ -55,8 +59,49 @@ def generate_otp(length: int = 6) -> str:
     return "".join(random.choice(characters) for _ in range(length))
 
 
+def get_email_outbox() -> EmailOutbox:
+    """This worker's outbox; created in ``on_startup``."""
+    return email_outbox
+
+
+async def on_startup():
+    """Starts the OTP email senders. Called from the app lifespan after the async db is up."""
+    global email_outbox
+    email_outbox = EmailOutbox(
+        db.email_outbox_collection,
+        lambda: SmtpSession(
+            MAIL_SERVER, int(MAIL_PORT or 465), MAIL_USERNAME, MAIL_PASSWORD,
+            use_tls=MAIL_USE_TLS, start_tls=MAIL_STARTTLS, timeout=MAIL_TIMEOUT,
+        ),
+        sender=MAIL_FROM,
+        concurrency=int(os.getenv("MAIL_SENDERS", "2")),
+        # Longer than a send that times out, reconnects and times out again
+        lease_seconds=float(os.getenv("MAIL_LEASE_SECONDS", str(5 * MAIL_TIMEOUT))),
+        max_attempts=int(os.getenv("MAIL_MAX_ATTEMPTS", "6")),
+    )
+    try:
+        await email_outbox.ensure_indexes()
+    except Exception as e:
+        print(f"Error creating email outbox indexes: {e}")
+    try:
+        # Signup relies on this index instead of checking for the email first,
+        # so without it duplicate accounts would be accepted; refuse to start
+        await asyncio.to_thread(db.new_users_collection.create_index, "email", unique=True)
+    except Exception as e:
+        raise RuntimeError(
+            f"Cannot create the unique index on users.email ({e}). If existing accounts share an "
+            "email, run scripts/dedupe_user_emails.py --apply first."
+        ) from e
+    email_outbox.start()
+
+
+async def on_shutdown():
+    if email_outbox:
+        await email_outbox.stop()
+
+
 async def send_verification_email_otp(email: EmailStr, otp: str):
-    """Sends an email containing the OTP for verification."""
+    """Queues an email containing the OTP for verification; delivery happens in the background."""
     subject = "Verify your email address"
     body = f"""
     <html>
@@ -72,37 +117,50 @@ async def send_verification_email_otp(email: EmailStr, otp: str):
     </html>
     """
 
-    message = EmailMessage()
-    message["From"] = MAIL_FROM
-    message["To"] = email
-    message["Subject"] = subject
-    message.set_content("This is an HTML email.")
-    message.add_alternative(body, subtype="html")
-
     try:
-        smtp = aiosmtplib.SMTP(hostname=MAIL_SERVER, port=int(MAIL_PORT), use_tls=True)
-        await smtp.connect()
-        await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
-        await smtp.send_message(message)
-        await smtp.quit()
+        await get_email_outbox().enqueue(email, subject, "This is an HTML email.", html=body)
     except Exception as e:
-        print(f"Error sending email: {e}")
+        print(f"Error queueing email: {e}")
         raise HTTPException(status_code=500, detail="Failed to send verification email")
 
 
 
 
 
+async def insert_user(new_user: dict) -> bool:
+    """Creates the user in one round trip; ``False`` if the email is taken
+    (the unique email index rejects the insert)."""
+    try:
+        await asyncio.to_thread(db.new_users_collection.insert_one, new_user)
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def consume_otp(email: str, otp: str):
+    """Marks the user verified if ``otp`` matches and has not expired, in one
+    round trip. Returns the verified user, or ``None`` if nothing matched."""
+    now = datetime.utcnow()
+    return await asyncio.to_thread(
+        db.new_users_collection.find_one_and_update,
+        {"email": email, "otp": otp, "otp_expiry": {"$gte": now}},
+        {
+            "$set": {
+                "is_verified": True,
+                "otp": None,
+                "otp_expiry": None,
+                "updated_at": now,
+            }
+        },
+        projection={"userId": 1, "email": 1, "fullName": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
 # === Routes ===
 @router.post("/signup")
 async def register_user(request: SignupRequest):
     try:
-        # Check if user already exists
-        if new_users_collection.find_one({"email": request.email}):
-            raise HTTPException(
-                status_code=400, detail="User with this email already exists"
-            )
-
         otp = generate_otp()
         otp_expiry = datetime.utcnow() + timedelta(
             minutes=15
@@ -113,7 +171,7 @@ async def register_user(request: SignupRequest):
             "userId": request.userId,
             "fullName": request.fullName,
             "email": request.email,
-            "password": request.password,  # Store the plain password temporarily
+            "password": await get_password_hasher().hash(request.password),
             "role": request.role,
             "handle":request.handle,
             "is_verified": False,  # Add is_verified field
@@ -122,11 +180,19 @@ async def register_user(request: SignupRequest):
             "createdAt": datetime.utcnow(),
         }
 
-        new_users_collection.insert_one(new_user)
+        if not await insert_user(new_user):
+            raise HTTPException(
+                status_code=400, detail="User with this email already exists"
+            )
 
-        await send_verification_email_otp(
-            request.email, otp
-        )  
+        try:
+            await send_verification_email_otp(
+                request.email, otp
+            )
+        except Exception:
+            # Without a queued OTP the account could never be verified; let the user sign up again
+            await asyncio.to_thread(db.new_users_collection.delete_one, {"_id": new_user["_id"]})
+            raise
 
         return {
             "message": f"OTP sent to {request.email}. Please verify within 15 minutes.",
@@ -143,24 +209,29 @@ async def register_user(request: SignupRequest):
 @router.post("/login")
 async def login_user(request: LoginRequest):
     try:
-        user = new_users_collection.find_one({"email": request.email})
-        if not user or user["password"] != request.password:  # Check plain password
+        # pymongo blocks, so its calls run on a thread rather than the event loop
+        user = await asyncio.to_thread(db.new_users_collection.find_one, {"email": request.email})
+        matches, new_hash = await get_password_hasher().verify(
+            request.password, user["password"] if user else None
+        )
+        if not matches:
             raise HTTPException(
                 status_code=401, detail="Invalid email or password"
             )
+        if new_hash:
+            # Upgrade plaintext or low-cost rows, unless the password changed meanwhile
+            await asyncio.to_thread(
+                db.new_users_collection.update_one,
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": new_hash}},
+            )
 
         if not user["is_verified"]:
             raise HTTPException(
                 status_code=401, detail="Email not verified. Please verify your email."
             )
 
-        token_payload = {
-            "userId": user["userId"],
-            "email": user["email"],
-            "exp": datetime.utcnow() + timedelta(days=1),
-        }
-
-        session_token = pyjwt.encode(token_payload, SECRET_KEY, algorithm=ALGORITHM)
+        session_token = issue_token({"userId": user["userId"], "email": user["email"]})
 
         return {
             "message": "Login successful",
@@ -183,35 +254,26 @@ async def verify_otp(verification_data: VerifyOTPRequest):
     """
     Verifies the OTP entered by the user.
     """
-    user = new_users_collection.find_one({"email": verification_data.email})
-    if not user:
-        raise HTTPException(
-            status_code=444, detail="User not found with this email"
-        )  # Changed to 444
+    updated_user = await consume_otp(verification_data.email, verification_data.otp)
+
+    if not updated_user:
+        # Failure path only: look the user up to report why
+        user = await asyncio.to_thread(
+            db.new_users_collection.find_one,
+            {"email": verification_data.email}, {"otp": 1, "otp_expiry": 1}
+        )
+        if not user:
+            raise HTTPException(
+                status_code=444, detail="User not found with this email"
+            )  # Changed to 444
 
-    if user["otp"] != verification_data.otp:
-        raise HTTPException(status_code=400, detail="Invalid OTP")
+        if user["otp"] != verification_data.otp:
+            raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    if datetime.utcnow() > user["otp_expiry"]:
         raise HTTPException(
             status_code=408, detail="OTP has expired. Please request a new one."
         )  # Changed to 408
 
-    new_users_collection.update_one(
-        {"email": verification_data.email},
-        {
-            "$set": {
-                "is_verified": True,
-                "otp": None,
-                "otp_expiry": None,
-                "updated_at": datetime.utcnow(),
-            }
-        },
-    )
-    updated_user = new_users_collection.find_one(
-        {"email": verification_data.email}
-    )  # get the updated user
-
     return {
         "message": "Email verified successfully!",
         "user": {
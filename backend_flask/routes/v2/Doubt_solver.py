@@ -1,41 +1,26 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Depends, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import os
-import fitz
-import google.generativeai as genai
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from datetime import datetime
-import base64
-import io
 from typing import Optional
 import random
-import requests
+from database import db
+from database.db import get_blob_store
+from helpers.UploadStream import SpooledUpload, stream_upload, iter_upload, spool_chunks
+from helpers.AudioStream import transcribe_stream
+from helpers.PdfExtractor import ensure_pdf_indexes, extract_pdf, textless_pages, rasterize_pages
+from helpers.DocumentSolver import split_into_questions, scanned_page_chunks, solve_chunks, merge_solutions
+import asyncio
+import json
+from helpers.JobQueue import JobQueue, job_handler
+from routes.v2.jobs import get_job_queue, submitted
+from bson import ObjectId
+from providers.registry import get_genai, get_gemini_semaphore, get_speech_to_text
+from helpers.ImageProcessor import encode_image_base64
 
 router = APIRouter(prefix="/doubt", tags=["Doubt Solver"])
 
-# Load environment variables
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-MONGODB_URI = os.getenv("MONGO_URI")
-
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable not set")
-if not MONGODB_URI:
-    raise ValueError("MONGODB_URI environment variable not set")
-
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Initialize MongoDB connection with Motor (async driver)
-client = AsyncIOMotorClient(MONGODB_URI)
-db = client["doubt_solver"]
-# Use Motor's async GridFS implementation
-fs_bucket = AsyncIOMotorGridFSBucket(db)
-
-# Create collections
-uploads_collection = db.uploads
-solutions_collection = db.solutions
-conversation_collection = db.conversations
-
 # Pydantic models
 class TextRequest(BaseModel):
     text: str
@@ -43,18 +28,17 @@ class TextRequest(BaseModel):
 class SolutionResponse(BaseModel):
     solution: str
     
-@router.on_event("startup")
-async def startup_db_client():
+async def on_startup():
+    """Called from the app lifespan once the shared motor client exists."""
     try:
-        await client.admin.command('ping')
+        await db.async_client.admin.command('ping')
         print("Connected to MongoDB!")
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
-        
-@router.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
-    print("MongoDB connection closed")
+    try:
+        await ensure_pdf_indexes(db.pdf_text_collection)
+    except Exception as e:
+        print(f"Error creating PDF text indexes: {e}")
 
 # List of follow-up questions based on subject areas
 follow_up_questions = {
@@ -89,9 +73,9 @@ follow_up_questions = {
 }
 
 # Helper function to generate solution using Gemini API
-async def generate_solution(prompt, file_content=None, file_type=None, subject_hint="general"):
+async def generate_solution(prompt, file_content=None, file_type=None, subject_hint="general", follow_up=True, images=None):
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
+        model = get_genai().GenerativeModel('gemini-1.5-flash')
         
         # Prepare content parts based on what's available
         content_parts = [prompt]
@@ -100,9 +84,10 @@ async def generate_solution(prompt, file_content=None, file_type=None, subject_h
         if file_content and file_type:
             if file_type.startswith('image/'):
                 # For images, we need to handle them differently
+                image_data, image_type = await encode_image_base64(file_content, file_type, "gemini")
                 content_parts.append({
-                    "mime_type": file_type,
-                    "data": base64.b64encode(file_content).decode('utf-8')
+                    "mime_type": image_type,
+                    "data": image_data
                 })
             else:
                 # For text documents, just add the content
@@ -114,6 +99,11 @@ async def generate_solution(prompt, file_content=None, file_type=None, subject_h
                         content_parts.append("Unable to decode document content")
                 else:
                     content_parts.append(f"Document content: {file_content}")
+
+        # Rendered pages of scanned documents, sent as images
+        for image in images or []:
+            image_data, image_type = await encode_image_base64(image, "image/png", "gemini")
+            content_parts.append({"mime_type": image_type, "data": image_data})
         
         # Add instructions to include follow-up question at the end
         if "math" in prompt.lower() or "calculate" in prompt.lower() or "equation" in prompt.lower() or "integral" in prompt.lower():
@@ -125,20 +115,22 @@ async def generate_solution(prompt, file_content=None, file_type=None, subject_h
         else:
             subject = "general"
             
-        # Select a random follow-up question from the appropriate category
-        follow_up = random.choice(follow_up_questions[subject])
-        
         # Add instruction to include follow-up question
-        enhanced_prompt = f"{prompt}\n\nAfter providing the solution, end with a natural follow-up question like: '{follow_up}'"
-        content_parts[0] = enhanced_prompt
+        if follow_up:
+            # Select a random follow-up question from the appropriate category
+            follow_up_question = random.choice(follow_up_questions[subject])
+            content_parts[0] = f"{prompt}\n\nAfter providing the solution, end with a natural follow-up question like: '{follow_up_question}'"
         
-        response = model.generate_content(
-            content_parts,
-            generation_config={
-                "temperature": 0.7,
-                "max_output_tokens": 2048,
-            }
-        )
+        # The SDK call blocks, so run it in a thread under the shared Gemini limit
+        async with get_gemini_semaphore():
+            response = await asyncio.to_thread(
+                model.generate_content,
+                content_parts,
+                generation_config={
+                    "temperature": 0.7,
+                    "max_output_tokens": 2048,
+                }
+            )
         
         # Store the solution in MongoDB
         solution_doc = {
@@ -147,13 +139,29 @@ async def generate_solution(prompt, file_content=None, file_type=None, subject_h
             "timestamp": datetime.now(),
             "subject": subject
         }
-        await solutions_collection.insert_one(solution_doc)
+        await db.solutions_collection.insert_one(solution_doc)
         
         return response.text
     except Exception as e:
         print(f"Error generating solution: {e}")
         return f"Sorry, I couldn't generate a solution. Error: {str(e)}"
 
+async def store_upload(blob_store, upload, **extra):
+    """Stores a streamed upload in GridFS (once per distinct content) and records its metadata."""
+    blob = await blob_store.put(upload)
+    metadata = {
+        "grid_fs_id": blob["grid_fs_id"],
+        "sha256": upload.sha256,
+        "size": upload.size,
+        "deduplicated": blob["deduplicated"],
+        "filename": upload.filename,
+        "content_type": upload.content_type,
+        **extra,
+        "timestamp": datetime.now()
+    }
+    await db.uploads_collection.insert_one(metadata)
+    return metadata
+
 @router.post("/solve-text")
 async def solve_text(request: TextRequest):
     try:
@@ -161,121 +169,208 @@ async def solve_text(request: TextRequest):
         solution = await generate_solution(prompt)
         
         return {"solution": solution}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+DOCUMENT_PROMPT = "Please provide a step-by-step solution for this document:\n"
+QUESTION_PROMPT = "Please provide a step-by-step solution for this question from a worksheet:\n"
+SCANNED_PROMPT = "These are scanned pages of a worksheet. Read every question on them and provide a step-by-step solution for each."
+
+async def read_document(file: UploadFile, blob_store):
+    """Stores an uploaded document and returns its content, text and PDF pages."""
+    # Stream the file to a spool in chunks, hashing as we go
+    async with await stream_upload(file, "document") as upload:
+        # Store file in GridFS, or reference the existing copy
+        await store_upload(blob_store, upload)
+        content = await upload.read_bytes()
+    return await load_document(content, file.content_type, upload.sha256)
+
+async def load_document(content, content_type, sha256=None):
+    """Extracts the text and PDF pages of a stored document."""
+    pages = []
+    scanned = {}
+    if content_type == "application/pdf":
+        pages = await extract_pdf_pages(content, sha256)
+        extracted_text = "".join(pages) if pages else "Failed to extract text from the PDF."
+        # Pages without a text layer are scanned; render them for the multimodal path
+        scanned_indexes = textless_pages(pages)
+        if scanned_indexes:
+            scanned = await rasterize_pages(content, scanned_indexes, sha256)
+    elif content_type.startswith("text/"):
+        extracted_text = content.decode("utf-8")
+    else:
+        extracted_text = "Unsupported file type for text extraction."
+    return {"content": content, "content_type": content_type, "text": extracted_text,
+            "pages": pages, "scanned": scanned}
+
+async def solve_question_chunk(chunk):
+    if "images" in chunk:
+        return await generate_solution(SCANNED_PROMPT, follow_up=False, images=chunk["images"])
+    return await generate_solution(QUESTION_PROMPT + chunk["text"], follow_up=False)
+
+async def solve_document(document):
+    """Yields ``{"index", "label", "solution", "total"}`` per question as each one finishes.
+
+    Multi-question PDFs are split into questions, scanned pages are batched into
+    image chunks, and all chunks are solved concurrently (bounded by the Gemini
+    concurrency limit); anything else is solved in one call.
+    """
+    chunks = []
+    if document["pages"]:
+        scanned = document["scanned"]
+        text_pages = ["" if i in scanned else page for i, page in enumerate(document["pages"])]
+        chunks = split_into_questions(text_pages) + scanned_page_chunks(scanned)
+        chunks.sort(key=lambda chunk: chunk["page"])
+    if len(chunks) > 1 or (chunks and "images" in chunks[0]):
+        async for result in solve_chunks(chunks, solve_question_chunk):
+            yield {**result, "total": len(chunks)}
+        return
+
+    # Generate solution based on file content
+    prompt = DOCUMENT_PROMPT + document["text"]
+    solution = await generate_solution(prompt, document["content"], document["content_type"])
+    yield {"index": 0, "label": "Document", "solution": solution, "total": 1}
+
 @router.post("/upload-file")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(file: UploadFile = File(...), blob_store=Depends(get_blob_store)):
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Store file in MongoDB GridFS using async GridFSBucket
-        file_id = await fs_bucket.upload_from_stream(
-            file.filename,
-            io.BytesIO(content),
-            metadata={"content_type": file.content_type}
-        )
-        
-        # Store file metadata
-        file_metadata = {
-            "grid_fs_id": str(file_id),
-            "filename": file.filename,
-            "content_type": file.content_type,
-            "timestamp": datetime.now()
-        }
-        
-        await uploads_collection.insert_one(file_metadata)
-        
-        extracted_text = ""
-        if file.content_type == "application/pdf":
-            extracted_text = await extract_text_from_pdf(content)
-        elif file.content_type.startswith("text/"):
-            extracted_text = content.decode("utf-8")
-        else:
-            extracted_text = "Unsupported file type for text extraction."
+        document = await read_document(file, blob_store)
+        results = [result async for result in solve_document(document)]
+        if len(results) == 1:
+            return {"solution": results[0]["solution"]}
+        return {"solution": merge_solutions(results)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Generate solution based on file content
-        prompt = f"Please provide a step-by-step solution for this document:\n{extracted_text}"
-        solution = await generate_solution(prompt, content, file.content_type)
-        
-        return {"solution": solution}
+@router.post("/upload-file/stream")
+async def upload_file_stream(file: UploadFile = File(...), blob_store=Depends(get_blob_store)):
+    """Same as /upload-file, but streams each question's solution as NDJSON as soon as it
+    is ready, followed by a final ``{"done": true, "solution": ...}`` line in document order."""
+    try:
+        document = await read_document(file, blob_store)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        results = []
+        try:
+            async for result in solve_document(document):
+                results.append(result)
+                yield json.dumps(result) + "\n"
+            solution = results[0]["solution"] if len(results) == 1 else merge_solutions(results)
+            yield json.dumps({"done": True, "solution": solution}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@job_handler("solve_document")
+async def solve_document_job(payload, progress):
+    """Job runner for /upload-file/jobs: loads the stored document and solves it."""
+    grid_out = await db.doubt_fs_bucket.open_download_stream(ObjectId(payload["grid_fs_id"]))
+    content = await grid_out.read()
+    document = await load_document(content, payload["content_type"], payload["sha256"])
+    results = []
+    async for result in solve_document(document):
+        results.append(result)
+        await progress(result)
+    solution = results[0]["solution"] if len(results) == 1 else merge_solutions(results)
+    return {"solution": solution}
+
+@router.post("/upload-file/jobs")
+async def upload_file_job(file: UploadFile = File(...), blob_store=Depends(get_blob_store),
+                          job_queue=Depends(get_job_queue)):
+    """Queues /upload-file as a background job and returns 202 with its job id.
+    Uploading the same document again returns the existing job."""
+    try:
+        async with await stream_upload(file, "document") as upload:
+            stored = await store_upload(blob_store, upload)
+        payload = {"grid_fs_id": stored["grid_fs_id"], "sha256": upload.sha256,
+                   "content_type": upload.content_type, "filename": upload.filename}
+        job = await job_queue.submit("solve_document", payload,
+                                     key=JobQueue.make_key("solve_document", {"sha256": upload.sha256}))
+        return submitted(job)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def extract_text_from_pdf(file_bytes: bytes) -> str:
-    text = ""
+async def extract_pdf_pages(file_bytes: bytes, sha256: str = None) -> list:
     try:
-        with fitz.open(stream=file_bytes, filetype="pdf") as doc:
-            for page_num, page in enumerate(doc, start=1):
-                text += page.get_text()
-                print(f"Page {page_num} extracted text: {text[:200]}")  # Debugging: check extracted text from each page
+        # Runs in the process pool and is cached by content hash
+        result = await extract_pdf(file_bytes, sha256, db.pdf_text_collection)
+        print(f"Extracted {len(result['pages'])}/{result['page_count']} PDF pages, truncated={result['truncated']}")
+        return result["pages"]
     except Exception as e:
         print(f"PDF extraction error: {e}")
-        text = "Failed to extract text from the PDF."
-    return text
+        return []
+
+async def extract_text_from_pdf(file_bytes: bytes, sha256: str = None) -> str:
+    pages = await extract_pdf_pages(file_bytes, sha256)
+    return "".join(pages) if pages else "Failed to extract text from the PDF."
        
 @router.post("/upload-image")
-async def upload_image(image: UploadFile = File(...)):
+async def upload_image(image: UploadFile = File(...), blob_store=Depends(get_blob_store)):
     try:
         # Check if the file is actually an image
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read image content
-        image_content = await image.read()
-        
-        # Store image in MongoDB GridFS using async GridFSBucket
-        file_id = await fs_bucket.upload_from_stream(
-            image.filename,
-            io.BytesIO(image_content),
-            metadata={"content_type": image.content_type}
-        )
-        
-        # Store image metadata
-        image_metadata = {
-            "grid_fs_id": str(file_id),
-            "filename": image.filename,
-            "content_type": image.content_type,
-            "timestamp": datetime.now()
-        }
-        
-        await uploads_collection.insert_one(image_metadata)
+        # Stream image to a spool in chunks, hashing as we go
+        async with await stream_upload(image, "image") as upload:
+            # Store image in GridFS, or reference the existing copy
+            await store_upload(blob_store, upload)
+            image_content = await upload.read_bytes()
         
         # Generate solution based on image
         prompt = "Please analyze the provided image and Explain the solution in a clear, step-by-step manner. Start by identifying what is given and what needs to be found. Then outline the method or concept used to solve it. Solve each step logically, using correct academic notation and terminology (e.g., x², ∫, Δt, moles, sin(θ), etc.), and avoid unnecessary special characters or HTML tags. Keep the explanation structured, not too long, not too short, and conclude with the final answer in a complete sentence."
         solution = await generate_solution(prompt, image_content, image.content_type, "math")
         return {"solution": solution}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+VOICE_PROMPT = "Explain the solution in a clear, step-by-step manner. Start by identifying what is given and what needs to be found. Then outline the method or concept used to solve it. Solve each step logically, using correct academic notation and terminology (e.g., x², ∫, Δt, moles, sin(θ), etc.), and avoid unnecessary special characters or HTML tags. Keep the explanation structured, not too long, not too short, and conclude with the final answer in a complete sentence. The student asked (transcribed from voice): "
+
+async def solve_voice(chunks, filename, content_type, blob_store, stt):
+    """Transcribes an audio stream segment by segment as it arrives, stores it, and solves the transcript."""
+    async with SpooledUpload(filename, content_type) as upload:
+        transcript = await transcribe_stream(spool_chunks(chunks, upload, "audio"), upload.content_type, filename, stt)
+        # Store voice in GridFS, or reference the existing copy
+        await store_upload(blob_store, upload, transcript=transcript)
+
+    if not transcript:
+        raise HTTPException(status_code=422, detail="No speech detected in the recording")
+    solution = await generate_solution(VOICE_PROMPT + transcript)
+    return {"solution": solution, "transcript": transcript}
+
 @router.post("/send-voice")
-async def send_voice(voice: UploadFile = File(...)):
+async def send_voice(voice: UploadFile = File(...), blob_store=Depends(get_blob_store),
+                     stt=Depends(get_speech_to_text)):
     try:
-        # Read voice content
-        voice_content = await voice.read()
-        
-        # Store voice in MongoDB GridFS using async GridFSBucket
-        file_id = await fs_bucket.upload_from_stream(
-            voice.filename,
-            io.BytesIO(voice_content),
-            metadata={"content_type": voice.content_type}
-        )
-        
-        # Store voice metadata
-        voice_metadata = {
-            "grid_fs_id": str(file_id),
-            "filename": voice.filename,
-            "content_type": voice.content_type,
-            "timestamp": datetime.now()
-        }
-        
-        await uploads_collection.insert_one(voice_metadata)
-        
-        # For voice input, placeholder response
-        # In a production environment, you would integrate with a speech-to-text service
-        solution = "I've received your voice input. Currently, the system is using a placeholder response. In a production environment, we would use speech-to-text conversion to process your voice input. Explain the solution in a clear, step-by-step manner. Start by identifying what is given and what needs to be found. Then outline the method or concept used to solve it. Solve each step logically, using correct academic notation and terminology (e.g., x², ∫, Δt, moles, sin(θ), etc.), and avoid unnecessary special characters or HTML tags. Keep the explanation structured, not too long, not too short, and conclude with the final answer in a complete sentence.\n\nDo you have any specific math or science problems you'd like me to solve for you?"
-        return {"solution": solution}
+        return await solve_voice(iter_upload(voice), voice.filename, voice.content_type, blob_store, stt)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/send-voice/stream")
+async def send_voice_stream(request: Request, blob_store=Depends(get_blob_store),
+                            stt=Depends(get_speech_to_text)):
+    """Raw audio body (e.g. chunked transfer from a recorder); segments are transcribed while it uploads."""
+    try:
+        content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0]
+        filename = request.headers.get("x-filename", "voice")
+        return await solve_voice(request.stream(), filename, content_type, blob_store, stt)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -283,7 +378,8 @@ async def send_voice(voice: UploadFile = File(...)):
 @router.post("/solve-image-text")
 async def solve_image_text(
     image: UploadFile = File(...),
-    query: str = Form(default="")  # Changed to default="" to make it optional
+    query: str = Form(default=""),  # Changed to default="" to make it optional
+    blob_store=Depends(get_blob_store)
 ):
     try:
         # Debug output
@@ -294,23 +390,11 @@ async def solve_image_text(
         if not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
 
-        # Read image content
-        image_content = await image.read()
-        
-        # Save to MongoDB
-        file_id = await fs_bucket.upload_from_stream(
-            image.filename,
-            io.BytesIO(image_content),
-            metadata={"content_type": image.content_type}
-        )
-
-        await uploads_collection.insert_one({
-            "grid_fs_id": str(file_id),
-            "filename": image.filename,
-            "content_type": image.content_type,
-            "query": query,
-            "timestamp": datetime.now()
-        })
+        # Stream image to a spool in chunks, hashing as we go
+        async with await stream_upload(image, "image") as upload:
+            # Save to MongoDB, or reference the existing copy
+            await store_upload(blob_store, upload, query=query)
+            image_content = await upload.read_bytes()
 
         # Improved prompt handling for different scenarios
         base_prompt = "Please analyze the provided image and explain the solution in a clear, step-by-step manner. Start by identifying what is given and what needs to be found. Then outline the method or concept used to solve it. Solve each step logically, using correct academic notation and terminology (e.g., x², ∫, Δt, moles, sin(θ), etc.), and avoid unnecessary special characters or HTML tags. Keep the explanation structured, not too long, not too short, and conclude with the final answer in a complete sentence."
@@ -333,6 +417,8 @@ async def solve_image_text(
         solution = await generate_solution(prompt, image_content, image.content_type, subject_hint)
 
         return {"solution": solution}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in solve-image-text: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -342,6 +428,4 @@ async def solve_image_text(
 async def test_query(query: str = Form(...)):
     return {"received_query": query}
 
-if __name__ == "__main__":
-    uvicorn.run("main:app", port=5000, reload=True)
 
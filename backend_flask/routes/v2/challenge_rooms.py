@@ -0,0 +1,323 @@
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+from functools import lru_cache
+import asyncio
+import json
+import os
+import traceback
+import uuid
+from database import db
+from helpers.ChallengeEvents import ChallengeBroker, offer
+from helpers.ChallengeRoom import (RoomStore, InMemoryRoomStore, MongoRoomStore, everyone_answered, is_member,
+                                   leaderboard, public_question, standing)
+from routes.v2.play_with_friend import draw_questions, get_challenge_broker, get_question_bank
+from routes.v2.leaderboard import record_score
+
+router = APIRouter(prefix="/play/rooms", tags=["Play With Friend"])
+
+ROOM_MAX_PLAYERS = int(os.getenv("ROOM_MAX_PLAYERS", "100"))
+ROOM_QUESTION_SECONDS = float(os.getenv("ROOM_QUESTION_SECONDS", "20"))
+ROOM_REVEAL_SECONDS = float(os.getenv("ROOM_REVEAL_SECONDS", "3"))
+ROOM_RETENTION_SECONDS = float(os.getenv("ROOM_RETENTION_SECONDS", "600"))
+ROOM_LOBBY_SECONDS = float(os.getenv("ROOM_LOBBY_SECONDS", "3600"))
+ROOM_MAX_QUESTIONS = int(os.getenv("ROOM_MAX_QUESTIONS", "50"))
+# How late a timeline may be before any worker fails its room, and how often they check
+ROOM_STALL_SECONDS = float(os.getenv("ROOM_STALL_SECONDS", "30"))
+ROOM_SWEEP_SECONDS = float(os.getenv("ROOM_SWEEP_SECONDS", "10"))
+ROOM_LEADERBOARD_SIZE = 10
+
+# Question timelines run on the worker that started the room
+timelines: Dict[str, asyncio.Task] = {}
+sweeper: Optional[asyncio.Task] = None
+
+@lru_cache(maxsize=None)
+def get_room_store() -> RoomStore:
+    """Room storage selected by ROOM_STORE: ``mongo`` (rooms work on every
+    worker) or ``memory`` (single process only). Follows CHALLENGE_STORE by default."""
+    backend = os.getenv("ROOM_STORE", os.getenv("CHALLENGE_STORE", "mongo")).lower()
+    if backend == "memory":
+        return InMemoryRoomStore(ROOM_LOBBY_SECONDS, ROOM_RETENTION_SECONDS, ROOM_STALL_SECONDS)
+    return MongoRoomStore(db.rooms_collection, ROOM_LOBBY_SECONDS, ROOM_RETENTION_SECONDS, ROOM_STALL_SECONDS)
+
+def room_channel(room_id: str) -> str:
+    return f"room:{room_id}"
+
+def control_channel(room_id: str) -> str:
+    """Tells the timeline, wherever it runs, that everyone answered a question."""
+    return f"room-control:{room_id}"
+
+# ------------------ Models ------------------
+
+class RoomCreate(BaseModel):
+    hostId: str
+    subject: str
+    topic: str
+    level: str
+    questionCount: int = Field(10, ge=1, le=ROOM_MAX_QUESTIONS)
+    questionSeconds: Optional[float] = Field(None, ge=5, le=300)
+
+class RoomJoin(BaseModel):
+    code: str
+    userId: str
+
+class RoomStart(BaseModel):
+    hostId: str
+
+# ------------------ Timeline ------------------
+
+async def get_room(store: RoomStore, room_id: str) -> Dict:
+    room = await store.get(room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found.")
+    return room
+
+async def flush_results(room: Dict, ranking):
+    """Writes the final ranking to Mongo once the quiz is over."""
+    await db.room_results_collection.insert_one({
+        "_id": room["_id"],
+        "host": room["host"],
+        "subject": room["subject"],
+        "topic": room["topic"],
+        "level": room["level"],
+        "questionCount": len(room["questions"]),
+        "ranking": ranking,
+        "finishedAt": datetime.now(),
+    })
+
+async def wait_for_close(control: asyncio.Queue, index: int, seconds: float):
+    """Returns when question ``index`` is closed early or ``seconds`` pass."""
+    deadline = asyncio.get_running_loop().time() + seconds
+    while True:
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            return
+        try:
+            message = await asyncio.wait_for(control.get(), timeout=remaining)
+        except asyncio.TimeoutError:
+            return
+        if json.loads(message).get("index") == index:
+            return
+
+async def fail_room(room_id: str, detail: str):
+    """Marks a running room failed and tells its members."""
+    store, broker = get_room_store(), get_challenge_broker()
+    try:
+        if await store.finish(room_id, "failed"):
+            await broker.publish(room_channel(room_id), {"type": "room_failed", "detail": detail})
+    except Exception as e:
+        print(f"Error failing room {room_id}: {e}")
+
+async def run_timeline(room_id: str):
+    """Opens each question in turn and broadcasts question, reveal and final events."""
+    store, broker = get_room_store(), get_challenge_broker()
+    try:
+        async with broker.subscribe(control_channel(room_id)) as control:
+            room = await store.get(room_id)
+            for index in range(len(room["questions"])):
+                room = await store.open_question(room_id, index, room["questionSeconds"] + ROOM_REVEAL_SECONDS)
+                if not room:
+                    # Failed by the stall sweep meanwhile
+                    return
+                await broker.publish(room_channel(room_id), {"type": "question", **public_question(room)})
+                await wait_for_close(control, index, room["questionSeconds"])
+                room = await store.get(room_id)
+                await broker.publish(room_channel(room_id), {
+                    "type": "reveal",
+                    "index": index,
+                    "answer": room["questions"][index].get("answer"),
+                    "leaderboard": leaderboard(room, ROOM_LEADERBOARD_SIZE),
+                })
+                await asyncio.sleep(ROOM_REVEAL_SECONDS)
+
+        room = await store.finish(room_id)
+        if not room:
+            return
+        ranking = leaderboard(room)
+        await broker.publish(room_channel(room_id), {"type": "final_score", "leaderboard": ranking})
+        for entry in ranking:
+            record_score(entry["userId"], room["subject"], entry["score"], won=entry["rank"] == 1 and entry["score"] > 0)
+        try:
+            await flush_results(room, ranking)
+        except Exception as e:
+            print(f"Error saving room results for {room_id}: {e}")
+    except asyncio.CancelledError:
+        await fail_room(room_id, "The server restarted during the quiz.")
+        raise
+    except Exception as e:
+        print(f"Error running room {room_id}: {e}")
+        traceback.print_exc()
+        await fail_room(room_id, "The quiz stopped unexpectedly.")
+    finally:
+        timelines.pop(room_id, None)
+
+async def sweep_stalled_rooms():
+    """Fails rooms whose timeline stopped, e.g. because its worker died, so
+    they do not stay in progress until they expire."""
+    store, broker = get_room_store(), get_challenge_broker()
+    while True:
+        await asyncio.sleep(ROOM_SWEEP_SECONDS)
+        try:
+            for room in await store.fail_stalled():
+                await broker.publish(room_channel(room["_id"]),
+                                     {"type": "room_failed", "detail": "The quiz stopped unexpectedly."})
+        except Exception as e:
+            print(f"Error sweeping stalled rooms: {e}")
+
+async def on_startup():
+    """Called from the app lifespan once the database is initialized."""
+    global sweeper
+    try:
+        await get_room_store().ensure_indexes()
+    except Exception as e:
+        print(f"Error creating challenge room indexes: {e}")
+    sweeper = asyncio.create_task(sweep_stalled_rooms())
+
+async def on_shutdown():
+    tasks = list(timelines.values())
+    if sweeper:
+        tasks.append(sweeper)
+    for task in tasks:
+        task.cancel()
+    # Let the timelines mark their rooms failed before the broker stops
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+# ------------------ Routes ------------------
+
+@router.post("")
+async def create_room(data: RoomCreate, store: RoomStore = Depends(get_room_store)):
+    room_id = str(uuid.uuid4())
+    code = uuid.uuid4().hex[:6].upper()
+    await store.create({
+        "_id": room_id,
+        "code": code,
+        "host": data.hostId,
+        "subject": data.subject,
+        "topic": data.topic,
+        "level": data.level,
+        "questionCount": data.questionCount,
+        "questionSeconds": data.questionSeconds or ROOM_QUESTION_SECONDS,
+        "maxPlayers": ROOM_MAX_PLAYERS,
+        "status": "lobby",
+        "questions": [],
+        "current": -1,
+        "openedAt": 0.0,
+        "answered": [],
+        "players": [],
+    })
+    # Warm the question pool while the class is joining
+    get_question_bank().warm(data.subject, data.topic, data.level)
+    return {"roomId": room_id, "code": code}
+
+@router.post("/join")
+async def join_room(data: RoomJoin, store: RoomStore = Depends(get_room_store),
+                    broker: ChallengeBroker = Depends(get_challenge_broker)):
+    code = data.code.upper()
+    room = await store.find_by_code(code)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found.")
+    if data.userId == room["host"]:
+        # The host runs the room from its socket but does not play
+        return {"roomId": room["_id"]}
+    room = await store.join(code, data.userId, room["maxPlayers"])
+    if not room:
+        raise HTTPException(status_code=400, detail="Room is full or already finished.")
+    await broker.publish(room_channel(room["_id"]),
+                         {"type": "player_joined", "userId": data.userId, "players": len(room["players"])})
+    return {"roomId": room["_id"]}
+
+@router.post("/{room_id}/start")
+async def start_room(room_id: str, data: RoomStart, store: RoomStore = Depends(get_room_store)):
+    room = await get_room(store, room_id)
+    if data.hostId != room["host"]:
+        raise HTTPException(status_code=403, detail="Only the host can start the room.")
+    if room["status"] != "lobby":
+        raise HTTPException(status_code=400, detail="Room already started.")
+
+    questions = draw_questions(room["subject"], room["topic"], room["level"], room["questionCount"])
+    # Kept until the timeline has run its course, then for the retention period
+    expires = datetime.utcnow() + timedelta(
+        seconds=len(questions) * (room["questionSeconds"] + ROOM_REVEAL_SECONDS) + ROOM_RETENTION_SECONDS
+    )
+    started = await store.start(room_id, data.hostId, questions, expires)
+    if not started:
+        # Another start won; keep the drawn questions for the next room
+        get_question_bank().give_back(room["subject"], room["topic"], room["level"], questions)
+        raise HTTPException(status_code=400, detail="Room already started.")
+    room = started
+    timelines[room_id] = asyncio.create_task(run_timeline(room_id))
+    return {"status": room["status"], "questions": len(questions)}
+
+@router.get("/{room_id}/leaderboard")
+async def room_leaderboard(room_id: str, limit: int = ROOM_LEADERBOARD_SIZE,
+                           store: RoomStore = Depends(get_room_store)):
+    room = await store.get(room_id)
+    if room:
+        return {"status": room["status"], "leaderboard": leaderboard(room, limit)}
+    # Finished rooms expire; fall back to the flushed results
+    saved = await db.room_results_collection.find_one({"_id": room_id})
+    if not saved:
+        raise HTTPException(status_code=404, detail="Room not found.")
+    return {"status": "finished", "leaderboard": saved["ranking"][:limit]}
+
+@router.websocket("/{room_id}/ws")
+async def room_socket(websocket: WebSocket, room_id: str, userId: str,
+                      store: RoomStore = Depends(get_room_store),
+                      broker: ChallengeBroker = Depends(get_challenge_broker)):
+    """Member channel for players and the host: ``snapshot`` on connect, then
+    ``player_joined``, ``question``, ``reveal``, ``final_score`` and
+    ``room_failed`` broadcasts.
+    Players answer with ``{"type": "answer", "questionIndex", "answer"}``; the
+    reply is private."""
+    room = await store.get(room_id)
+    if not room or not is_member(room, userId):
+        await websocket.close(code=4404 if not room else 4403)
+        return
+    await websocket.accept()
+
+    # Subscribe before reading the snapshot so no event falls in between
+    async with broker.subscribe(room_channel(room_id)) as queue:
+        room = await store.get(room_id) or room
+        snapshot = {"type": "snapshot", "status": room["status"], "players": len(room["players"]),
+                    "host": room["host"], "leaderboard": leaderboard(room, ROOM_LEADERBOARD_SIZE)}
+        if room["status"] == "in_progress" and room["current"] >= 0:
+            snapshot["question"] = public_question(room)
+        await websocket.send_text(json.dumps(snapshot))
+
+        async def forward():
+            while True:
+                await websocket.send_text(await queue.get())
+
+        def reply(message: Dict):
+            # Replies go through the queue so only the sender task writes to the socket
+            offer(queue, json.dumps(message))
+
+        sender = asyncio.create_task(forward())
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except (json.JSONDecodeError, KeyError):
+                    # KeyError: a binary frame has no text
+                    reply({"type": "error", "detail": "Messages must be JSON text"})
+                    continue
+                if not isinstance(message, dict):
+                    reply({"type": "error", "detail": "Messages must be JSON objects"})
+                    continue
+                if message.get("type") != "answer":
+                    continue
+                index = message.get("questionIndex")
+                result = await store.answer(room_id, userId, index, message.get("answer"))
+                ack = {"type": "answer_ack", "index": index, "accepted": result is not None}
+                if result is not None:
+                    correct, room = result
+                    score, rank = standing(room, userId)
+                    ack.update(correct=correct, score=score, rank=rank)
+                    if everyone_answered(room):
+                        await broker.publish(control_channel(room_id), {"type": "closed", "index": index})
+                reply(ack)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
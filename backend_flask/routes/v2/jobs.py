@@ -0,0 +1,95 @@
+import json
+import os
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from database import db
+from helpers.JobQueue import JobQueue
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+job_queue = None
+
+
+async def on_startup():
+    """Starts this worker's job runners. Called from the app lifespan after the async db is up."""
+    global job_queue
+    job_queue = JobQueue(
+        db.jobs_collection,
+        concurrency=int(os.getenv("JOB_WORKERS", "4")),
+        lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    )
+    await job_queue.ensure_indexes()
+    job_queue.start()
+
+
+async def on_shutdown():
+    if job_queue:
+        await job_queue.stop()
+
+
+def get_job_queue() -> JobQueue:
+    """FastAPI dependency returning this worker's job queue."""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job queue is not available")
+    return job_queue
+
+
+def submitted(job) -> JSONResponse:
+    """202 response for a submit endpoint, pointing at the status/result/events URLs."""
+    job_id = job["_id"]
+    return JSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "status": job["status"],
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+        "events_url": f"/jobs/{job_id}/events",
+    })
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobQueue.to_public(job)
+
+
+@router.get("/{job_id}/result")
+async def job_result(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    job = await job_queue.get(job_id, with_result=True)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=job.get("error") or "Job failed")
+    if job["status"] != "done":
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": job["status"]})
+    return {"job_id": job_id, "status": "done", "result": job["result"]}
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, job_queue: JobQueue = Depends(get_job_queue)):
+    """Server-sent events: a ``status`` event whenever the job changes, one ``progress``
+    event per new progress entry, and a final ``done`` or ``failed`` event."""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        sent = 0
+        async for job in job_queue.watch(job_id):
+            public = JobQueue.to_public(job)
+            progress = public.pop("progress") or []
+            # Progress is capped, so after a trim resend what is still there
+            if sent > len(progress):
+                sent = 0
+            for event in progress[sent:]:
+                yield f"event: progress\ndata: {json.dumps(event, default=str)}\n\n"
+            sent = len(progress)
+            name = job["status"] if job["status"] in ("done", "failed") else "status"
+            yield f"event: {name}\ndata: {json.dumps(public)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -2,21 +2,54 @@ from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel, Field, HttpUrl
 from typing import  List, Dict, Optional
 from datetime import datetime
+from functools import lru_cache
 from bson import ObjectId
-from database.db import  leaderboard_collection, new_users_collection
+import asyncio
+import os
+from database import db
+from helpers.LeaderboardIngest import LeaderboardIngest
 
 router = APIRouter(prefix="/v2", tags=["Leaderboard"])
 
+LEADERBOARD_FLUSH_SECONDS = float(os.getenv("LEADERBOARD_FLUSH_SECONDS", "5"))
+LEADERBOARD_MAX_PENDING = int(os.getenv("LEADERBOARD_MAX_PENDING", "5000"))
+
+
+@lru_cache(maxsize=None)
+def get_leaderboard_ingest() -> LeaderboardIngest:
+    """Buffer that challenge and room results are scored into; flushed in batches."""
+    return LeaderboardIngest(db.leaderboard_collection, flush_interval=LEADERBOARD_FLUSH_SECONDS,
+                             max_pending=LEADERBOARD_MAX_PENDING)
+
+
+def record_score(user_id: str, subject: str, score: int, won: bool = False):
+    """Adds a finished game to the player's leaderboard entry (written on the next flush)."""
+    get_leaderboard_ingest().add(user_id, subject, score, won)
+
+
+async def on_startup():
+    """Called from the app lifespan once the database is initialized."""
+    try:
+        await asyncio.to_thread(get_leaderboard_ingest().ensure_indexes)
+    except Exception as e:
+        print(f"Error creating leaderboard indexes: {e}")
+    await get_leaderboard_ingest().start()
+
+
+async def on_shutdown():
+    """Writes out whatever is still buffered."""
+    await get_leaderboard_ingest().stop()
+
 
 # route for getting leaderboard info from leaderboard collection and user collection
  
 @router.get("/leaderboard")
 async def get_leaderboard():
     leaderboard_data = []
-    leaderboard_entries = leaderboard_collection.find().sort("score", -1)
+    leaderboard_entries = db.leaderboard_collection.find().sort("score", -1)
 
     for entry in leaderboard_entries:
-        user = new_users_collection.find_one({"_id": entry["user_id"]})
+        user = db.new_users_collection.find_one({"_id": entry["user_id"]})
         if user:
             leaderboard_data.append({
                 "name": user.get("fullName", "N/A"),
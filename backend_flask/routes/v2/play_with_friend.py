@@ -1,21 +1,32 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, ValidationError
+from typing import Iterable, List, Dict, Optional, Set
 import uuid
-import google.generativeai as genai
+import asyncio
+import json
 import os  # To access environment variables
+from functools import lru_cache
+from database import db
+from helpers.QuestionBank import QuestionBank
+from helpers.ChallengeStore import ChallengeStore, InMemoryChallengeStore, MongoChallengeStore
+from helpers.ChallengeEvents import ChallengeBroker, MongoChallengeBroker, offer
+from helpers.Matchmaker import LocalMatchmakingQueue, Matchmaker, MatchmakingQueue, MongoMatchmakingQueue
+from providers.registry import get_genai
+from routes.v2.leaderboard import record_score
 
 router = APIRouter(prefix="/play", tags=["Play With Friend"])
 
-# In-memory data store (simulate database)
-challenges = {}
+QUESTIONS_PER_CHALLENGE = int(os.getenv("QUESTIONS_PER_CHALLENGE", "10"))
+QUESTIONS_PER_CALL = int(os.getenv("QUESTIONS_PER_CALL", "10"))
+MATCHMAKING_WIDEN_AFTER = float(os.getenv("MATCHMAKING_WIDEN_AFTER", "10"))
+MATCHMAKING_TICKET_TTL = float(os.getenv("MATCHMAKING_TICKET_TTL", "120"))
+MATCHMAKING_MAX_WAITING = int(os.getenv("MATCHMAKING_MAX_WAITING", "10000"))
+MATCHMAKING_SWEEP_SECONDS = float(os.getenv("MATCHMAKING_SWEEP_SECONDS", "1"))
 
-# Configure Gemini API (Make sure to set your API key as an environment variable)
-GOOGLE_API_KEY = os.environ.get("GEMINI_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY environment variable not set")
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-1.5-pro')
+@lru_cache(maxsize=None)
+def get_question_model():
+    """Gemini model used for question generation, created on first use."""
+    return get_genai().GenerativeModel('gemini-1.5-pro')
 
 # ------------------ Models ------------------
 
@@ -31,6 +42,12 @@ class JoinChallenge(BaseModel):
     inviteCode: str
     userId: str
 
+class MatchmakingRequest(BaseModel):
+    userId: str
+    subject: str
+    topic: str
+    level: str
+
 class StartChallengeRequest(BaseModel):
     pass
 
@@ -39,11 +56,33 @@ class AnswerSubmission(BaseModel):
     questionIndex: int
     answer: str
 
+class AnswerItem(BaseModel):
+    questionIndex: int
+    answer: str
+
+class BatchAnswerSubmission(BaseModel):
+    userId: str
+    answers: List[AnswerItem]
+
 class Question(BaseModel):
     question: str
     options: List[str]
     answer: str
 
+# JSON schema Gemini must follow when generating a batch of questions
+QUESTION_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "question": {"type": "string"},
+            "options": {"type": "array", "items": {"type": "string"}},
+            "answer": {"type": "string"},
+        },
+        "required": ["question", "options", "answer"],
+    },
+}
+
 # ------------------ Question Generation using Gemini API ------------------
 def generate_sample_questions(subject: str, topic: str, level: str = "medium") -> List[Dict]:
     """
@@ -80,48 +119,235 @@ def generate_sample_questions(subject: str, topic: str, level: str = "medium") -
             {"question": f"No dummy questions for {subject} - {topic}"}
         ]
 
-async def generate_questions_from_gemini(subject: str, topic: str, level: str = "medium") -> List[Dict]:
+async def generate_questions_from_gemini(subject: str, topic: str, level: str = "medium",
+                                        count: int = QUESTIONS_PER_CALL) -> List[Dict]:
     """
-    Generates quiz questions using the Gemini Pro model.
+    Generates a batch of ``count`` quiz questions in a single Gemini call.
+    The model is constrained to a JSON schema and each item is validated
+    against the ``Question`` model; malformed items are dropped, not the batch.
     """
-    prompt = f"Generate 1 multiple-choice quiz question about {topic} in {subject} at a {level} difficulty level. " \
-             "The question should have 4 options labeled A, B, C, D, and clearly indicate the correct answer."
+    prompt = f"Generate {count} distinct multiple-choice quiz questions about {topic} in {subject} " \
+             f"at a {level} difficulty level. Each question must have exactly 4 options, and " \
+             "the answer must be the full text of the correct option."
     try:
-        response = model.generate_content(prompt)
-        response.resolve()  # Ensure the response is fully available
-
-        if response.text:
-            # Parse the Gemini response to extract question, options, and answer
-            # This parsing logic might need to be adjusted based on Gemini's output format
-            lines = response.text.split('\n')
-            question_line = next((line for line in lines if line.strip().startswith("Question:")), None)
-            options_lines = [line.strip() for line in lines if line.strip().startswith(('A.', 'B.', 'C.', 'D.'))]
-            answer_line = next((line for line in lines if line.strip().startswith("Correct Answer:")), None)
-
-            if question_line and len(options_lines) == 4 and answer_line:
-                question = question_line.split("Question:")[1].strip()
-                options = [opt.split('.', 1)[1].strip() for opt in options_lines]
-                answer = answer_line.split("Correct Answer:")[1].strip()
-                return [{"question": question, "options": options, "answer": answer}]
-            else:
-                print(f"Failed to parse Gemini response: {response.text}")
-                return [{"question": f"Failed to generate question for {subject} - {topic}"}]
+        genai = get_genai()
+        # generate_content blocks, keep it off the event loop
+        response = await asyncio.to_thread(
+            get_question_model().generate_content,
+            prompt,
+            generation_config=genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=QUESTION_BATCH_SCHEMA,
+                temperature=0.9,
+            ),
+        )
+        items = json.loads(response.text)
+    except Exception as e:
+        print(f"Error calling Gemini API for {subject} - {topic}: {e}")
+        return []
+
+    questions = []
+    seen = set()
+    for item in items if isinstance(items, list) else []:
+        try:
+            question = Question.model_validate(item)
+        except ValidationError as e:
+            print(f"Dropping invalid generated question: {e}")
+            continue
+        if len(question.options) != 4 or question.answer not in question.options:
+            continue
+        key = question.question.strip().lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        questions.append(question.model_dump())
+    return questions
+
+@lru_cache(maxsize=None)
+def get_question_bank() -> QuestionBank:
+    return QuestionBank(
+        db.question_bank_collection, generate_questions_from_gemini, generate_batch=QUESTIONS_PER_CALL
+    )
+
+def draw_questions(subject: str, topic: str, level: str, count: int, exclude: Iterable[str] = ()) -> List[Dict]:
+    """Draws questions from the warm bank (refills happen in the background), or
+    uses the built-in samples for the topics that have them. Answers 503 while
+    the bank for a new topic is still being filled."""
+    questions = get_question_bank().draw(subject, topic, level, count, exclude)
+    if not questions:
+        questions = [q for q in generate_sample_questions(subject, topic, level) if QuestionBank.is_valid(q)]
+    if not questions:
+        raise HTTPException(status_code=503, detail="Questions for this topic are being prepared. Try again shortly.",
+                            headers={"Retry-After": "5"})
+    return questions
+
+async def seen_question_hashes(store: "ChallengeStore", players: Iterable[str]) -> Set[str]:
+    """Hashes of the questions the players got in their stored challenges."""
+    seen = set()
+    for user_id in players:
+        for challenge in await store.list_for_user(user_id):
+            seen.update(q["hash"] for q in challenge.get("questions") or [] if q.get("hash"))
+    return seen
+
+@lru_cache(maxsize=None)
+def get_challenge_store() -> ChallengeStore:
+    """Challenge storage selected by CHALLENGE_STORE: ``mongo`` (shared by all
+    workers, the default) or ``memory`` (single process only)."""
+    if os.getenv("CHALLENGE_STORE", "mongo").lower() == "memory":
+        return InMemoryChallengeStore()
+    return MongoChallengeStore(db.challenges_collection)
+
+@lru_cache(maxsize=None)
+def get_challenge_broker() -> ChallengeBroker:
+    """Match event pub/sub selected by CHALLENGE_BROKER: ``mongo`` (reaches
+    sockets on every worker) or ``memory``. Follows CHALLENGE_STORE by default."""
+    backend = os.getenv("CHALLENGE_BROKER", os.getenv("CHALLENGE_STORE", "mongo")).lower()
+    if backend == "memory":
+        return ChallengeBroker()
+    return MongoChallengeBroker(db.challenge_events_collection)
+
+@lru_cache(maxsize=None)
+def get_matchmaking_queue() -> MatchmakingQueue:
+    """Random-opponent queue selected by MATCHMAKER: ``mongo`` (pairs players
+    across all workers) or ``memory`` (single process only). Follows
+    CHALLENGE_STORE by default."""
+    backend = os.getenv("MATCHMAKER", os.getenv("CHALLENGE_STORE", "mongo")).lower()
+    if backend == "memory":
+        return LocalMatchmakingQueue(Matchmaker(widen_after=MATCHMAKING_WIDEN_AFTER, ticket_ttl=MATCHMAKING_TICKET_TTL,
+                                                max_waiting=MATCHMAKING_MAX_WAITING))
+    return MongoMatchmakingQueue(db.matchmaking_collection, widen_after=MATCHMAKING_WIDEN_AFTER,
+                                 ticket_ttl=MATCHMAKING_TICKET_TTL, max_waiting=MATCHMAKING_MAX_WAITING)
+
+matchmaking_sweeper = None
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+async def create_match(match) -> Dict:
+    """Creates a ready challenge for a matched pair and notifies both players."""
+    first, second = match.first, match.second
+    challenge_id = str(uuid.uuid4())
+    await get_challenge_store().create({
+        "_id": challenge_id,
+        "creator": first.user_id,
+        "opponent": second.user_id,
+        "subject": first.subject,
+        "topic": first.topic,
+        "level": match.level,
+        "questions": [],
+        "answers": {},
+        "scores": {},
+        "answered": {},
+        "inviteCode": None,
+        "status": "ready",
+    })
+    get_question_bank().warm(first.subject, first.topic, match.level)
+
+    broker = get_challenge_broker()
+    for player, opponent in ((first, second), (second, first)):
+        event = {"type": "matched", "challengeId": challenge_id, "opponentId": opponent.user_id, "level": match.level}
+        await get_matchmaking_queue().record_match(player.user_id, event)
+        await broker.publish(user_channel(player.user_id), event)
+    return {"challengeId": challenge_id, "first": first.user_id, "second": second.user_id}
+
+async def sweep_matchmaking():
+    """Widens, pairs and expires waiting players every MATCHMAKING_SWEEP_SECONDS."""
+    queue = get_matchmaking_queue()
+    while True:
+        await asyncio.sleep(MATCHMAKING_SWEEP_SECONDS)
+        try:
+            matches, expired = await queue.sweep()
+            for match in matches:
+                await create_match(match)
+            for ticket in expired:
+                await get_challenge_broker().publish(user_channel(ticket.user_id), {"type": "match_timeout"})
+        except Exception as e:
+            print(f"Matchmaking sweep failed: {e}")
+
+async def on_startup():
+    """Called from the app lifespan once the database is initialized."""
+    global matchmaking_sweeper
+    try:
+        await asyncio.to_thread(get_question_bank().ensure_indexes)
+        await get_challenge_store().ensure_indexes()
+        await get_matchmaking_queue().ensure_indexes()
+    except Exception as e:
+        print(f"Error creating play with friend indexes: {e}")
+    await get_challenge_broker().start()
+    matchmaking_sweeper = asyncio.create_task(sweep_matchmaking())
+
+async def on_shutdown():
+    if matchmaking_sweeper:
+        matchmaking_sweeper.cancel()
+    await get_challenge_broker().stop()
+
+def compute_result(challenge: Dict) -> Dict:
+    """Scores and winner from the running totals kept by the store."""
+    players = [p for p in (challenge.get('creator'), challenge.get('opponent')) if p]
+    running = challenge.get('scores', {})
+    scores = {p: running.get(p, 0) for p in players}
+
+    winner = None
+    if len(players) == 2:
+        creator, opponent = players
+        if scores[creator] > scores[opponent]:
+            winner = creator
+        elif scores[opponent] > scores[creator]:
+            winner = opponent
         else:
-            print(f"Gemini API returned an empty response for {subject} - {topic}")
-            return [{"question": f"Failed to generate question for {subject} - {topic}"}]
+            winner = "Draw"
 
-    except Exception as e:
-        print(f"Error calling Gemini API: {e}")
-        return [{"question": f"Error generating question for {subject} - {topic}"}]
+    return {"scores": scores, "winner": winner}
+
+def answer_progress(challenge: Dict) -> Dict:
+    """Number of questions each player has answered."""
+    players = [p for p in (challenge['creator'], challenge['opponent']) if p]
+    answered = challenge.get('answered', {})
+    return {p: answered.get(p, 0) for p in players}
+
+def is_finished(challenge: Dict) -> bool:
+    total = len(challenge['questions'])
+    progress = answer_progress(challenge)
+    return bool(total) and len(progress) == 2 and all(n >= total for n in progress.values())
+
+async def record_answers(store: ChallengeStore, broker: ChallengeBroker, challenge_id: str,
+                         user_id: str, answers: Dict[int, str]):
+    """Records answers and pushes progress (and the final score once both players are done)."""
+    try:
+        challenge = await store.record_answers(challenge_id, user_id, answers)
+    except RuntimeError:
+        # The store gave up after repeated concurrent updates; the answers were not saved
+        raise HTTPException(status_code=409, detail="Answers could not be saved. Please send them again.",
+                            headers={"Retry-After": "1"})
+    if not challenge:
+        if not await store.get(challenge_id):
+            raise HTTPException(status_code=404, detail="Challenge not found.")
+        raise HTTPException(status_code=403, detail="Not a participant.")
+
+    await broker.publish(challenge_id, {
+        "type": "answer_progress", "userId": user_id,
+        "progress": answer_progress(challenge), "total": len(challenge['questions']),
+    })
+    if is_finished(challenge):
+        # Only the request that flips the status reports the result, so it is counted once
+        finished = await store.finish(challenge_id)
+        if finished:
+            challenge = finished
+            result = compute_result(finished)
+            for player, score in result["scores"].items():
+                record_score(player, finished["subject"], score, won=result["winner"] == player)
+            await broker.publish(challenge_id, {"type": "final_score", **result})
+    return challenge
 
 # ------------------ Routes ------------------
 
 @router.post("/challenges")
-async def create_challenge(data: ChallengeCreate):
+async def create_challenge(data: ChallengeCreate, store: ChallengeStore = Depends(get_challenge_store)):
     challenge_id = str(uuid.uuid4())
     invite_code = uuid.uuid4().hex[:6].upper() if not data.opponentId else None
 
     challenge_data = {
+        "_id": challenge_id,
         "creator": data.creatorId,
         "opponent": data.opponentId,
         "subject": data.subject,
@@ -129,11 +355,15 @@ async def create_challenge(data: ChallengeCreate):
         "level": data.level,
         "questions": [],
         "answers": {},
+        "scores": {},
+        "answered": {},
         "inviteCode": invite_code,
         "status": "ready" if data.opponentId else "waiting"
     }
 
-    challenges[challenge_id] = challenge_data
+    await store.create(challenge_data)
+    # Warm the question pool while players are still joining
+    get_question_bank().warm(data.subject, data.topic, data.level)
 
     return {
         "challengeId": challenge_id,
@@ -142,19 +372,20 @@ async def create_challenge(data: ChallengeCreate):
     }
 
 @router.post("/challenges/join")
-async def join_challenge(data: JoinChallenge):
-    for cid, ch in challenges.items():
-        if ch['inviteCode'] == data.inviteCode:
-            if ch['opponent'] is not None:
-                raise HTTPException(status_code=400, detail="Challenge already has an opponent.")
-            ch['opponent'] = data.userId
-            ch['status'] = "ready"
-            return {"challengeId": cid}
+async def join_challenge(data: JoinChallenge, store: ChallengeStore = Depends(get_challenge_store),
+                         broker: ChallengeBroker = Depends(get_challenge_broker)):
+    challenge = await store.join(data.inviteCode, data.userId)
+    if challenge:
+        await broker.publish(challenge["_id"], {"type": "opponent_joined", "opponent": data.userId})
+        return {"challengeId": challenge["_id"]}
+    if await store.find_by_invite(data.inviteCode):
+        raise HTTPException(status_code=400, detail="Challenge already has an opponent.")
     raise HTTPException(status_code=404, detail="Invite code not found.")
 
 @router.post("/challenges/{challenge_id}/start")
-async def start_challenge(challenge_id: str):
-    challenge = challenges.get(challenge_id)
+async def start_challenge(challenge_id: str, store: ChallengeStore = Depends(get_challenge_store),
+                          broker: ChallengeBroker = Depends(get_challenge_broker)):
+    challenge = await store.get(challenge_id)
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found.")
 
@@ -164,62 +395,180 @@ async def start_challenge(challenge_id: str):
     if challenge['questions']:  # prevent regenerating
         return {"questions": challenge['questions']}
 
-    # Use Gemini API to generate questions
-    questions =  generate_sample_questions(challenge['subject'], challenge['topic'], challenge['level'])
-    challenge['questions'] = questions
-    challenge['status'] = 'in_progress'
-    return {"questions": questions}
-
-@router.post("/challenges/{challenge_id}/answer")
-async def submit_answer(challenge_id: str, data: AnswerSubmission):
-    challenge = challenges.get(challenge_id)
-    if not challenge:
+    players = (challenge['creator'], challenge['opponent'])
+    questions = draw_questions(challenge['subject'], challenge['topic'], challenge['level'], QUESTIONS_PER_CHALLENGE,
+                               exclude=await seen_question_hashes(store, players))
+    # If another request started it first, everyone gets the questions it stored
+    started = await store.start(challenge_id, questions)
+    if started is None or started['questions'] != questions:
+        get_question_bank().give_back(challenge['subject'], challenge['topic'], challenge['level'], questions)
+    if started is None:
         raise HTTPException(status_code=404, detail="Challenge not found.")
+    if started['questions'] == questions:
+        await broker.publish(challenge_id, {"type": "questions", "questions": questions})
+    return {"questions": started['questions']}
 
-    if data.userId not in [challenge['creator'], challenge['opponent']]:
-        raise HTTPException(status_code=403, detail="Not a participant.")
-
-    user_answers = challenge['answers'].setdefault(data.userId, {})
-    user_answers[data.questionIndex] = data.answer
+@router.post("/challenges/{challenge_id}/answer")
+async def submit_answer(challenge_id: str, data: AnswerSubmission, store: ChallengeStore = Depends(get_challenge_store),
+                        broker: ChallengeBroker = Depends(get_challenge_broker)):
+    await record_answers(store, broker, challenge_id, data.userId, {data.questionIndex: data.answer})
     return {"message": "Answer recorded."}
 
+@router.post("/challenges/{challenge_id}/answers")
+async def submit_answers(challenge_id: str, data: BatchAnswerSubmission, store: ChallengeStore = Depends(get_challenge_store),
+                         broker: ChallengeBroker = Depends(get_challenge_broker)):
+    """Records all of a player's answers in one request; a later entry for the same question wins."""
+    answers = {item.questionIndex: item.answer for item in data.answers}
+    challenge = await record_answers(store, broker, challenge_id, data.userId, answers)
+    return {"message": "Answers recorded.", "answered": answer_progress(challenge)[data.userId]}
+
 @router.get("/challenges/{challenge_id}/result")
-async def get_result(challenge_id: str):
-    challenge = challenges.get(challenge_id)
+async def get_result(challenge_id: str, store: ChallengeStore = Depends(get_challenge_store)):
+    challenge = await store.get(challenge_id)
     if not challenge:
         raise HTTPException(status_code=404, detail="Challenge not found.")
+    return compute_result(challenge)
 
-    questions = challenge['questions']
-    scores = {}
-    creator = challenge.get('creator')
-    opponent = challenge.get('opponent')
-
-    if creator:
-        answers_creator = challenge['answers'].get(creator, {})
-        score_creator = sum(1 for idx, q in enumerate(questions) if str(answers_creator.get(idx)) == str(q['answer']))
-        scores[creator] = score_creator
-
-    if opponent:
-        answers_opponent = challenge['answers'].get(opponent, {})
-        score_opponent = sum(1 for idx, q in enumerate(questions) if str(answers_opponent.get(idx)) == str(q['answer']))
-        scores[opponent] = score_opponent
-
-    winner = None
-    if creator and opponent and scores.get(creator) is not None and scores.get(opponent) is not None:
-        if scores[creator] > scores[opponent]:
-            winner = creator
-        elif scores[opponent] > scores[creator]:
-            winner = opponent
-        else:
-            winner = "Draw"
-
-    return {"scores": scores, "winner": winner}
+async def enqueue_player(data: MatchmakingRequest) -> Dict:
+    try:
+        match = await get_matchmaking_queue().enqueue(data.userId, data.subject, data.topic, data.level)
+    except OverflowError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    if match is None:
+        return {"status": "waiting"}
+    created = await create_match(match)
+    opponent = created["first"] if created["second"] == data.userId else created["second"]
+    return {"status": "matched", "challengeId": created["challengeId"], "opponentId": opponent}
+
+@router.post("/matchmaking")
+async def join_matchmaking(data: MatchmakingRequest):
+    """Pairs the player with a random opponent, or queues them. Waiting players
+    are told about their match on /matchmaking/ws or by GET /matchmaking/{user_id}."""
+    await get_matchmaking_queue().clear_match(data.userId)
+    return await enqueue_player(data)
+
+@router.get("/matchmaking/{user_id}")
+async def matchmaking_status(user_id: str):
+    return await get_matchmaking_queue().status(user_id)
+
+@router.delete("/matchmaking/{user_id}")
+async def leave_matchmaking(user_id: str):
+    return {"cancelled": await get_matchmaking_queue().cancel(user_id)}
+
+@router.websocket("/matchmaking/ws")
+async def matchmaking_socket(websocket: WebSocket, userId: str, subject: str, topic: str, level: str,
+                             broker: ChallengeBroker = Depends(get_challenge_broker)):
+    """Queues the player and sends a single ``matched`` or ``match_timeout`` event.
+    Closing the socket while waiting leaves the queue."""
+    await websocket.accept()
+    async with broker.subscribe(user_channel(userId)) as queue:
+        try:
+            result = await enqueue_player(MatchmakingRequest(userId=userId, subject=subject, topic=topic, level=level))
+        except HTTPException as e:
+            await websocket.send_text(json.dumps({"type": "error", "detail": e.detail}))
+            await websocket.close()
+            return
+        if result["status"] == "matched":
+            await websocket.send_text(json.dumps({"type": "matched", **result}))
+            await websocket.close()
+            return
+
+        receiver = asyncio.create_task(websocket.receive_text())
+        waiter = asyncio.create_task(queue.get())
+        try:
+            done, _ = await asyncio.wait({receiver, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            if waiter in done:
+                await websocket.send_text(waiter.result())
+                await websocket.close()
+            else:
+                # Any client message or a disconnect means the player gave up
+                receiver.exception()
+                await get_matchmaking_queue().cancel(userId)
+        except WebSocketDisconnect:
+            await get_matchmaking_queue().cancel(userId)
+        finally:
+            receiver.cancel()
+            waiter.cancel()
 
 @router.get("/challenges/user/{user_id}")
-async def get_user_challenges(user_id: str):
+async def get_user_challenges(user_id: str, store: ChallengeStore = Depends(get_challenge_store)):
     user_challenges = [
-        {"id": cid, **ch}
-        for cid, ch in challenges.items()
-        if ch['creator'] == user_id or ch['opponent'] == user_id
+        {"id": ch.pop("_id"), **ch}
+        for ch in await store.list_for_user(user_id)
     ]
-    return {"challenges": user_challenges}
\ No newline at end of file
+    return {"challenges": user_challenges}
+
+@router.websocket("/challenges/{challenge_id}/ws")
+async def challenge_socket(websocket: WebSocket, challenge_id: str, userId: str,
+                           store: ChallengeStore = Depends(get_challenge_store),
+                           broker: ChallengeBroker = Depends(get_challenge_broker)):
+    """Live match channel for one player.
+
+    Sends a ``snapshot`` on connect, then ``opponent_joined``, ``questions``,
+    ``answer_progress`` and ``final_score`` events as they happen. Players can
+    answer over the socket with ``{"type": "answer", "questionIndex", "answer"}``
+    or send them all at once with ``{"type": "answers", "answers": [...]}``.
+    """
+    challenge = await store.get(challenge_id)
+    if not challenge:
+        await websocket.close(code=4404)
+        return
+    if userId not in (challenge['creator'], challenge['opponent']):
+        await websocket.close(code=4403)
+        return
+    await websocket.accept()
+
+    # Subscribe before reading the snapshot so no event falls in between
+    async with broker.subscribe(challenge_id) as queue:
+        challenge = await store.get(challenge_id) or challenge
+        snapshot = {
+            "type": "snapshot",
+            "status": challenge['status'],
+            "creator": challenge['creator'],
+            "opponent": challenge['opponent'],
+            "questions": challenge['questions'],
+            "progress": answer_progress(challenge),
+        }
+        if is_finished(challenge):
+            snapshot["result"] = compute_result(challenge)
+        await websocket.send_text(json.dumps(snapshot, default=str))
+
+        async def forward():
+            while True:
+                await websocket.send_text(await queue.get())
+
+        def reply_error(detail):
+            # Replies go through the queue so only the sender task writes to the socket
+            offer(queue, json.dumps({"type": "error", "detail": detail}))
+
+        sender = asyncio.create_task(forward())
+        try:
+            while True:
+                try:
+                    message = json.loads(await websocket.receive_text())
+                except (json.JSONDecodeError, KeyError):
+                    # KeyError: a binary frame has no text
+                    reply_error("Messages must be JSON text")
+                    continue
+                if not isinstance(message, dict):
+                    reply_error("Messages must be JSON objects")
+                    continue
+                if message.get("type") not in ("answer", "answers"):
+                    continue
+                try:
+                    if message["type"] == "answer":
+                        items = [AnswerItem(questionIndex=message.get("questionIndex"), answer=message.get("answer"))]
+                    else:
+                        items = BatchAnswerSubmission(userId=userId, answers=message.get("answers") or []).answers
+                    answers = {item.questionIndex: item.answer for item in items}
+                    await record_answers(store, broker, challenge_id, userId, answers)
+                except (HTTPException, ValidationError) as e:
+                    reply_error(e.detail if isinstance(e, HTTPException) else str(e))
+                except Exception as e:
+                    # Keep the socket open; the player can send the answers again
+                    print(f"Error recording answers for {challenge_id}: {e}")
+                    reply_error("Answers could not be saved. Please send them again.")
+        except WebSocketDisconnect:
+            pass
+        finally:
+            sender.cancel()
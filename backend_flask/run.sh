@@ -1,2 +1 @@
-/opt/aanya/venv/bin/python3 /opt/AannyaApps/AanyaAPI/backend_flask/app2.py
-
+/opt/aanya/venv/bin/python3 /opt/AannyaApps/AanyaAPI/backend_flask/serve.py
@@ -1 +1 @@
-nohup /opt/aanya/venv/bin/python3 /opt/AannyaApps/AanyaAPI/backend_flask/app2.py & > /home/eduailive/aanya.txt
+nohup /opt/aanya/venv/bin/python3 /opt/AannyaApps/AanyaAPI/backend_flask/serve.py > /home/eduailive/aanya.txt 2>&1 &
@@ -0,0 +1,109 @@
+"""Round trips and latency of the signup and OTP verification writes.
+
+Runs the previous multi-step flows next to the single-operation ones from
+routes/v2/Auth_routes.py, against a scratch collection on MONGO_URI (dropped
+afterwards). A pymongo command listener counts the commands each call sends.
+
+    python scripts/bench_auth.py --users 500
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv  # noqa: E402
+from pymongo import MongoClient, monitoring  # noqa: E402
+
+from database import db  # noqa: E402
+from routes.v2.Auth_routes import consume_otp, insert_user  # noqa: E402
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name not in ("endSessions", "ping", "hello", "isMaster"):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def new_user(email):
+    return {"userId": str(uuid.uuid4()), "fullName": "Bench User", "email": email, "password": "x",
+            "role": "student", "handle": "bench", "is_verified": False, "otp": "123456",
+            "otp_expiry": datetime.utcnow() + timedelta(minutes=15), "createdAt": datetime.utcnow()}
+
+
+def signup_before(collection, user):
+    if collection.find_one({"email": user["email"]}):
+        return False
+    collection.insert_one(user)
+    return True
+
+
+def verify_before(collection, email, otp):
+    user = collection.find_one({"email": email})
+    if not user or user["otp"] != otp or datetime.utcnow() > user["otp_expiry"]:
+        return None
+    collection.update_one({"email": email}, {"$set": {"is_verified": True, "otp": None, "otp_expiry": None,
+                                                      "updated_at": datetime.utcnow()}})
+    return collection.find_one({"email": email})
+
+
+def measure(name, counter, calls):
+    latencies, trips = [], []
+    for call in calls:
+        before = counter.count
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+        trips.append(counter.count - before)
+    print(f"{name:18s} round trips/call {sum(trips) / len(trips):.1f}  "
+          f"p50 {percentile(latencies, 50) * 1000:6.2f} ms  p99 {percentile(latencies, 99) * 1000:6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--db", default="new_Annya_bench")
+    args = parser.parse_args()
+
+    load_dotenv()
+    counter = CommandCounter()
+    client = MongoClient(os.getenv("MONGO_URI"), event_listeners=[counter], tlsAllowInvalidCertificates=True)
+    collection = client[args.db]["users_bench"]
+    collection.drop()
+    collection.create_index("email", unique=True)
+    db.new_users_collection = collection
+    try:
+        emails = [f"before{i}@bench.test" for i in range(args.users)]
+        measure("signup (before)", counter, [lambda e=e: signup_before(collection, new_user(e)) for e in emails])
+        measure("verify (before)", counter, [lambda e=e: verify_before(collection, e, "123456") for e in emails])
+
+        emails = [f"after{i}@bench.test" for i in range(args.users)]
+        measure("signup (after)", counter, [lambda e=e: insert_user(new_user(e)) for e in emails])
+        measure("verify (after)", counter, [lambda e=e: consume_otp(e, "123456") for e in emails])
+        measure("signup duplicate", counter, [lambda e=e: insert_user(new_user(e)) for e in emails[:50]])
+    finally:
+        collection.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Login storm benchmark for the password hasher, to pick BCRYPT_ROUNDS.
+
+Logins arrive as a Poisson process at ``--rate`` per second and each one runs
+the same ``PasswordHasher.verify`` the login route awaits. The script reports
+login latency percentiles per bcrypt cost, the sustained throughput, and the
+worst event loop stall seen meanwhile. That stall should stay near zero,
+because hashing runs on the pool. Costs whose p99 fits in ``--budget-ms`` are
+marked.
+
+    python scripts/bench_login.py --rounds 10,11,12,13 --rate 50 --logins 500 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.PasswordHasher import PasswordHasher  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def watch_loop(stalls, interval=0.01):
+    """Records how late a periodic tick fires, i.e. how long the loop was blocked."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def storm(rounds, args):
+    hasher = PasswordHasher(rounds=rounds, workers=args.workers)
+    stored = await hasher.hash("correct horse battery staple")
+    rng = random.Random(args.seed)
+    latencies, stalls = [], []
+
+    async def login():
+        started = time.perf_counter()
+        matches, _ = await hasher.verify("correct horse battery staple", stored)
+        assert matches
+        latencies.append(time.perf_counter() - started)
+
+    watcher = asyncio.create_task(watch_loop(stalls))
+    started = time.perf_counter()
+    logins = []
+    for _ in range(args.logins):
+        await asyncio.sleep(rng.expovariate(args.rate))
+        logins.append(asyncio.create_task(login()))
+    await asyncio.gather(*logins)
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    hasher.shutdown()
+    return latencies, elapsed, max(stalls, default=0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", default="10,11,12,13", help="comma separated bcrypt costs")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50, help="login arrivals per second")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--budget-ms", type=float, default=500, help="p99 login latency budget")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins at {args.rate:.0f}/s on {args.workers} hashing threads")
+    for rounds in (int(r) for r in args.rounds.split(",")):
+        latencies, elapsed, stall = asyncio.run(storm(rounds, args))
+        p99 = percentile(latencies, 99) * 1000
+        print(f"cost {rounds:2d}: p50 {percentile(latencies, 50) * 1000:7.1f} ms  p99 {p99:7.1f} ms  "
+              f"{len(latencies) / elapsed:6.1f} logins/s  max loop stall {stall * 1000:.1f} ms"
+              f"{'  within budget' if p99 <= args.budget_ms else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Simulates random-opponent matchmaking and reports match latency percentiles.
+
+Players arrive as a Poisson process and pick a (subject, topic, level) bucket
+with a skewed popularity, as real traffic does. The simulation runs on a
+virtual clock with the same sweep interval as the server, so it finishes in
+seconds. Also reports the real time per enqueue and the peak memory held.
+
+    python scripts/bench_matchmaking.py --players 50000 --rate 200 --buckets 60
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.Matchmaker import LEVELS, Matchmaker  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=50000)
+    parser.add_argument("--rate", type=float, default=200, help="arrivals per second")
+    parser.add_argument("--buckets", type=int, default=60, help="distinct (subject, topic) pairs")
+    parser.add_argument("--widen-after", type=float, default=10)
+    parser.add_argument("--ticket-ttl", type=float, default=120)
+    parser.add_argument("--sweep-interval", type=float, default=1)
+    parser.add_argument("--max-waiting", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    topics = [(f"subject{i % 6}", f"topic{i}") for i in range(args.buckets)]
+    weights = [1 / (rank + 1) for rank in range(len(topics))]  # Zipf-like popularity
+
+    matchmaker = Matchmaker(widen_after=args.widen_after, ticket_ttl=args.ticket_ttl, max_waiting=args.max_waiting)
+    waits, cross_level, expired, rejected, peak_waiting = [], 0, 0, 0, 0
+    enqueue_time = 0.0
+
+    tracemalloc.start()
+    now, next_sweep = 0.0, args.sweep_interval
+    for n in range(args.players):
+        now += rng.expovariate(args.rate)
+        while next_sweep <= now:
+            matches, gone = matchmaker.sweep(next_sweep)
+            waits.extend(m.waited for m in matches)
+            cross_level += sum(m.first.key != m.second.key for m in matches)
+            expired += len(gone)
+            next_sweep += args.sweep_interval
+
+        subject, topic = rng.choices(topics, weights)[0]
+        started = time.perf_counter()
+        try:
+            match = matchmaker.enqueue(f"user{n}", subject, topic, rng.choice(LEVELS), now)
+        except OverflowError:
+            rejected += 1
+            continue
+        finally:
+            enqueue_time += time.perf_counter() - started
+        if match:
+            waits.append(match.waited)
+            cross_level += match.first.key != match.second.key
+        peak_waiting = max(peak_waiting, len(matchmaker))
+
+    # Let the remaining tickets widen or expire
+    end = now + args.ticket_ttl
+    while next_sweep <= end:
+        matches, gone = matchmaker.sweep(next_sweep)
+        waits.extend(m.waited for m in matches)
+        cross_level += sum(m.first.key != m.second.key for m in matches)
+        expired += len(gone)
+        next_sweep += args.sweep_interval
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    matched_players = 2 * len(waits)
+    print(f"players {args.players}  rate {args.rate:.0f}/s  buckets {args.buckets}x{len(LEVELS)} levels")
+    print(f"matched {matched_players} ({matched_players / args.players:.1%}), cross-level matches {cross_level}, "
+          f"expired {expired}, rejected {rejected}")
+    print("wait of the earlier player (s): " + "  ".join(
+        f"p{p} {percentile(waits, p):.2f}" for p in (50, 90, 95, 99)) + f"  max {max(waits, default=0):.2f}")
+    print(f"enqueue {enqueue_time / args.players * 1e6:.2f} us/op, peak waiting {peak_waiting}, "
+          f"peak traced memory {peak_bytes / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
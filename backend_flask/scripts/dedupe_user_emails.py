@@ -0,0 +1,61 @@
+"""One-off cleanup so the unique index on users.email can be built.
+
+Finds emails shared by several accounts in new_Annya.users and keeps one of
+them: a verified account before an unverified one, then the oldest. The other
+accounts are copied to new_Annya.users_duplicates (with ``duplicateOf`` set to
+the kept ``_id``) and removed from users. Without ``--apply`` it only reports
+what it would do.
+
+    python scripts/dedupe_user_emails.py            # dry run
+    python scripts/dedupe_user_emails.py --apply    # archive duplicates, build the index
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db  # noqa: E402
+
+
+def keep_order(user):
+    # Verified first, then the oldest account; _id breaks ties and covers rows without createdAt
+    return (not user.get("is_verified"), user.get("createdAt") or datetime.max, user["_id"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apply", action="store_true", help="archive duplicates and create the index")
+    args = parser.parse_args()
+
+    db.init_db()
+    users = db.new_users_collection
+    archive = db.new_annya_db["users_duplicates"]
+    groups = users.aggregate([
+        {"$match": {"email": {"$type": "string"}}},
+        {"$group": {"_id": "$email", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+
+    emails = removed = 0
+    for group in groups:
+        accounts = sorted(users.find({"_id": {"$in": group["ids"]}}), key=keep_order)
+        kept, duplicates = accounts[0], accounts[1:]
+        emails += 1
+        removed += len(duplicates)
+        print(f"{group['_id']}: keeping {kept['_id']}, archiving {[user['_id'] for user in duplicates]}")
+        if args.apply:
+            now = datetime.utcnow()
+            archive.insert_many([{**user, "duplicateOf": kept["_id"], "archivedAt": now} for user in duplicates])
+            users.delete_many({"_id": {"$in": [user["_id"] for user in duplicates]}})
+
+    print(f"{emails} emails with duplicates, {removed} accounts {'archived' if args.apply else 'to archive'}")
+    if args.apply:
+        users.create_index("email", unique=True)
+        print("Unique index on users.email created")
+    db.close_db()
+
+
+if __name__ == "__main__":
+    main()
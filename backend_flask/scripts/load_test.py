@@ -0,0 +1,140 @@
+"""HTTP load test for the serving entry point, with worker scaling.
+
+Without ``--workers`` it drives an already running server. With
+``--workers 1,2,4`` it starts ``serve.py`` once per worker count on a spare
+port, runs the same load against each and reports throughput relative to a
+single worker, so near-linear scaling (efficiency close to 1.0) can be checked.
+Load is generated from several client processes; leave enough cores for them.
+
+    python scripts/load_test.py --url http://127.0.0.1:5000/ --concurrency 64 --duration 10
+    python scripts/load_test.py --workers 1,2,4 --path / --duration 10
+"""
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(url, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def user():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def load_process(url, concurrency, duration):
+    return asyncio.run(run_load(url, concurrency, duration))
+
+
+def measure(url, concurrency, duration, client_processes):
+    """Runs the load from ``client_processes`` processes so the client is not the bottleneck."""
+    per_process = max(1, concurrency // client_processes)
+    with ProcessPoolExecutor(max_workers=client_processes) as pool:
+        runs = list(pool.map(load_process, *zip(*[(url, per_process, duration)] * client_processes)))
+
+    latencies = [latency for run in runs for latency in run[0]]
+    errors = sum(run[1] for run in runs)
+    elapsed = max(run[2] for run in runs)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def report(label, stats):
+    print(f"{label:>10}  {stats['rps']:9.1f} req/s  p50 {stats['p50_ms']:7.1f} ms  "
+          f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms  "
+          f"errors {stats['errors']}/{stats['requests']}")
+
+
+async def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    raise SystemExit(f"Server at {url} did not come up within {timeout}s")
+
+
+async def scale(args):
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(",")]:
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--port", str(args.port),
+             "--host", "127.0.0.1", "--no-access-log", "--log-level", "warning"],
+            cwd=APP_DIR,
+        )
+        url = f"http://127.0.0.1:{args.port}{args.path}"
+        try:
+            await wait_until_up(url)
+            await run_load(url, args.concurrency, min(2, args.duration))  # warm-up
+            stats = await asyncio.to_thread(measure, url, args.concurrency, args.duration, args.client_processes)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        baseline = baseline or stats["rps"]
+        report(f"{workers} worker", stats)
+        print(f"{'':>10}  speedup {stats['rps'] / baseline:.2f}x, efficiency {stats['rps'] / baseline / workers:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000/")
+    parser.add_argument("--workers", help="comma-separated worker counts to start and compare, e.g. 1,2,4")
+    parser.add_argument("--port", type=int, default=5055, help="port for servers started with --workers")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--client-processes", type=int, default=max(1, (os.cpu_count() or 1) // 2))
+    args = parser.parse_args()
+
+    if args.workers:
+        asyncio.run(scale(args))
+    else:
+        report("server", measure(args.url, args.concurrency, args.duration, args.client_processes))
+
+
+if __name__ == "__main__":
+    main()
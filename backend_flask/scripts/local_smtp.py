@@ -0,0 +1,103 @@
+"""Local SMTP stand-in for developing and testing the email outbox.
+
+Accepts any login and every message, and writes each message to
+``--maildir`` as a ``.eml`` file. It also prints the sender and recipients.
+Point the app at it with plain SMTP:
+
+    python scripts/local_smtp.py --port 2525 --maildir /tmp/outbox
+    MAIL_SERVER=127.0.0.1 MAIL_PORT=2525 MAIL_USE_TLS=False MAIL_USERNAME= python serve.py
+
+``--fail-every N`` answers every Nth message with a temporary 451 error, to
+exercise the outbox retries.
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import os
+import time
+
+counter = itertools.count(1)
+
+
+async def session(reader, writer, args):
+    async def reply(line):
+        writer.write(f"{line}\r\n".encode())
+        await writer.drain()
+
+    await reply("220 local-smtp ready")
+    sender, recipients = None, []
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line.decode(errors="replace").strip()
+        verb = command.split(" ", 1)[0].upper()
+
+        if verb in ("EHLO", "HELO"):
+            if verb == "EHLO":
+                writer.write(b"250-local-smtp\r\n250-AUTH PLAIN LOGIN\r\n")
+            await reply("250 OK")
+        elif verb == "AUTH":
+            parts = command.split()
+            if parts[1].upper() == "LOGIN":
+                for prompt in ("VXNlcm5hbWU6", "UGFzc3dvcmQ6"):  # "Username:", "Password:"
+                    await reply(f"334 {prompt}")
+                    await reader.readline()
+            elif len(parts) < 3:
+                await reply("334 ")
+                await reader.readline()
+            await reply("235 Authentication successful")
+        elif verb == "MAIL":
+            sender, recipients = command.split(":", 1)[1].strip(), []
+            await reply("250 OK")
+        elif verb == "RCPT":
+            recipients.append(command.split(":", 1)[1].strip())
+            await reply("250 OK")
+        elif verb == "DATA":
+            await reply("354 End data with <CR><LF>.<CR><LF>")
+            lines = []
+            while True:
+                data = await reader.readline()
+                if data in (b".\r\n", b".\n", b""):
+                    break
+                lines.append(data[1:] if data.startswith(b"..") else data)
+            n = next(counter)
+            if args.fail_every and n % args.fail_every == 0:
+                await reply("451 Temporary failure, try again later")
+                continue
+            path = os.path.join(args.maildir, f"{time.time():.6f}-{n}.eml")
+            with open(path, "wb") as f:
+                f.writelines(lines)
+            print(f"message {n} from {sender} to {', '.join(recipients)} -> {path}")
+            await reply("250 OK: queued")
+        elif verb == "RSET":
+            sender, recipients = None, []
+            await reply("250 OK")
+        elif verb == "NOOP":
+            await reply("250 OK")
+        elif verb == "QUIT":
+            await reply("221 Bye")
+            break
+        else:
+            await reply("502 Command not implemented")
+    writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--maildir", default="/tmp/local_smtp")
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.maildir, exist_ok=True)
+
+    server = await asyncio.start_server(lambda r, w: session(r, w, args), args.host, args.port)
+    print(f"local SMTP on {args.host}:{args.port}, writing to {args.maildir}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
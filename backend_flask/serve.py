@@ -0,0 +1,104 @@
+"""Production entry point for the FastAPI app.
+
+Runs ``app2:app`` under uvicorn with several worker processes. Each worker
+opens its own database clients, job runners and process pool in the app
+lifespan. On SIGTERM uvicorn stops accepting connections, lets in-flight
+requests and streams finish for up to ``--graceful-timeout`` seconds, then
+runs the lifespan shutdown.
+
+    python serve.py --workers 4 --port 5000
+    python serve.py --reload          # development, single process
+    HOST=0.0.0.0 python serve.py      # listen on every interface
+
+It listens on 127.0.0.1 unless HOST or ``--host`` says otherwise. Every
+option can also be set from the environment (WEB_WORKERS, PORT, ...).
+
+Play-with-Friend state (challenges, events, matchmaking, rooms) is shared
+through Mongo by default. When any of it is switched to a ``memory`` backend
+it only exists in one process, so the server then runs a single worker.
+"""
+import argparse
+import importlib.util
+import os
+
+import uvicorn
+
+
+# Backends whose ``memory`` setting keeps state inside one worker process
+PER_PROCESS_BACKENDS = {
+    "CHALLENGE_STORE": ("CHALLENGE_STORE",),
+    "CHALLENGE_BROKER": ("CHALLENGE_BROKER", "CHALLENGE_STORE"),
+    "MATCHMAKER": ("MATCHMAKER", "CHALLENGE_STORE"),
+    "ROOM_STORE": ("ROOM_STORE", "CHALLENGE_STORE"),
+}
+
+
+def default_workers() -> int:
+    return int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+
+
+def in_memory_backends():
+    """Settings that resolve to ``memory``, following the same fallbacks as the routes."""
+    selected = []
+    for name, lookup in PER_PROCESS_BACKENDS.items():
+        value = next((os.environ[var] for var in lookup if os.getenv(var)), "mongo")
+        if value.lower() == "memory":
+            selected.append(name)
+    return selected
+
+
+def pick(module: str, preferred: str, fallback: str) -> str:
+    """Uses the faster implementation when its package is installed."""
+    return preferred if importlib.util.find_spec(module) else fallback
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KEEP_ALIVE_SECONDS", "5")),
+                        help="seconds an idle keep-alive connection is held open")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT_SECONDS", "30")),
+                        help="seconds in-flight requests and streams get to finish on shutdown")
+    parser.add_argument("--limit-concurrency", type=int, default=int(os.getenv("LIMIT_CONCURRENCY", "0")) or None,
+                        help="per-worker connection cap; excess requests get 503")
+    parser.add_argument("--backlog", type=int, default=int(os.getenv("SOCKET_BACKLOG", "2048")))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--no-access-log", action="store_true", default=os.getenv("ACCESS_LOG") == "False")
+    parser.add_argument("--reload", action="store_true", help="development mode: one process, restart on changes")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = 1 if args.reload else max(1, args.workers)
+    memory = in_memory_backends()
+    if memory and workers > 1:
+        print(f"{', '.join(memory)} set to memory: state is per process, running 1 worker instead of {workers}")
+        workers = 1
+
+    # Split the CPU-bound process pool between web workers instead of giving each a full one
+    os.environ.setdefault("PROCESS_POOL_WORKERS", str(max(1, (os.cpu_count() or 1) // workers)))
+
+    uvicorn.run(
+        "app2:app",
+        host=args.host,
+        port=args.port,
+        workers=None if args.reload else workers,
+        reload=args.reload,
+        loop=pick("uvloop", "uvloop", "asyncio"),
+        http=pick("httptools", "httptools", "h11"),
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_concurrency=args.limit_concurrency,
+        backlog=args.backlog,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        log_level=args.log_level,
+        access_log=not args.no_access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()